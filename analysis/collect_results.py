@@ -44,6 +44,12 @@ import pandas as pd
 import json
 from collections import defaultdict
 
+from results_store import ResultsStore
+
+# If set, results are read from this results store (see results_store.py) instead of the outputs tree
+RESULTS_DB = os.environ.get("RESULTS_DB")
+OUTPUTS_DIR = "/export/b08/nbafna1/projects/llm-robustness-to-xlingual-noise/outputs"
+
 def task_to_metric(task_name):
 
     if "flores200" in task_name:
@@ -86,18 +92,22 @@ def get_metric_from_results_file(results, task_name):
     return round(val, 2)
 
 
-def get_results(param_set, folder_name_expr, task_name):
+def get_results(param_set, folder_name_expr, task_name, store = None):
     '''Get results from experiment output files
     Args:
         param_set: str, parameter set
         folder_name_expr: str, folder name expression, with <placeholder> for param value
         task_name: str, task name
+        store: ResultsStore, if given, read results from the store instead of the files
     Returns:
         pd.DataFrame, results
     '''
     all_results = dict()
     for param_value in param_set:
         folder_name = folder_name_expr.replace("<placeholder>", param_value)
+        if store is not None:
+            all_results[param_value] = store.get_metric(folder_name, task_name)
+            continue
         if not os.path.exists(folder_name):
             print(f"Folder {folder_name} does not exist")
             all_results[param_value] = -1
@@ -114,14 +124,17 @@ def get_results(param_set, folder_name_expr, task_name):
     print(all_results)
     return pd.DataFrame(all_results, index=[0])
 
-def get_results_from_folder(folder_name, task_name):
+def get_results_from_folder(folder_name, task_name, store = None):
     '''Get results from experiment output files
     Args:
         folder_name: str, folder name expression, with <placeholder> for param value
         task_name: str, task name
+        store: ResultsStore, if given, read results from the store instead of the files
     Returns:
         pd.DataFrame, results
     '''
+    if store is not None:
+        return store.get_metric(folder_name, task_name)
     result = -1
     for file in os.listdir(folder_name):
         if task_name in file:
@@ -158,6 +171,11 @@ def pretty_print_baseline(results, langs, tasks):
 
 
 if __name__ == "__main__":
+    store = None
+    if RESULTS_DB:
+        store = ResultsStore(RESULTS_DB)
+        store.refresh(OUTPUTS_DIR)
+
     param_set = ["0", "0.05", "0.1", "0.2", "0.3", "0.5", "0.8"]
     # param_set = ["0.05", "0.1", "0.2", "0.3", "0.5", "0.8"]
     # param_set = [str(i) for i in range(0, 10)]
@@ -237,7 +255,7 @@ if __name__ == "__main__":
                 # folder_name_expr = f"/export/b08/nbafna1/projects/llm-robustness-to-xlingual-noise/outputs/results/bloomz7b/{lang}/phonological-lang={lang},theta_phon=<placeholder>~limit-300"
                 
                 print(f"LANG: {lang}, TASK: {task}, RUN: {run}")
-                results = get_results(param_set, folder_name_expr, task)
+                results = get_results(param_set, folder_name_expr, task, store = store)
                 print(results)
                 all_runs_results[run] = {param_value: results[param_value][0] for param_value in param_set}
             
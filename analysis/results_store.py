@@ -0,0 +1,218 @@
+'''
+Indexed store of experiment results.
+
+Collecting a table with collect_results.get_results means listing one folder per parameter value
+and opening every results file in it, which is slow over NFS when there are thousands of them.
+Instead, we scan an outputs tree once, and ingest every results JSON into a single SQLite
+database:
+    files: one row per results file, with its mtime and size, so that a refresh only
+        re-ingests new or modified files
+    results: one row per (file, experiment key, task, metric) with the metric value
+    params: one row per (file, experiment key, noise type, parameter), parsed from the
+        experiment key (the noise parameter string), e.g.
+        lexical-lang=hi,theta_content_global=0.05,theta_func_global=0.8
+Collection and plotting scripts then query the database.
+
+Usage:
+    store = ResultsStore("results.db")
+    store.refresh("/path/to/outputs/results")
+    store.get_metric(folder_name, "xnli_mcq_hi")
+'''
+import os
+import re
+import json
+import sqlite3
+import pandas as pd
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_folder ON files (folder);
+CREATE TABLE IF NOT EXISTS results (
+    path TEXT NOT NULL,
+    exp_key TEXT NOT NULL,
+    task TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value REAL
+);
+CREATE INDEX IF NOT EXISTS results_path ON results (path);
+CREATE TABLE IF NOT EXISTS params (
+    path TEXT NOT NULL,
+    exp_key TEXT NOT NULL,
+    noise_type TEXT NOT NULL,
+    param TEXT NOT NULL,
+    value TEXT,
+    value_num REAL
+);
+CREATE INDEX IF NOT EXISTS params_path ON params (path);
+'''
+
+
+def parse_exp_key(exp_key):
+    '''Parse an experiment key into noise parameters, in the same way as
+    noisers/main.py parse_noise_params. Values enclosed in <> (file paths) are kept as is.
+    Args:
+        exp_key: str, noise parameter string, e.g. phonological-lang=hi,theta_phon=0.1;morph-...
+    Returns:
+        list, list of (noise_type, param, value, value_num), value_num is None for non-numeric values
+    '''
+    params = list()
+    if not exp_key:
+        return params
+    # File paths may contain "-", "," and "=", so we take them out first
+    enclosed = re.findall(r'<(.*?)>', exp_key)
+    exp_key = re.sub(r'<(.*?)>', "<placeholder>", exp_key)
+    for noise_type_params in exp_key.split(";"):
+        if "-" not in noise_type_params:
+            continue
+        noise_type, noise_type_params = noise_type_params.split("-", 1)
+        for noise_param in noise_type_params.split(","):
+            if "=" not in noise_param:
+                continue
+            param, value = noise_param.split("=", 1)
+            if value == "<placeholder>":
+                value = enclosed.pop(0)
+            try:
+                value_num = float(value)
+            except ValueError:
+                value_num = None
+            params.append((noise_type, param, value, value_num))
+    return params
+
+
+class ResultsStore:
+
+    def __init__(self, db_path):
+        '''Open (or create) a results store
+        Args:
+            db_path: str, path to SQLite database file
+        '''
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def _remove_file(self, path):
+        for table in ["files", "results", "params"]:
+            self.conn.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+
+    def _ingest_file(self, path, stat):
+        '''Ingest one results file. Files that are not valid results JSON are still recorded,
+        so that they are not read again until they change.'''
+        self._remove_file(path)
+        self.conn.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?)", \
+                          (path, os.path.dirname(path), os.path.basename(path), stat.st_mtime_ns, stat.st_size))
+        try:
+            with open(path, "r") as f:
+                results = json.load(f)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"WARNING: Could not read results file {path}: {e}")
+            return
+        if not isinstance(results, dict):
+            return
+
+        for exp_key, exp_results in results.items():
+            if not isinstance(exp_results, dict):
+                continue
+            for task, task_results in exp_results.get("results", dict()).items():
+                for metric, value in task_results.items():
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        continue
+                    self.conn.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?)", (path, exp_key, task, metric, value))
+            for noise_type, param, value, value_num in parse_exp_key(exp_key):
+                self.conn.execute("INSERT INTO params VALUES (?, ?, ?, ?, ?, ?)", \
+                                  (path, exp_key, noise_type, param, value, value_num))
+
+    def refresh(self, outputs_dir):
+        '''Scan an outputs tree, and ingest all results files that are new or modified since the
+        last refresh. Files that no longer exist are removed from the store.
+        Args:
+            outputs_dir: str, root of the outputs tree
+        Returns:
+            num_ingested: int, number of files (re-)ingested
+            num_removed: int, number of files removed
+        '''
+        outputs_dir = os.path.abspath(outputs_dir)
+        known = {path: (mtime_ns, size) for path, mtime_ns, size in \
+                 self.conn.execute("SELECT path, mtime_ns, size FROM files WHERE substr(path, 1, length(?)) = ?", \
+                                   (outputs_dir + os.sep, outputs_dir + os.sep))}
+
+        num_ingested = 0
+        seen = set()
+        for folder, _, file_names in os.walk(outputs_dir):
+            for file_name in file_names:
+                if not file_name.endswith(".json"):
+                    continue
+                path = os.path.join(folder, file_name)
+                stat = os.stat(path)
+                seen.add(path)
+                if known.get(path) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                self._ingest_file(path, stat)
+                num_ingested += 1
+
+        removed = [path for path in known if path not in seen]
+        for path in removed:
+            self._remove_file(path)
+        self.conn.commit()
+        print(f"Results store {self.db_path}: ingested {num_ingested} files, removed {len(removed)} files")
+        return num_ingested, len(removed)
+
+    def query(self, sql, params = ()):
+        '''Run a SQL query against the store
+        Returns:
+            pd.DataFrame, query results
+        '''
+        return pd.read_sql_query(sql, self.conn, params=params)
+
+    def get_metric(self, folder_name, task_name):
+        '''Get the metric of a task from the results in a folder, like
+        collect_results.get_metric_from_results_file does for the files in the folder
+        whose name contains task_name
+        Args:
+            folder_name: str, experiment folder
+            task_name: str, task name
+        Returns:
+            float, metric value, or -1 if there are no results
+        '''
+        # Imported here, since collect_results imports this module
+        from collect_results import task_to_metric
+
+        if "xnli" in task_name and "mcq" not in task_name:
+            return -1
+        metric = task_to_metric(task_name)
+        folder_name = os.path.abspath(folder_name).rstrip(os.sep)
+        # If several files match, we take the last one by name
+        row = self.conn.execute('''
+            SELECT results.value FROM files JOIN results ON files.path = results.path
+            WHERE files.folder = ? AND instr(files.file_name, ?) > 0 AND results.metric = ?
+            ORDER BY files.file_name DESC LIMIT 1''', (folder_name, task_name, metric)).fetchone()
+        if row is None:
+            return -1
+        val = row[0]
+        if metric in ["acc", "mc2"] and val <= 1:
+            val = val * 100
+        return round(val, 2)
+
+    def load_table(self):
+        '''Load all results as one table, with one column per noise parameter
+        Returns:
+            pd.DataFrame, columns: path, folder, exp_key, task, metric, value, and <noise_type>.<param>
+        '''
+        results = self.query('''
+            SELECT results.path, files.folder, results.exp_key, results.task, results.metric, results.value
+            FROM results JOIN files ON files.path = results.path''')
+        params = self.query("SELECT path, exp_key, noise_type, param, value FROM params")
+        if len(params) == 0:
+            return results
+        params["column"] = params["noise_type"] + "." + params["param"]
+        params = params.pivot_table(index=["path", "exp_key"], columns="column", values="value", aggfunc="first").reset_index()
+        params.columns.name = None
+        return results.merge(params, on=["path", "exp_key"], how="left")
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The analysis scripts import each other as top-level modules (e.g. from collect_results import
+# task_to_metric), like they do when run from analysis/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,97 @@
+import os
+import json
+
+import pytest
+
+from results_store import ResultsStore, parse_exp_key
+
+
+def write_results(path, exp_key, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({exp_key: {"results": {"xnli_mcq_hi": {"acc": value, "acc_stderr": 0.01}}}}, f)
+
+
+def file_paths(store):
+    return sorted(path for path, in store.conn.execute("SELECT path FROM files"))
+
+
+def test_parse_exp_key():
+    assert parse_exp_key("") == []
+    assert parse_exp_key("lexical-lang=hi,theta_content_global=0.05;morph-theta_morph_global=1") == [
+        ("lexical", "lang", "hi", None),
+        ("lexical", "theta_content_global", "0.05", 0.05),
+        ("morph", "theta_morph_global", "1", 1.0),
+    ]
+
+
+def test_parse_exp_key_paths():
+    # Paths contain the separators of the key ("-", ",", "=" and ";")
+    exp_key = "phonological-text_file=<data/hi-en/a=1,b;c.txt>,theta_phon=0.1;" \
+              "lexical-text_file=<x-y.txt>,lang=hi"
+    assert parse_exp_key(exp_key) == [
+        ("phonological", "text_file", "data/hi-en/a=1,b;c.txt", None),
+        ("phonological", "theta_phon", "0.1", 0.1),
+        ("lexical", "text_file", "x-y.txt", None),
+        ("lexical", "lang", "hi", None),
+    ]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    yield store
+    store.close()
+
+
+def test_refresh(store, tmp_path):
+    outputs_dir = tmp_path / "outputs"
+    first = str(outputs_dir / "exp1" / "xnli_mcq_hi.json")
+    second = str(outputs_dir / "exp2" / "nested" / "xnli_mcq_hi.json")
+    write_results(first, "lexical-theta_content_global=0.1", 0.5)
+    write_results(second, "lexical-theta_content_global=0.2", 0.6)
+    (outputs_dir / "exp1" / "notes.txt").write_text("not a results file")
+
+    assert store.refresh(str(outputs_dir)) == (2, 0)
+    assert file_paths(store) == [first, second]
+    # Nothing changed
+    assert store.refresh(str(outputs_dir)) == (0, 0)
+
+    # A modified file replaces its old rows
+    write_results(first, "lexical-theta_content_global=0.1", 0.75)
+    stat = os.stat(first)
+    os.utime(first, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert store.refresh(str(outputs_dir)) == (1, 0)
+    values = store.conn.execute("SELECT value FROM results WHERE path = ? AND metric = 'acc'", (first,)).fetchall()
+    assert values == [(0.75,)]
+    assert store.conn.execute("SELECT COUNT(*) FROM params WHERE path = ?", (first,)).fetchone() == (1,)
+
+    # A deleted file is removed from all tables
+    os.remove(second)
+    assert store.refresh(str(outputs_dir)) == (0, 1)
+    assert file_paths(store) == [first]
+    for table in ["results", "params"]:
+        assert store.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE path = ?", (second,)).fetchone() == (0,)
+
+
+def test_refresh_keeps_other_trees(store, tmp_path):
+    # Refreshing one tree does not remove the files of another tree, or of a sibling
+    # directory whose name starts with the same prefix
+    results = str(tmp_path / "results" / "exp" / "xnli_mcq_hi.json")
+    results_old = str(tmp_path / "results_old" / "exp" / "xnli_mcq_hi.json")
+    write_results(results, "lexical-theta_content_global=0.1", 0.5)
+    write_results(results_old, "lexical-theta_content_global=0.1", 0.4)
+    store.refresh(str(tmp_path / "results_old"))
+
+    assert store.refresh(str(tmp_path / "results")) == (1, 0)
+    assert file_paths(store) == [results, results_old]
+
+
+def test_refresh_invalid_json(store, tmp_path):
+    # Invalid files are recorded, and not read again until they change
+    path = tmp_path / "outputs" / "exp" / "broken.json"
+    path.parent.mkdir(parents=True)
+    path.write_text("{not json")
+    assert store.refresh(str(tmp_path / "outputs")) == (1, 0)
+    assert store.refresh(str(tmp_path / "outputs")) == (0, 0)
+    assert store.conn.execute("SELECT COUNT(*) FROM results").fetchone() == (0,)
@@ -0,0 +1,2 @@
+# noisers/test_noise.py is a script that noises files on the cluster, not a test module
+collect_ignore = ["noisers/test_noise.py"]
@@ -1,5 +1,6 @@
 from noise import Noise
 import random
+import numpy as np
 import os, sys
 from utils.misc import get_character_set, normalize_lang_codes
 
@@ -7,6 +8,7 @@ class CharacterLevelNoiser(Noise):
     '''
     Noise type: switch out random characters with other characters
     Required params: script, insert_theta, delete_theta, swap_theta
+    Allowed params: vectorized (default: 1)
     Input format: {script: latin, insert_theta: 0.1, delete_theta: 0.1, swap_theta: 0.1}
     '''
     def __init__(self, noise_params):
@@ -17,6 +19,7 @@ class CharacterLevelNoiser(Noise):
         self.class_name = "CharacterLevelNoiser"
         self.required_keys = {"lang", "swap_theta"}
         # self.required_keys = {"lang", "insert_theta", "delete_theta", "swap_theta"}
+        self.allowed_keys = {"vectorized"}
         self.check_noise_params(noise_params)
 
         
@@ -27,7 +30,22 @@ class CharacterLevelNoiser(Noise):
 
         # Initialize character set according to lang
         script, self.character_set = get_character_set(self.lang)
-    
+
+        # Vectorized mode draws from np.random instead of random (default: on)
+        self.vectorized = bool(noise_params.get("vectorized", True))
+        self.compile_alternatives_table()
+
+    def compile_alternatives_table(self):
+        '''Precompute, for the vectorized mode:
+            self.char_codes: np.array, sorted code points of the character set
+            self.alternatives: np.array, row i has the code points of all characters other than char_codes[i]
+        '''
+        self.char_codes = np.array(sorted(ord(char) for char in self.character_set), dtype=np.uint32)
+        num_chars = len(self.char_codes)
+        # Drop the diagonal of a (num_chars, num_chars) table of code points
+        others = ~np.eye(num_chars, dtype=bool)
+        self.alternatives = np.broadcast_to(self.char_codes, (num_chars, num_chars))[others].reshape(num_chars, num_chars - 1)
+
     def apply_noise(self, input):
         '''Apply noise to input
         Args:
@@ -35,6 +53,9 @@ class CharacterLevelNoiser(Noise):
         Returns:
             str, noised text
         '''
+        if self.vectorized:
+            return self.apply_noise_vectorized(input)
+
         # Apply noise
         # For each character, with probability swap_theta, 
         # swap it with another character from the same alphabet
@@ -52,6 +73,30 @@ class CharacterLevelNoiser(Noise):
                 noised_input += char
         return noised_input
 
+    def apply_noise_vectorized(self, input):
+        '''Apply noise to input, as in apply_noise, for all characters at once: we draw all swap
+        decisions with one call, and pick replacements from self.alternatives
+        Args:
+            input: str, input text
+        Returns:
+            str, noised text
+        '''
+        codes = np.frombuffer(input.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+        if len(codes) == 0:
+            return input
+        # Position of every character in the sorted character set, and whether it is in it
+        char_idxs = np.minimum(self.char_codes.searchsorted(codes), len(self.char_codes) - 1)
+        in_set = self.char_codes[char_idxs] == codes
+        swap = in_set & (np.random.random_sample(len(codes)) < self.swap_theta)
+        num_swaps = int(swap.sum())
+        if num_swaps == 0:
+            return input
+
+        noised_codes = codes.copy()
+        choices = np.random.randint(0, self.alternatives.shape[1], size=num_swaps)
+        noised_codes[swap] = self.alternatives[char_idxs[swap], choices]
+        return noised_codes.tobytes().decode("utf-32-le", "surrogatepass")
+
     
     def find_posterior(text1, text2):
         '''Find the posterior MLE estimate of self.noise_params given text1 and text2
@@ -2,22 +2,25 @@ from noise import Noise
 from phonological import GlobalPhonologicalNoiser
 import random
 from collections import defaultdict, Counter
+from functools import partial
 import numpy as np
 import json
 import sys
 import os
 
 from utils.misc import normalize_lang_codes, get_character_set
+from utils.chargram import CompiledCharGramModel
+from utils.corpus_stats import CorpusStats, TOKENS_PER_WORD, get_word_regex
+from utils.memo import WordMemo, DEFAULT_MEMO_SIZE
+from utils.rng import KeyedRandom, DEFAULT_SEED, key_hash, key_hashes, counter_uniforms, poisson_from_uniforms
 
 sys.path.append(os.getcwd())
 
 from utils.get_functional_words import OUTDIR, closed_class_tags
 from utils.get_functional_words import output_paths as ud_wordlists_paths
+from utils.get_functional_words import get_functional_word_index
 
-from scipy.stats import chisquare
-
-random.seed(42)
-np.random.seed(42)
+PUNCTUATION_AND_BAD_CHARS = "»«.,!?()[]{}\"'`:;'/\\-–—~_<>|@#$%^&*+=\u200b\u200c\u200d\u200e\u200f"
 
 class LexicalNoiser(Noise):
     '''
@@ -41,7 +44,7 @@ class LexicalNoiser(Noise):
     def get_vocab(text_file):
         '''Initialize vocabulary from vocab file'''
         print(f"Initializing vocabulary from {text_file}...")
-        vocab = defaultdict(lambda: 0)
+        vocab = defaultdict(int)
         for line in open(text_file):
             words = line.strip().split()
             for word in words:
@@ -66,7 +69,7 @@ class LexicalNoiser(Noise):
         print(f"Training chargram model with chargram length {chargram_length}...")
         chargram_models = dict() # contains chargram_models for all cgram lengths <= chargram_length
         for n in range(1, chargram_length + 1):
-            chargram_model = defaultdict(lambda: defaultdict(lambda: 0)) # {prefix: {suffix: count}}
+            chargram_model = defaultdict(partial(defaultdict, int)) # {prefix: {suffix: count}}
 
             for word in self.vocab:
                 word = "!" + word # Add start token
@@ -175,10 +178,18 @@ class GlobalLexicalNoiser(Noise):
     Input format: {param: value}
     '''
     
-    def __init__(self, noise_params):
+    deterministic = True
+    # The phonological noiser and chargram models are only needed to build the vocab map,
+    # so they are not part of snapshots
+    snapshot_maps = ["vocab_map", "vocab"]
+    uses_corpus_stats = True
+    sweep_params = {"theta_content_global", "theta_func_global"}
+
+    def __init__(self, noise_params, corpus_stats = None):
         '''Initialize noise with noise parameters
         Args:
             noise_params: dict, noise parameters, like {theta_1: 0.5}
+            corpus_stats: CorpusStats, statistics of text_file, if already computed
             Should contain:
                 text_file: str, txt file
                 theta_content_global: float, probability of switching out a content word with a non-word
@@ -186,10 +197,17 @@ class GlobalLexicalNoiser(Noise):
             Also accepts:
                 chargram_length: int, character n-gram length
                 output_dir: str, output directory
+                memo_size: int, maximum number of words to memoize in apply_noise
+                min_freq: int, only words that occur at least min_freq times are part of the vocabulary
+                max_vocab_size: int, maximum number of words in the vocabulary (the most frequent
+                    ones). Corpus statistics are then counted approximately, to bound memory.
+                online: bool, also noise words that are not in the vocabulary, when they are first
+                    seen in apply_noise (see noise_unseen_word) (default: False)
+                seed: int, seed for the decisions of online noising (default: 42)
         '''
         self.class_name = "GlobalLexicalNoiser"
         self.required_keys = {"lang", "text_file", "theta_content_global", "theta_func_global"}
-        self.allowed_keys = {"chargram_length", "output_dir"}
+        self.allowed_keys = {"chargram_length", "output_dir", "memo_size", "min_freq", "max_vocab_size", "online", "seed"}
         self.check_noise_params(noise_params)
 
         for key in noise_params:
@@ -200,43 +218,92 @@ class GlobalLexicalNoiser(Noise):
 
         if not hasattr(self, "chargram_length"):
             self.chargram_length = 3
+        if not hasattr(self, "memo_size"):
+            self.memo_size = DEFAULT_MEMO_SIZE
+        self.word_memo = WordMemo(int(self.memo_size))
+        self.min_freq = int(getattr(self, "min_freq", 1))
+        if hasattr(self, "max_vocab_size"):
+            self.max_vocab_size = int(self.max_vocab_size)
+        else:
+            self.max_vocab_size = None
+        self.online = bool(getattr(self, "online", False))
+        self.seed = int(getattr(self, "seed", DEFAULT_SEED))
         
         _, self.character_set = get_character_set(self.lang)
 
         print(f"Character set: {self.character_set}")
 
+        if corpus_stats is None:
+            max_tokens = TOKENS_PER_WORD * self.max_vocab_size if self.max_vocab_size is not None else None
+            corpus_stats = CorpusStats(self.text_file, max_tokens = max_tokens)
+
         # We'll use a phonological noiser for function words
-        self.phon_noiser = GlobalPhonologicalNoiser({"lang": self.lang, "theta_phon": 0.5, "text_file": self.text_file})
+        self.phon_noiser = GlobalPhonologicalNoiser({"lang": self.lang, "theta_phon": 0.5, "text_file": self.text_file, \
+                                                     "seed": key_hash(self.seed, self.class_name, "phon_noiser")}, \
+                                                    corpus_stats = corpus_stats)
 
         # Initialize vocabulary
-        self.vocab = self.get_vocab(self.text_file)
+        self.vocab = self.get_vocab(self.text_file, corpus_stats)
         self.chargram_models = self.train_chargram_model(self.chargram_length)
-        self.tag2wordlist = self.get_tag2wordlist()
+        self.compiled_chargram_model = CompiledCharGramModel(self.chargram_models, self.chargram_length)
+        self.functional_words, self.word2tag = get_functional_word_index(self.lang)
         self.vocab_map = self.construct_new_vocab()
+        # Words that online noising accepts, like the words of the vocabulary
+        self.word_regex = get_word_regex(PUNCTUATION_AND_BAD_CHARS, self.character_set)
 
         if hasattr(self, "output_dir"):
             os.makedirs(self.output_dir, exist_ok=True)
         
 
-    def get_vocab(self, text_file):
-        '''Initialize vocabulary from vocab file'''
+    def init_from_snapshot(self):
+        '''Restore the state that is derived from the noise parameters'''
+        self.word_memo = WordMemo(int(self.memo_size))
+        _, self.character_set = get_character_set(self.lang)
+        self.functional_words, self.word2tag = get_functional_word_index(self.lang)
+        self.word_regex = get_word_regex(PUNCTUATION_AND_BAD_CHARS, self.character_set)
+        if self.online:
+            # Online noising adds words to the vocab map. The phonological noiser and chargram
+            # model it needs are rebuilt from text_file when the first unseen word comes in.
+            self.vocab_map = dict(self.vocab_map)
+        if hasattr(self, "output_dir"):
+            os.makedirs(self.output_dir, exist_ok=True)
+
+    def reseed(self):
+        '''Rebuild the vocab map for a new seed (see Noise.with_seed). The vocabulary and
+        chargram models do not depend on the seed, and are shared.'''
+        if not hasattr(self, "compiled_chargram_model"):
+            # Loaded from a snapshot, this rebuilds the phonological noiser with the new seed as well
+            self.init_online_generators()
+        else:
+            self.phon_noiser = self.phon_noiser.with_seed(key_hash(self.seed, self.class_name, "phon_noiser"))
+        self.word_memo = WordMemo(int(self.memo_size))
+        self.vocab_map = self.construct_new_vocab()
+
+    def rethreshold(self, theta_name):
+        '''Keep the switched words whose draws are below the new thetas (see Noise.with_theta).
+        Function words and content words have their own thetas, but the same draw (see map_words).'''
+        self.word_memo = WordMemo(int(self.memo_size))
+        words = list(self.vocab_map)
+        switch_u = counter_uniforms(key_hashes((self.seed, self.class_name), words), 0)
+        vocab_map = dict()
+        for word, u in zip(words, switch_u):
+            theta = self.theta_func_global if self.is_word_functional(word) else self.theta_content_global
+            vocab_map[word] = self.vocab_map[word] if u < theta else word
+        self.vocab_map = vocab_map
+
+    def get_vocab(self, text_file, corpus_stats = None):
+        '''Initialize vocabulary from the corpus statistics of text_file
+        Args:
+            text_file: str, path to text file
+            corpus_stats: CorpusStats, statistics of text_file, if already computed
+        '''
         print(f"Initializing vocabulary from {text_file}...")
-        vocab = defaultdict(lambda: 0)
-        for line in open(text_file):
-            words = line.strip().split()
-            for word in words:
-                # Remove punctuation
-                punctuation_and_bad_chars = "»«.,!?()[]{}\"'`:;'/\\-–—~_<>|@#$%^&*+=\u200b\u200c\u200d\u200e\u200f"
-                word = word.strip(punctuation_and_bad_chars)
-                # If word has numeric characters, skip
-                if any(char.isdigit() for char in word):
-                    continue
-                # All characters in word must be in character set
-                if not all(char in self.character_set for char in word):
-                    # print(f"Not in character set: {word}")
-                    continue
-                                
-                vocab[word.lower()] += 1
+        if corpus_stats is None:
+            max_tokens = TOKENS_PER_WORD * self.max_vocab_size if self.max_vocab_size is not None else None
+            corpus_stats = CorpusStats(text_file, max_tokens = max_tokens)
+        # Remove punctuation, and keep only words with all characters in the character set
+        vocab = corpus_stats.get_vocab(strip_chars = PUNCTUATION_AND_BAD_CHARS, character_set = self.character_set, \
+                                            min_freq = self.min_freq, max_vocab_size = self.max_vocab_size)
         print(f"Finished initializing vocabulary from {text_file}!")
         print(f"Length of vocab: {len(vocab)}")
 
@@ -253,7 +320,7 @@ class GlobalLexicalNoiser(Noise):
         print(f"Training chargram model with chargram length {chargram_length}...")
         chargram_models = dict() # contains chargram_models for all cgram lengths <= chargram_length
         for n in range(1, chargram_length + 1):
-            chargram_model = defaultdict(lambda: defaultdict(lambda: 0)) # {prefix: {suffix: count}}
+            chargram_model = defaultdict(partial(defaultdict, int)) # {prefix: {suffix: count}}
 
             for word in self.vocab:
                 word = "!" + word # Add start token
@@ -267,73 +334,55 @@ class GlobalLexicalNoiser(Noise):
         print(f"Finished training chargram model with chargram length {chargram_length}!")
         return chargram_models
 
-    def generate_word(self, mean_length):
+    def generate_word(self, mean_length, rng = None):
         '''
         This function is for generating a non-word using the character n-gram model. We will:
         1. Sample the length of the non-word from a Poisson centered around mean_length
-        2. Use self.chargram_models to generate the rest of the non-word based on the length of prefix
+        2. Use self.compiled_chargram_model to generate the rest of the non-word based on the length of prefix
         Args:
             mean_length: float, mean length of non-word
+            rng: np.random.RandomState or KeyedRandom (default: np.random)
         '''
+        if rng is None:
+            rng = np.random
 
         # Sample length of non-word from Poisson, must be at least 1
 
-        length = max(1, np.random.poisson(mean_length))
+        length = max(1, rng.poisson(mean_length))
         length += 1
-        word = "!"
+        word = ""
 
-        while word == "!" or word[1:].lower() in self.vocab:
+        while word == "" or word.lower() in self.vocab:
             # If generated word in vocab, generate another word
-            word = "!"
-            for _ in range(length):
-                if len(word) < self.chargram_length-1:
-                    # If the word is shorter than the length of the chargram model, 
-                    # we will apply chargram model of the length of the word
-                    chargram_model = self.chargram_models[len(word) + 1]
-                    prefix = word
-                else:
-                    # If the word is longer than the prefix of the chargram model, 
-                    # we will apply the chargram model of the length of the model
-                    chargram_model = self.chargram_models[self.chargram_length]
-                    prefix = word[-(self.chargram_length-1):]
-                while len(list(chargram_model[prefix].keys())) == 0:
-                    # Backing off to shorter chargram models
-                    chargram_model = self.chargram_models[len(prefix)]
-                    prefix = prefix[1:]
-                # print(list(chargram_model[prefix].keys()))
-                # print(len(list(chargram_model[prefix].keys())))
+            word = self.compiled_chargram_model.generate(length, prefix = "!", rng = rng)
 
-                # Sample the next character based on the prefix
-                try:
-                    next_char = np.random.choice(list(chargram_model[prefix].keys()), p=np.array(list(chargram_model[prefix].values())) / sum(chargram_model[prefix].values()))
-                except:
-                    print(f"Error: {prefix} not in chargram model")
-                    # print(f"Chargram model: {chargram_model}")
-                    print(f"Word: {word}")
-                    print(f"Length: {length}")
-                    print(f"Mean Length: {mean_length}")
-                    print(f"Chargram Length: {self.chargram_length}")
-                    print(f"Prefix: {prefix}")
-                    print(f"{not chargram_model[prefix]}")
-                    print(f"Chargram model: {chargram_model[prefix].keys()}")
-
-                    raise
-                word += next_char
+        return word
 
-        return word[1:]
+    def generate_words(self, mean_lengths, keys = None):
+        '''Batched version of generate_word: generate one non-word per entry of mean_lengths.
+        All lengths are sampled at once, and all non-words are sampled together, one character
+        position at a time. Non-words are never in the vocabulary, and are distinct from each other.
+        Args:
+            mean_lengths: list, mean length of each non-word
+            keys: np.array of np.uint64, if given, key hash of each non-word (see utils/rng.py).
+                Draw 1 of a key samples the length, and draws 2, 3, ... the characters. Non-words
+                that collide are resolved by key order, so they depend on the keys in the batch,
+                but not on their order.
+        Returns:
+            list, list of non-words
+        '''
+        if len(mean_lengths) == 0:
+            return list()
+        if keys is None:
+            lengths = np.maximum(1, np.random.poisson(mean_lengths)) + 1
+            return self.compiled_chargram_model.generate_batch(lengths, prefixes = "!", reject = self.vocab)
+        lengths = np.maximum(1, poisson_from_uniforms(mean_lengths, counter_uniforms(keys, 1))) + 1
+        return self.compiled_chargram_model.generate_batch(lengths, prefixes = "!", reject = self.vocab, \
+                                                           keys = keys, counter_offset = 2)
     
-    def get_tag2wordlist(self):
-        '''Get tag2wordlist from the JSON file'''
-        with open(ud_wordlists_paths[self.lang]) as f:
-            tag2wordlist = json.load(f)
-        return tag2wordlist
-
     def is_word_functional(self, word):
         '''Check if word is functional'''
-        for tag in self.tag2wordlist:
-            if word in self.tag2wordlist[tag]:
-                return True
-        return False
+        return word in self.functional_words
 
     def get_vocab_map_stats(self):
         '''
@@ -345,10 +394,14 @@ class GlobalLexicalNoiser(Noise):
         stats["vocab_size"] = len(self.vocab)
         stats["content_words"] = len([word for word in self.vocab if not self.is_word_functional(word)])
         stats["func_words"] = len([word for word in self.vocab if self.is_word_functional(word)])
-        stats["content_words_noised_frac"] = round(len([word for word in self.vocab_map if not self.is_word_functional(word) \
+        # Words added by online noising are not part of the vocabulary
+        stats["content_words_noised_frac"] = round(len([word for word in self.vocab if not self.is_word_functional(word) \
                                                  and self.vocab_map[word] != word]) / stats["content_words"], 2)
-        stats["func_words_noised_frac"] = round(len([word for word in self.vocab_map if self.is_word_functional(word)\
+        stats["func_words_noised_frac"] = round(len([word for word in self.vocab if self.is_word_functional(word)\
                                                and self.vocab_map[word] != word])/stats["func_words"], 2)
+        if self.online:
+            stats["online_words"] = len(self.vocab_map) - len(self.vocab)
+        stats["memo"] = self.word_memo.get_stats()
         return stats
         
     def construct_new_vocab_archive(self):
@@ -379,28 +432,50 @@ class GlobalLexicalNoiser(Noise):
         '''
         With probability theta_global_*, switch out a word from the vocabulary.
         If it's a functional word, we'll apply phonological noise to it.
-        If it's a content word, we'll change it to a non-word.
+        If it's a content word, we'll change it to a non-word. Non-words are generated together at
+        the end, with generate_words, so that no two content words get the same non-word.
+        Returns:
+            vocab_map: dict, mapping of old word to new word
+        '''
+        return self.map_words(list(self.vocab))
+
+    def map_words(self, words):
+        '''Decide the new word of every word (see construct_new_vocab). All draws for a word are
+        keyed by (seed, noiser, word), so they do not depend on the order of the words. Switch
+        decisions do not depend on the other words either. Non-words are generated for all content
+        words, switched or not, and collisions between them are resolved by key order (see
+        CompiledCharGramModel.generate_batch). So switched content words never share a non-word,
+        and a word gets the same non-word for any theta_content_global. Words noised online are
+        mapped on their own, and are only kept distinct from the vocabulary.
+        Args:
+            words: list, lowercased words, stripped of punctuation
         Returns:
             vocab_map: dict, mapping of old word to new word
         '''
+        word_hashes = key_hashes((self.seed, self.class_name), words)
+        # Draw 0 of every word decides whether it is switched out
+        switch_u = counter_uniforms(word_hashes, 0)
         vocab_map = dict()
-        for word in self.vocab:
+        content_words = list()
+        for i, word in enumerate(words):
             # If word is functional:
             if self.is_word_functional(word):
-                if random.random() < self.theta_func_global:
+                if switch_u[i] < self.theta_func_global:
                     # print(f"Switching out {word}")
-                    new_word = self.phon_noiser.apply_noise_for_sure(word)
+                    new_word = self.phon_noiser.apply_noise_for_sure(word, KeyedRandom(self.seed, self.class_name, word))
                     vocab_map[word] = new_word
                 else:
                     vocab_map[word] = word
                 continue
             # If word is content:
-            if random.random() < self.theta_content_global:
-                # print(f"Switching out {word}")
-                new_word = self.generate_word(len(word))
-                vocab_map[word] = new_word
-            else:
-                vocab_map[word] = word
+            content_words.append(i)
+            vocab_map[word] = word
+
+        new_words = self.generate_words([len(words[i]) for i in content_words], keys = word_hashes[content_words])
+        for i, new_word in zip(content_words, new_words):
+            if switch_u[i] < self.theta_content_global:
+                # print(f"Switching out {words[i]}")
+                vocab_map[words[i]] = new_word
         
         return vocab_map
 
@@ -411,34 +486,83 @@ class GlobalLexicalNoiser(Noise):
         Returns:
             str, noised text
         '''
-        # Apply noise
-        # For each word, map it to the corresponding word using the vocab map self.vocab_map
+        return " ".join(self.apply_noise_to_words(input.split()))
 
+    def apply_noise_to_words(self, words):
+        '''Apply noise to a pre-tokenized input
+        Args:
+            words: list, list of input words
+        Returns:
+            list, list of noised words
+        '''
+        # Every input word always maps to the same noised word, so we memoize them
         noised_input = list()
-        for input_word in input.split():
+        for input_word in words:
+            noised_word = self.word_memo.get(input_word)
+            if noised_word is None:
+                noised_word = self.noise_word(input_word)
+                self.word_memo.put(input_word, noised_word)
+            noised_input.append(noised_word)
+        return noised_input
+
+    def noise_word(self, input_word):
+        '''Map a word to the corresponding word using the vocab map self.vocab_map
+        Args:
+            input_word: str, input word, possibly capitalized and with punctuation
+        Returns:
+            str, noised word
+        '''
+        if input_word[0].isupper():
+            # We do not affect proper nouns
+            return input_word
+        word = input_word.strip(".,!?").lower()
+        if word not in self.vocab_map and self.online:
+            self.noise_unseen_word(word)
+        if word in self.vocab_map:
+            mapped_word = self.vocab_map[word]
+            # Capitalize first letter if original word was capitalized
             if input_word[0].isupper():
-                # We do not affect proper nouns
-                noised_input.append(input_word)
-                continue
-            word = input_word.strip(".,!?").lower()
-            if word in self.vocab_map:
-                mapped_word = self.vocab_map[word]
-                # Capitalize first letter if original word was capitalized
-                if input_word[0].isupper():
-                    mapped_word = mapped_word.capitalize()
-                # Add punctuation back
-                if input_word[-1] in ".,!?":
-                    mapped_word += input_word[-1]
-                noised_input.append(mapped_word)
-            else:
-                noised_input.append(input_word)
-        return " ".join(noised_input)
+                mapped_word = mapped_word.capitalize()
+            # Add punctuation back
+            if input_word[-1] in ".,!?":
+                mapped_word += input_word[-1]
+            return mapped_word
+        return input_word
+
+    def noise_unseen_word(self, word):
+        '''Online noising: decide what an unseen word maps to, in the same way as
+        construct_new_vocab, and add it to the vocab map. Decisions are keyed by (seed, noiser,
+        word) (see map_words), so a word gets the same decision and the same replacement, whether
+        it was in the vocabulary or not, and whichever words were seen before it.
+        Args:
+            word: str, lowercased word, stripped of punctuation
+        '''
+        # Only words that could have been in the vocabulary
+        match = self.word_regex.fullmatch(word)
+        if word == "" or match is None or match.group(1) != word:
+            return
+        if not hasattr(self, "compiled_chargram_model"):
+            self.init_online_generators()
+
+        self.vocab_map.update(self.map_words([word]))
+
+    def init_online_generators(self):
+        '''Rebuild the phonological noiser and chargram model that online noising needs, for
+        noisers loaded from a snapshot'''
+        print(f"Rebuilding generators of {self.class_name} for online noising...")
+        max_tokens = TOKENS_PER_WORD * self.max_vocab_size if self.max_vocab_size is not None else None
+        corpus_stats = CorpusStats(self.text_file, max_tokens = max_tokens)
+        self.phon_noiser = GlobalPhonologicalNoiser({"lang": self.lang, "theta_phon": 0.5, "text_file": self.text_file, \
+                                                     "seed": key_hash(self.seed, self.class_name, "phon_noiser")}, \
+                                                    corpus_stats = corpus_stats)
+        self.chargram_models = self.train_chargram_model(self.chargram_length)
+        self.compiled_chargram_model = CompiledCharGramModel(self.chargram_models, self.chargram_length)
 
     def record_noiser_artifacts(self):
         '''Record vocab map, number of words switched out'''
         if hasattr(self, "output_dir"):
             with open(f"{self.output_dir}/vocab_map.json", "w") as f:
-                json.dump(self.vocab_map, f, indent=2, ensure_ascii=False) 
+                json.dump(dict(self.vocab_map), f, indent=2, ensure_ascii=False) 
             stats = self.get_vocab_map_stats()
             with open(f"{self.output_dir}/stats.json", "w") as f:
                 json.dump(stats, f, indent=2, ensure_ascii=False)
@@ -451,6 +575,9 @@ class GlobalLexicalNoiser(Noise):
         Returns:
             MLE estimate of self.theta_global
         '''
+        # SciPy is only needed here, so noisers can be built and applied without it
+        from scipy.stats import chisquare
+
         vocab1 = self.get_vocab(text1)
         vocab2 = self.get_vocab(text2)
 
@@ -1,20 +1,81 @@
-from phonological import GlobalPhonologicalNoiser
-from character_level import CharacterLevelNoiser
-from lexical import GlobalLexicalNoiser
-from morphological import GlobalMorphologicalNoiser
-# from google_translate import GoogleTranslateNoiser
+from utils.cache import get_cache_key, load_noisers, save_noisers
+from utils.corpus_stats import CorpusStats, TOKENS_PER_WORD
+from utils.rng import DEFAULT_SEED
 
 from collections import defaultdict
+from importlib.metadata import entry_points
+from itertools import islice
+import importlib
+import multiprocessing
+import tempfile
+import hashlib
+import shutil
+import random
+import argparse
+import os
+import numpy as np
 import regex
 
+# Noisers shared with forked worker processes by noise_corpus_parallel
+_WORKER_NOISE_CLASSES = None
+
+# Noisers by noise type, as "module:Class". A module is only imported when a noise spec uses one of
+# its noisers, so e.g. character-level jobs do not import SciPy. Classes can be registered directly too.
 NOISE_REGISTRY = {
-    'phonological': GlobalPhonologicalNoiser,
-    'character_level': CharacterLevelNoiser,
-    'lexical': GlobalLexicalNoiser,
-    'morph': GlobalMorphologicalNoiser,
-    # 'gtrans': GoogleTranslateNoiser,
+    'phonological': 'phonological:GlobalPhonologicalNoiser',
+    'character_level': 'character_level:CharacterLevelNoiser',
+    'lexical': 'lexical:GlobalLexicalNoiser',
+    'morph': 'morphological:GlobalMorphologicalNoiser',
+    # 'gtrans': 'google_translate:GoogleTranslateNoiser',
 }
 
+# Entry point group under which other packages register their noisers, with the noise type as
+# the name of the entry point, e.g. in pyproject.toml:
+#     [project.entry-points.xlingual_noisers]
+#     my_noise = "my_package.noisers:MyNoiser"
+NOISER_ENTRY_POINT_GROUP = "xlingual_noisers"
+
+# Noiser classes that have been imported, by noise type
+_noise_classes = dict()
+
+def get_noiser_entry_points():
+    '''Get the noisers that installed packages register as entry points
+    Returns:
+        dict, {noise_type: EntryPoint}
+    '''
+    try:
+        noiser_entry_points = entry_points(group=NOISER_ENTRY_POINT_GROUP)
+    except TypeError:
+        # Python < 3.10
+        noiser_entry_points = entry_points().get(NOISER_ENTRY_POINT_GROUP, [])
+    return {entry_point.name: entry_point for entry_point in noiser_entry_points}
+
+def get_noise_class(noise_type):
+    '''Get the noiser class of a noise type, importing it on first use. Noisers of
+    NOISE_REGISTRY take precedence over noisers registered as entry points.
+    Args:
+        noise_type: str, noise type, like phonological
+    Returns:
+        class, subclass of Noise
+    '''
+    if noise_type not in _noise_classes:
+        if noise_type in NOISE_REGISTRY:
+            noise_class = NOISE_REGISTRY[noise_type]
+            if isinstance(noise_class, str):
+                module_name, class_name = noise_class.split(":")
+                noise_class = getattr(importlib.import_module(module_name), class_name)
+        else:
+            entry_point = get_noiser_entry_points().get(noise_type)
+            if entry_point is None:
+                raise ValueError(f"Unknown noise type: {noise_type}. Known noise types: {', '.join(get_noise_types())}")
+            noise_class = entry_point.load()
+        _noise_classes[noise_type] = noise_class
+    return _noise_classes[noise_type]
+
+def get_noise_types():
+    '''Get all noise types, built-in and registered as entry points, without importing them'''
+    return list(NOISE_REGISTRY) + [noise_type for noise_type in get_noiser_entry_points() if noise_type not in NOISE_REGISTRY]
+
 def parse_noise_params(noise_params_str):
     '''
     Parse noise parameters e.g. phonological-theta_1=0.5,theta_2=0.2;syntax-theta_2=0.5
@@ -58,25 +119,91 @@ def parse_noise_params(noise_params_str):
     return all_noise_params
     
 
-def get_noisers(all_noise_params):
+def get_noisers(all_noise_params, seed = None, cache_dir = None):
     '''Initialize noisers with noise parameters
     Args:
         input: str, input text
         all_noise_params: dict, noise parameters, like {phonological: {theta_1: 0.5}}
+        seed: int, seed of the global RNGs while building the noisers (default: DEFAULT_SEED)
+        cache_dir: str, directory for caching built noisers (default: $NOISER_CACHE_DIR, if set)
     Returns:
         noise_classes: list, list of noiser class objects
     '''
     if not all_noise_params:
         return list()
 
-    # Initialize noiser objects from noise type classes
+    if seed is None:
+        seed = DEFAULT_SEED
+    if cache_dir is None:
+        cache_dir = os.environ.get("NOISER_CACHE_DIR")
+
+    # Noiser modules are imported first, so that nothing they run on import (e.g. seeding the
+    # global RNGs) changes the state the noisers start from
+    noise_class_types = [get_noise_class(noise_type) for noise_type in all_noise_params]
+
+    # Noisers that draw from the global RNGs start from the same state in every job, whether
+    # they are built or loaded from the cache
+    random.seed(seed)
+    np.random.seed(seed)
+
+    if cache_dir:
+        cache_key = get_cache_key(all_noise_params, seed, noise_class_types)
+        # On a hit, the global RNGs continue from where the build left them
+        noise_classes = load_noisers(cache_dir, cache_key)
+        if noise_classes is not None:
+            set_output_dirs(noise_classes, all_noise_params)
+            return noise_classes
+
+    # Initialize noiser objects from noise type classes.
+    # Noisers built on the same text file share one pass over it, if they accept corpus statistics
+    # (other noisers, e.g. from plugins, only take their noise parameters).
     noise_classes = list()
-    for noise_type, noise_params in all_noise_params.items():
-        noiser = NOISE_REGISTRY[noise_type](noise_params)
+    corpus_stats = dict() # {text_file: CorpusStats}
+    for (noise_type, noise_params), noise_class in zip(all_noise_params.items(), noise_class_types):
+        if "text_file" in noise_params and getattr(noise_class, "uses_corpus_stats", False):
+            text_file = noise_params["text_file"]
+            if text_file not in corpus_stats:
+                corpus_stats[text_file] = CorpusStats(text_file, max_tokens = get_max_tokens(all_noise_params, text_file))
+            noiser = noise_class(noise_params, corpus_stats = corpus_stats[text_file])
+        else:
+            noiser = noise_class(noise_params)
         noise_classes.append(noiser)
+
+    if cache_dir:
+        save_noisers(cache_dir, cache_key, noise_classes)
     
     return noise_classes
 
+def get_max_tokens(all_noise_params, text_file):
+    '''Get the number of token counters for the corpus statistics of a text file. We count
+    approximately only if every noiser that shares the statistics of the text file bounds its
+    vocabulary.
+    Args:
+        all_noise_params: dict, noise parameters, like {phonological: {theta_1: 0.5}}
+        text_file: str, path to text file
+    Returns:
+        int, enough counters for the largest max_vocab_size, or None to count exactly
+    '''
+    max_vocab_sizes = [noise_params.get("max_vocab_size") for noise_type, noise_params in all_noise_params.items() \
+                       if noise_params.get("text_file") == text_file \
+                       and getattr(get_noise_class(noise_type), "uses_corpus_stats", False)]
+    if None in max_vocab_sizes:
+        return None
+    return TOKENS_PER_WORD * int(max(max_vocab_sizes))
+
+def set_output_dirs(noise_classes, all_noise_params):
+    '''Point noisers loaded from the cache to the output directories of the current job
+    Args:
+        noise_classes: list, list of noisers
+        all_noise_params: dict, noise parameters the noisers were requested with
+    '''
+    for noiser, noise_params in zip(noise_classes, all_noise_params.values()):
+        if "output_dir" in noise_params:
+            noiser.output_dir = noise_params["output_dir"]
+            os.makedirs(noiser.output_dir, exist_ok=True)
+        elif hasattr(noiser, "output_dir"):
+            del noiser.output_dir
+
 def apply_noisers(input, noise_classes, verbose = False):
     '''Apply noise to input
     Args:
@@ -102,26 +229,37 @@ def apply_noisers_compose(input, noise_classes, verbose = False):
     Returns:
         str, noised text
     '''
+    return " ".join(apply_noisers_compose_to_words(input.split(), noise_classes, verbose))
+
+def apply_noisers_compose_to_words(words, noise_classes, verbose = False):
+    '''Apply noise to a pre-tokenized input, compose all noisers
+    Args:
+        words: list, list of input words
+        noise_classes: list, list of noisers
+    Returns:
+        list, list of noised words
+    '''
     noise_type_output = dict()
     for noiser in noise_classes:
         if verbose:
             print(f"Applying noise: {noiser}")
-        noise_type_output[noiser.class_name] = noiser.apply_noise(input).split()
+        noise_type_output[noiser.class_name] = noiser.apply_noise_to_words(words)
 
-        assert len(input.split()) == len(noise_type_output[noiser.class_name])
+        assert len(words) == len(noise_type_output[noiser.class_name])
 
-    print(noise_type_output)
+    if verbose:
+        print(noise_type_output)
     
     # If some kind of noise is not applied, we will add it as the original input
     for noiser in {"GlobalPhonologicalNoiser", "GlobalLexicalNoiser", "GlobalMorphologicalNoiser"}:
         if noiser not in noise_type_output:
-            noise_type_output[noiser] = input.split()
+            noise_type_output[noiser] = words
 
     # Now we will compose these outputs
     ## We assume that the order is phonological, morphological, lexical
     final_output = list()
 
-    for i, word in enumerate(input.split()):
+    for i, word in enumerate(words):
         noised_word = word
         if noise_type_output['GlobalLexicalNoiser'][i] != word:
             # If lexical noiser has changed the word, we will use that
@@ -152,7 +290,288 @@ def apply_noisers_compose(input, noise_classes, verbose = False):
             ## which thankfully it does
         final_output.append(noised_word)
 
-    return " ".join(final_output)
+    return final_output
+
+def apply_noisers_batch(inputs, noise_classes, verbose = False):
+    '''Apply noise to a batch of inputs. Each input is tokenized once, and the same
+    token list is shared by all noisers.
+    Args:
+        inputs: list, list of input texts
+        noise_classes: list, list of noisers
+    Returns:
+        list, list of noised texts
+    '''
+    noised_inputs = list()
+    for input in inputs:
+        words = input.split()
+        if len(noise_classes) > 1:
+            words = apply_noisers_compose_to_words(words, noise_classes, verbose)
+        else:
+            for noiser in noise_classes:
+                words = noiser.apply_noise_to_words(words)
+        noised_inputs.append(" ".join(words))
+    return noised_inputs
+
+def noise_corpus(path_in, path_out, noise_classes, batch_size = 1000, verbose = False):
+    '''Noise a text file line by line, without holding the corpus in memory
+    Args:
+        path_in: str, input text file
+        path_out: str, output text file, one noised line per input line
+        noise_classes: list, list of noisers
+        batch_size: int, number of lines to noise at a time
+    Returns:
+        int, number of lines noised
+    '''
+    num_lines = 0
+    with open(path_in, "r") as f_in, open(path_out, "w") as f_out:
+        while True:
+            lines = list(islice(f_in, batch_size))
+            if not lines:
+                break
+            noised_lines = apply_noisers_batch(lines, noise_classes, verbose)
+            f_out.write("\n".join(noised_lines) + "\n")
+            num_lines += len(lines)
+            if verbose:
+                print(f"Noised {num_lines} lines")
+
+    return num_lines
+
+def get_shard_boundaries(path_in, num_shards):
+    '''Split a file into byte ranges that start and end on line boundaries
+    Args:
+        path_in: str, input text file
+        num_shards: int, number of shards to aim for
+    Returns:
+        list, list of (start, end) byte offsets
+    '''
+    file_size = os.path.getsize(path_in)
+    boundaries = [0]
+    with open(path_in, "rb") as f:
+        for i in range(1, num_shards):
+            offset = file_size * i // num_shards
+            if offset <= boundaries[-1]:
+                continue
+            # Move to the start of the first line beginning at or after offset
+            f.seek(offset - 1)
+            f.readline()
+            if f.tell() < file_size and f.tell() > boundaries[-1]:
+                boundaries.append(f.tell())
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries[:-1], boundaries[1:]) if end > start]
+
+def seed_line(seed, offset):
+    '''Seed the global RNGs for one line, so that noise drawn at noising time
+    depends only on the seed and the byte offset of the line, and not on how the
+    file was sharded
+    '''
+    line_seed = int.from_bytes(hashlib.blake2b(f"{seed}-{offset}".encode(), digest_size=4).digest(), "little")
+    random.seed(line_seed)
+    np.random.seed(line_seed)
+
+def noise_shard(path_in, start, end, shard_path, noise_classes, seed, batch_size = 1000):
+    '''Noise the lines in the byte range [start, end) of a text file
+    Args:
+        path_in: str, input text file
+        start, end: int, byte range, aligned to line boundaries
+        shard_path: str, file to write the noised lines to
+        noise_classes: list, list of noisers
+        seed: int, seed for noisers that draw random numbers at noising time
+    Returns:
+        list, for each noiser, the vocab_map entries that were recorded while noising
+    '''
+    return noise_shard_multi(path_in, start, end, [shard_path], [noise_classes], [seed], batch_size)[0]
+
+def noise_shard_multi(path_in, start, end, shard_paths, noiser_sets, seeds, batch_size = 1000):
+    '''Noise the lines in the byte range [start, end) of a text file with several sets of
+    noisers, reading the lines once
+    Args:
+        path_in: str, input text file
+        start, end: int, byte range, aligned to line boundaries
+        shard_paths: list, for each set of noisers, file to write the noised lines to
+        noiser_sets: list, list of lists of noisers
+        seeds: list, for each set of noisers, seed for noisers that draw random numbers at noising time
+    Returns:
+        list, for each set of noisers, the vocab_map entries that each noiser recorded while noising
+    '''
+    reseeds = [not all(noiser.deterministic for noiser in noise_classes) for noise_classes in noiser_sets]
+    vocab_map_sizes = [[len(getattr(noiser, "vocab_map", {})) for noiser in noise_classes] for noise_classes in noiser_sets]
+
+    def noise_batch(batch, noise_classes, seed, reseed):
+        if not reseed:
+            return apply_noisers_batch([line for _, line in batch], noise_classes)
+        noised_lines = list()
+        for offset, line in batch:
+            seed_line(seed, offset)
+            noised_lines.extend(apply_noisers_batch([line], noise_classes))
+        return noised_lines
+
+    f_outs = [open(shard_path, "w") for shard_path in shard_paths]
+    try:
+        with open(path_in, "rb") as f_in:
+            f_in.seek(start)
+            offset = start
+            batch = list()
+            while True:
+                line = f_in.readline() if offset < end else b""
+                if line:
+                    batch.append((offset, line.decode("utf-8")))
+                    offset += len(line)
+                if batch and (len(batch) == batch_size or not line):
+                    for f_out, noise_classes, seed, reseed in zip(f_outs, noiser_sets, seeds, reseeds):
+                        f_out.write("\n".join(noise_batch(batch, noise_classes, seed, reseed)) + "\n")
+                    batch = list()
+                if not line:
+                    break
+    finally:
+        for f_out in f_outs:
+            f_out.close()
+
+    # Phonological noisers record every word they see, we send these back to the parent
+    all_new_vocab_map_entries = list()
+    for noise_classes, sizes in zip(noiser_sets, vocab_map_sizes):
+        new_vocab_map_entries = list()
+        for noiser, size in zip(noise_classes, sizes):
+            vocab_map = getattr(noiser, "vocab_map", {})
+            new_vocab_map_entries.append(dict(islice(vocab_map.items(), size, None)))
+        all_new_vocab_map_entries.append(new_vocab_map_entries)
+    return all_new_vocab_map_entries
+
+def _noise_shard_worker(shard):
+    '''Pool worker: noise one shard with the noisers inherited from the parent process'''
+    path_in, start, end, shard_paths, seeds, batch_size = shard
+    return noise_shard_multi(path_in, start, end, shard_paths, _WORKER_NOISE_CLASSES, seeds, batch_size)
+
+def noise_corpus_parallel(path_in, path_out, noise_classes, num_workers = None, seed = 42, batch_size = 1000, shards_per_worker = 4):
+    '''Noise a text file with a pool of worker processes.
+    The noisers are built once in the parent, and the workers are forked so they share the
+    built maps copy-on-write. The file is sharded by byte ranges, and the noised shards are
+    merged in order. The output only depends on the seed, and not on num_workers.
+    Args:
+        path_in: str, input text file
+        path_out: str, output text file, one noised line per input line
+        noise_classes: list, list of noisers
+        num_workers: int, number of worker processes (default: all cores)
+        seed: int, seed for noisers that draw random numbers at noising time
+        shards_per_worker: int, number of shards per worker, for load balancing
+    Returns:
+        int, number of shards
+    '''
+    return noise_corpus_parallel_multi(path_in, [path_out], [noise_classes], [seed], num_workers = num_workers, \
+                                       batch_size = batch_size, shards_per_worker = shards_per_worker)
+
+def noise_corpus_parallel_multi(path_in, paths_out, noiser_sets, seeds, num_workers = None, batch_size = 1000, shards_per_worker = 4):
+    '''Noise a text file with several sets of noisers in one pass over it, e.g. the noisers of
+    several seeds from get_seeded_noisers. See noise_corpus_parallel.
+    Args:
+        path_in: str, input text file
+        paths_out: list, for each set of noisers, output text file
+        noiser_sets: list, list of lists of noisers
+        seeds: list, for each set of noisers, seed for noisers that draw random numbers at noising time
+        num_workers: int, number of worker processes (default: all cores)
+        shards_per_worker: int, number of shards per worker, for load balancing
+    Returns:
+        int, number of shards
+    '''
+    global _WORKER_NOISE_CLASSES
+
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    shards = get_shard_boundaries(path_in, num_workers * shards_per_worker)
+
+    shard_dir = tempfile.mkdtemp(prefix="noise_shards_", dir=os.path.dirname(os.path.abspath(paths_out[0])))
+    shard_args = [(path_in, start, end, [os.path.join(shard_dir, f"shard_{i}_{j}.txt") for j in range(len(noiser_sets))], \
+                   seeds, batch_size) for i, (start, end) in enumerate(shards)]
+
+    try:
+        if num_workers == 1:
+            results = [noise_shard_multi(path_in, start, end, shard_paths, noiser_sets, seeds, batch_size) \
+                       for (path_in, start, end, shard_paths, seeds, batch_size) in shard_args]
+        else:
+            _WORKER_NOISE_CLASSES = noiser_sets
+            try:
+                with multiprocessing.get_context("fork").Pool(num_workers) as pool:
+                    results = pool.map(_noise_shard_worker, shard_args, chunksize=1)
+            finally:
+                # Do not keep the noisers alive if a worker failed
+                _WORKER_NOISE_CLASSES = None
+
+            for all_new_vocab_map_entries in results:
+                for noise_classes, new_vocab_map_entries in zip(noiser_sets, all_new_vocab_map_entries):
+                    for noiser, entries in zip(noise_classes, new_vocab_map_entries):
+                        if entries:
+                            noiser.vocab_map.update(entries)
+
+        # Merge shards in order
+        for j, path_out in enumerate(paths_out):
+            with open(path_out, "w") as f_out:
+                for _, _, _, shard_paths, _, _ in shard_args:
+                    with open(shard_paths[j], "r") as f_shard:
+                        shutil.copyfileobj(f_shard, f_out)
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+
+    return len(shards)
+
+def get_seeded_noisers(noise_classes, seeds):
+    '''Derive noisers for several seeds from noisers built once. Only the seed-dependent maps
+    are rebuilt for each seed (see Noise.with_seed); vocabularies, chargram models and suffix
+    tables are built once and shared.
+    Args:
+        noise_classes: list, list of noisers, built with get_noisers
+        seeds: list, list of seeds
+    Returns:
+        list, for each seed, list of noisers. Artifacts of each seed are recorded in the
+            seed_{seed} subdirectory of the output directory of each noiser.
+    '''
+    noiser_sets = list()
+    for seed in seeds:
+        seeded_noise_classes = list()
+        for noiser in noise_classes:
+            seeded_noiser = noiser.with_seed(seed)
+            if hasattr(noiser, "output_dir"):
+                seeded_noiser.output_dir = os.path.join(noiser.output_dir, f"seed_{seed}")
+                os.makedirs(seeded_noiser.output_dir, exist_ok=True)
+            seeded_noise_classes.append(seeded_noiser)
+        noiser_sets.append(seeded_noise_classes)
+    return noiser_sets
+
+def get_sweep_noisers(all_noise_params, noise_type, theta_name, thetas, seed = None, cache_dir = None):
+    '''Get noisers for every value of a sweep over one theta, from one construction. The noiser
+    of noise_type is built once, at the largest value, and the noisers of the other values are
+    derived from it (see Noise.with_theta): the words, suffixes or trigrams noised at a value
+    are a subset of the ones noised at any larger value, with the same replacements.
+    Args:
+        all_noise_params: dict, noise parameters, like {phonological: {theta_1: 0.5}}
+        noise_type: str, noise type to sweep, e.g. lexical
+        theta_name: str, theta to sweep, e.g. theta_content_global
+        thetas: list, values of the theta
+        seed, cache_dir: see get_noisers
+    Returns:
+        list, for each value, list of noisers. Noisers of the other noise types are shared.
+            Artifacts of each value are recorded in the {theta_name}_{theta} subdirectory of the
+            output directory of the swept noiser.
+    '''
+    all_noise_params = defaultdict(dict, {noise_type: dict(noise_params) for noise_type, noise_params in all_noise_params.items()})
+    all_noise_params[noise_type][theta_name] = max(thetas)
+    noise_classes = get_noisers(all_noise_params, seed = seed, cache_dir = cache_dir)
+    idx = list(all_noise_params).index(noise_type)
+
+    noiser_sets = list()
+    for theta in thetas:
+        noiser = noise_classes[idx].with_theta(theta_name, theta)
+        if hasattr(noise_classes[idx], "output_dir"):
+            noiser.output_dir = os.path.join(noise_classes[idx].output_dir, f"{theta_name}_{theta}")
+            os.makedirs(noiser.output_dir, exist_ok=True)
+        noiser_sets.append(noise_classes[:idx] + [noiser] + noise_classes[idx+1:])
+    return noiser_sets
+
+def get_variant_output_file(output_file, name, value):
+    '''Get the output file for one variant of a run (e.g. one seed): output_file with {name}
+    filled in, or with _{name}{value} added before its extension'''
+    if "{" + name + "}" in output_file:
+        return output_file.format(**{name: value})
+    root, ext = os.path.splitext(output_file)
+    return f"{root}_{name}{value}{ext}"
 
 def record_noiser_artifacts(noise_classes):
     '''Save noiser artifacts to output file
@@ -160,4 +579,53 @@ def record_noiser_artifacts(noise_classes):
         noise_classes: list, list of noisers
     '''
     for noiser in noise_classes:
-        noiser.record_noiser_artifacts()
\ No newline at end of file
+        noiser.record_noiser_artifacts()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Noise a text file line by line")
+    parser.add_argument("--all_noise_params_str", type=str, required=True, help="Noise parameters, e.g. phonological-lang=hi,theta_phon=0.1,text_file=<...>")
+    parser.add_argument("--input_file", type=str, required=True, help="Text file to noise")
+    parser.add_argument("--output_file", type=str, required=True, help="File to write the noised text to. With --seeds, may contain {seed}, with --sweep, {theta}")
+    parser.add_argument("--batch_size", type=int, default=1000, help="Number of lines to noise at a time")
+    parser.add_argument("--num_workers", type=int, default=1, help="Number of worker processes, 0 for all cores")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for noisers that draw random numbers at noising time")
+    parser.add_argument("--cache_dir", type=str, default=None, help="Directory for caching built noisers (default: $NOISER_CACHE_DIR)")
+    parser.add_argument("--seeds", type=int, nargs="+", default=None, \
+                        help="Variance mode: build the noisers once, and write one noised file per seed (see --output_file)")
+    parser.add_argument("--sweep", type=str, default=None, \
+                        help="Sweep mode: noise type and theta to sweep, e.g. lexical-theta_content_global. "
+                             "Writes one noised file per value of --sweep_values (see --output_file)")
+    parser.add_argument("--sweep_values", type=float, nargs="+", default=None, help="Values of the swept theta")
+    args = parser.parse_args()
+    if args.seeds is not None and args.sweep is not None:
+        parser.error("--seeds and --sweep cannot be combined")
+    if (args.sweep is None) != (args.sweep_values is None):
+        parser.error("--sweep and --sweep_values go together")
+
+    all_noise_params = parse_noise_params(args.all_noise_params_str)
+    if args.sweep is not None:
+        noise_type, theta_name = args.sweep.split("-")
+        noiser_sets = get_sweep_noisers(all_noise_params, noise_type, theta_name, args.sweep_values, cache_dir = args.cache_dir)
+        output_files = [get_variant_output_file(args.output_file, "theta", theta) for theta in args.sweep_values]
+        num_shards = noise_corpus_parallel_multi(args.input_file, output_files, noiser_sets, [args.seed] * len(noiser_sets), \
+                                                 num_workers = args.num_workers or None, batch_size = args.batch_size)
+        print(f"Noised {args.input_file} into {', '.join(output_files)} ({num_shards} shards)")
+        for noise_classes in noiser_sets:
+            record_noiser_artifacts(noise_classes)
+    elif args.seeds is not None:
+        noise_classes = get_noisers(all_noise_params, cache_dir = args.cache_dir)
+        # Each seed is used both to build the maps and for noise drawn at noising time
+        noiser_sets = get_seeded_noisers(noise_classes, args.seeds)
+        output_files = [get_variant_output_file(args.output_file, "seed", seed) for seed in args.seeds]
+        num_shards = noise_corpus_parallel_multi(args.input_file, output_files, noiser_sets, args.seeds, \
+                                                 num_workers = args.num_workers or None, batch_size = args.batch_size)
+        print(f"Noised {args.input_file} into {', '.join(output_files)} ({num_shards} shards)")
+        for seeded_noise_classes in noiser_sets:
+            record_noiser_artifacts(seeded_noise_classes)
+    else:
+        noise_classes = get_noisers(all_noise_params, cache_dir = args.cache_dir)
+        num_shards = noise_corpus_parallel(args.input_file, args.output_file, noise_classes, \
+                                           num_workers = args.num_workers or None, seed = args.seed, batch_size = args.batch_size)
+        print(f"Noised {args.input_file} into {args.output_file} ({num_shards} shards)")
+        record_noiser_artifacts(noise_classes)
@@ -2,6 +2,7 @@ from noise import Noise
 from phonological import GlobalPhonologicalNoiser
 import random
 from collections import defaultdict, Counter
+from functools import partial
 import numpy as np
 import json
 import sys
@@ -9,16 +10,19 @@ import os
 from tqdm import tqdm
 
 from utils.misc import normalize_lang_codes, get_character_set
+from utils.chargram import CompiledCharGramModel
+from utils.corpus_stats import CorpusStats, TOKENS_PER_WORD, get_word_regex
+from utils.memo import WordMemo, DEFAULT_MEMO_SIZE
+from utils.suffix_trie import SuffixTrie
+from utils.rng import KeyedRandom, DEFAULT_SEED, key_hash, key_hashes, counter_uniforms
 
 sys.path.append(os.getcwd())
 
 from utils.get_functional_words import OUTDIR, closed_class_tags
 from utils.get_functional_words import output_paths as ud_wordlists_paths
+from utils.get_functional_words import get_functional_word_index
 
-from scipy.stats import chisquare
-
-random.seed(42)
-np.random.seed(42)
+PUNCTUATION_AND_BAD_CHARS = "»«.,!?()[]{}\"'`:;'/\\-–—~_<>|@#$%^&*+=\u200b\u200c\u200d\u200e\u200f"
 rng = np.random.default_rng(42)
 
 
@@ -30,21 +34,36 @@ class GlobalMorphologicalNoiser(Noise):
     Input format: {param: value}
     '''
     
-    def __init__(self, noise_params):
+    deterministic = True
+    # The phonological noiser and chargram models are only needed to build the maps,
+    # so they are not part of snapshots
+    snapshot_maps = ["vocab_map", "suffix_map", "vocab", "suffix_freq"]
+    uses_corpus_stats = True
+    sweep_params = {"theta_morph_global"}
+
+    def __init__(self, noise_params, corpus_stats = None):
         '''Initialize noise with noise parameters
         Args:
             noise_params: dict, noise parameters, like {theta_1: 0.5}
+            corpus_stats: CorpusStats, statistics of text_file, if already computed
             Should contain:
                 text_file: str, txt file. We'll learn a character ngram model from this text.
                 theta_morph_global: float, probability of switching out a suffix
             Also accepts:
                 chargram_length: int, character n-gram length (default: 3)
                 output_dir: str, output directory for noiser artifacts
+                memo_size: int, maximum number of words to memoize in apply_noise
+                min_freq: int, only words that occur at least min_freq times are part of the vocabulary
+                max_vocab_size: int, maximum number of words in the vocabulary (the most frequent
+                    ones). Corpus statistics are then counted approximately, to bound memory.
+                online: bool, also noise words that are not in the vocabulary, when they are first
+                    seen in apply_noise (see noise_unseen_word) (default: False)
+                seed: int, seed for the decisions that build the suffix map (default: 42)
         '''
 
         self.class_name = "GlobalMorphologicalNoiser"
         self.required_keys = {"lang", "text_file", "theta_morph_global"}
-        self.allowed_keys = {"chargram_length", "output_dir"}
+        self.allowed_keys = {"chargram_length", "output_dir", "memo_size", "min_freq", "max_vocab_size", "online", "seed"}
         self.check_noise_params(noise_params)
 
         for key in noise_params:
@@ -55,18 +74,36 @@ class GlobalMorphologicalNoiser(Noise):
 
         if not hasattr(self, "chargram_length"):
             self.chargram_length = 3
+        if not hasattr(self, "memo_size"):
+            self.memo_size = DEFAULT_MEMO_SIZE
+        self.word_memo = WordMemo(int(self.memo_size))
+        self.min_freq = int(getattr(self, "min_freq", 1))
+        if hasattr(self, "max_vocab_size"):
+            self.max_vocab_size = int(self.max_vocab_size)
+        else:
+            self.max_vocab_size = None
+        self.online = bool(getattr(self, "online", False))
+        self.seed = int(getattr(self, "seed", DEFAULT_SEED))
         
         _, self.character_set = get_character_set(self.lang)
 
+        if corpus_stats is None:
+            max_tokens = TOKENS_PER_WORD * self.max_vocab_size if self.max_vocab_size is not None else None
+            corpus_stats = CorpusStats(self.text_file, max_tokens = max_tokens)
+
         # Initialize vocabulary
-        self.vocab = self.get_vocab(self.text_file)
+        self.vocab = self.get_vocab(self.text_file, corpus_stats)
         ### We're not using chargram models for now
         # self.chargram_models = self.train_chargram_model(self.chargram_length)
-        self.phon_noiser = GlobalPhonologicalNoiser({"lang": self.lang, "theta_phon": 0.5, "text_file": self.text_file})
-        self.tag2wordlist = self.get_tag2wordlist()
-        self.suffix_freq, self.most_frequent_word_per_suffix = self.get_suffix_frequency()
+        self.phon_noiser = GlobalPhonologicalNoiser({"lang": self.lang, "theta_phon": 0.5, "text_file": self.text_file, \
+                                                     "seed": key_hash(self.seed, self.class_name, "phon_noiser")}, \
+                                                    corpus_stats = corpus_stats)
+        # AUX words *can* be affected by morphological change
+        self.functional_words, self.word2tag = get_functional_word_index(self.lang, exclude_tags = ("AUX".casefold(),))
+        self.suffix_freq, self.most_frequent_word_per_suffix = self.get_suffix_frequency(corpus_stats)
         # self.filter_suffix_frequency()
         self.filter_suffix_topk()
+        self.suffix_trie = SuffixTrie(self.suffix_freq)
         # self.chargram_models = self.train_suffix_chargram_model(self.chargram_length)
 
         # Construct suffix --> new suffix map
@@ -74,11 +111,53 @@ class GlobalMorphologicalNoiser(Noise):
 
         # Construct vocab map, which maps each word to a new word by swapping out suffixes of content words
         self.vocab_map = self.construct_new_vocab()
+        # Words that online noising accepts, like the words of the vocabulary
+        self.word_regex = get_word_regex(PUNCTUATION_AND_BAD_CHARS)
 
         if hasattr(self, "output_dir"):
             os.makedirs(self.output_dir, exist_ok=True)
         
 
+    def init_from_snapshot(self):
+        '''Restore the state that is derived from the noise parameters'''
+        self.word_memo = WordMemo(int(self.memo_size))
+        _, self.character_set = get_character_set(self.lang)
+        self.functional_words, self.word2tag = get_functional_word_index(self.lang, exclude_tags = ("AUX".casefold(),))
+        self.suffix_trie = SuffixTrie(self.suffix_freq)
+        self.word_regex = get_word_regex(PUNCTUATION_AND_BAD_CHARS)
+        if self.online:
+            # Online noising adds words to the vocab map
+            self.vocab_map = dict(self.vocab_map)
+        if hasattr(self, "output_dir"):
+            os.makedirs(self.output_dir, exist_ok=True)
+
+    def reseed(self):
+        '''Rebuild the suffix map and vocab map for a new seed (see Noise.with_seed). The
+        vocabulary and suffix tables do not depend on the seed, and are shared.'''
+        phon_seed = key_hash(self.seed, self.class_name, "phon_noiser")
+        if hasattr(self, "phon_noiser"):
+            self.phon_noiser = self.phon_noiser.with_seed(phon_seed)
+        else:
+            # The phonological noiser is not part of snapshots
+            max_tokens = TOKENS_PER_WORD * self.max_vocab_size if self.max_vocab_size is not None else None
+            self.phon_noiser = GlobalPhonologicalNoiser({"lang": self.lang, "theta_phon": 0.5, "text_file": self.text_file, \
+                                                         "seed": phon_seed}, \
+                                                        corpus_stats = CorpusStats(self.text_file, max_tokens = max_tokens))
+        self.word_memo = WordMemo(int(self.memo_size))
+        self.suffix_map = self.construct_suffix_map()
+        self.vocab_map = self.construct_new_vocab()
+
+    def rethreshold(self, theta_name):
+        '''Keep the swapped suffixes whose draws are below the new theta_morph_global, and remap
+        the vocabulary with them (see Noise.with_theta)'''
+        self.word_memo = WordMemo(int(self.memo_size))
+        suffixes = list(self.suffix_map)
+        swap_u = counter_uniforms(key_hashes((self.seed, self.class_name), suffixes), 0)
+        self.suffix_map = {suffix: self.suffix_map[suffix] if u < self.theta_morph_global else suffix \
+                           for suffix, u in zip(suffixes, swap_u)}
+        # Words added by online noising are remapped as well
+        self.vocab_map = {word: self.map_word(word) for word in self.vocab_map}
+
     def train_chargram_model(self, chargram_length=3):
         '''Train a character n-gram model on text
         Args:
@@ -90,7 +169,7 @@ class GlobalMorphologicalNoiser(Noise):
         print(f"Training chargram model with chargram length {chargram_length}...")
         chargram_models = dict() # contains chargram_models for all cgram lengths <= chargram_length
         for n in range(1, chargram_length + 1):
-            chargram_model = defaultdict(lambda: defaultdict(lambda: 0)) # {prefix: {suffix: count}}
+            chargram_model = defaultdict(partial(defaultdict, int)) # {prefix: {suffix: count}}
 
             for word, freq in self.vocab.items():
                 word = "!" + word # Add start token
@@ -115,7 +194,7 @@ class GlobalMorphologicalNoiser(Noise):
         print(f"Training chargram model with chargram length {chargram_length}...")
         chargram_models = dict() # contains chargram_models for all cgram lengths <= chargram_length
         for n in range(1, chargram_length + 1):
-            chargram_model = defaultdict(lambda: defaultdict(lambda: 0)) # {prefix: {suffix: count}}
+            chargram_model = defaultdict(partial(defaultdict, int)) # {prefix: {suffix: count}}
 
             for word, freq in self.suffix_freq.items():
                 word = "!" + word # Add start token
@@ -133,7 +212,7 @@ class GlobalMorphologicalNoiser(Noise):
         '''
         This function is for generating a non-word using the character n-gram model. We will:
         1. Sample the length of the non-word from a Poisson centered around mean_length
-        2. Use self.chargram_models to generate the rest of the non-word based on the length of prefix
+        2. Use self.compiled_chargram_model to generate the rest of the non-word based on the length of prefix
 
         Note that we are generating suffixes (but it's the same thing in principle).
         Args:
@@ -145,112 +224,71 @@ class GlobalMorphologicalNoiser(Noise):
 
         length = max(1, rng.poisson(mean_length))
         length += 1
-        word = "!" + init_prefix
-
-        # while word == "!" + init_prefix:
-            # If generated word in vocab, generate another word
-        # word = "!"
-        for _ in range(length):
-            if len(word) < self.chargram_length-1:
-                # If the word is shorter than the length of the chargram model, 
-                # we will apply chargram model of the length of the word
-                chargram_model = self.chargram_models[len(word) + 1]
-                prefix = word
-            else:
-                # If the word is longer than the prefix of the chargram model, 
-                # we will apply the chargram model of the length of the model
-                chargram_model = self.chargram_models[self.chargram_length]
-                prefix = word[-(self.chargram_length-1):]
-            while len(list(chargram_model[prefix].keys())) == 0:
-                # Backing off to shorter chargram models
-                chargram_model = self.chargram_models[len(prefix)]
-                prefix = prefix[1:]
-            # print(list(chargram_model[prefix].keys()))
-            # print(len(list(chargram_model[prefix].keys())))
-
-            # Sample the next character based on the prefix
-            try:
-                # next_char = rng.choice(list(chargram_model[prefix].keys()), \
-                #         p=np.array(list(chargram_model[prefix].values())) / sum(chargram_model[prefix].values()))
-                # Pick max char
-
-                next_char = max(chargram_model[prefix], key=chargram_model[prefix].get)
-
-            except:
-                print(f"Error: {prefix} not in chargram model")
-                # print(f"Chargram model: {chargram_model}")
-                print(f"Word: {word}")
-                print(f"Length: {length}")
-                print(f"Mean Length: {mean_length}")
-                print(f"Chargram Length: {self.chargram_length}")
-                print(f"Prefix: {prefix}")
-                print(f"{not chargram_model[prefix]}")
-                print(f"Chargram model: {chargram_model[prefix].keys()}")
-
-                raise
-            word += next_char
-
-        return word[len(init_prefix) + 1:]
+
+        if not hasattr(self, "compiled_chargram_model"):
+            self.compiled_chargram_model = CompiledCharGramModel(self.chargram_models, self.chargram_length)
+
+        # Pick the most frequent next character at every step
+        # (we used to sample from the chargram model here instead)
+        return self.compiled_chargram_model.generate_argmax(length, prefix = "!" + init_prefix)
+
+    def generate_words(self, mean_lengths, init_prefixes):
+        '''Batched version of generate_word: generate one non-word per entry of mean_lengths,
+        all together, one character position at a time.
+        Args:
+            mean_lengths: list, mean length of each non-word
+            init_prefixes: list, prefix of each non-word
+        Returns:
+            list, list of non-words
+        '''
+        if len(mean_lengths) == 0:
+            return list()
+        lengths = np.maximum(1, rng.poisson(mean_lengths)) + 1
+
+        if not hasattr(self, "compiled_chargram_model"):
+            self.compiled_chargram_model = CompiledCharGramModel(self.chargram_models, self.chargram_length)
+
+        return self.compiled_chargram_model.generate_batch(lengths, prefixes = ["!" + prefix for prefix in init_prefixes], argmax = True)
     
 
-    def get_vocab(self, text_file):
-        '''Initialize vocabulary from vocab file'''
+    def get_vocab(self, text_file, corpus_stats = None):
+        '''Initialize vocabulary from the corpus statistics of text_file
+        Args:
+            text_file: str, path to text file
+            corpus_stats: CorpusStats, statistics of text_file, if already computed
+        '''
         print(f"Initializing vocabulary from {text_file}...")
-        vocab = defaultdict(lambda: 0)
-        for line in open(text_file):
-            words = line.strip().split()
-            for word in words:
-                # Remove punctuation
-                punctuation_and_bad_chars = "»«.,!?()[]{}\"'`:;'/\\-–—~_<>|@#$%^&*+=\u200b\u200c\u200d\u200e\u200f"
-                word = word.strip(punctuation_and_bad_chars)
-                # If word has numeric characters, skip
-                if any(char.isdigit() for char in word):
-                    continue
-                # All characters in word must be in character set
-                # if not all(char in self.character_set for char in word):
-                #     print(f"Not in character set: {word}")
-                #     continue
-                                
-                vocab[word.lower()] += 1
+        if corpus_stats is None:
+            max_tokens = TOKENS_PER_WORD * self.max_vocab_size if self.max_vocab_size is not None else None
+            corpus_stats = CorpusStats(text_file, max_tokens = max_tokens)
+        # Remove punctuation. Unlike the lexical noiser, we do not restrict words to the character set
+        vocab = corpus_stats.get_vocab(strip_chars = PUNCTUATION_AND_BAD_CHARS, min_freq = self.min_freq, \
+                                            max_vocab_size = self.max_vocab_size)
         print(f"Finished initializing vocabulary from {text_file}!")
         print(f"Length of vocab: {len(vocab)}")
 
         return vocab
 
 
-    def get_tag2wordlist(self):
-        '''Get tag2wordlist from the JSON file'''
-        with open(ud_wordlists_paths[self.lang]) as f:
-            tag2wordlist = json.load(f)
-        return tag2wordlist
-
     def is_word_functional(self, word):
         '''Check if word is functional'''
-        for tag in self.tag2wordlist:
-            if tag == "AUX".casefold(): # AUX words *can* be affected by morphological change
-                continue
-            if word in self.tag2wordlist[tag]:
-                return True
-        return False
+        return word in self.functional_words
 
-    def get_suffix_frequency(self):
+    def get_suffix_frequency(self, corpus_stats = None):
         '''Get suffix frequency map from vocab
         Args:
-            vocab: dict, vocabulary of type {word: count}
+            corpus_stats: CorpusStats, statistics of text_file, if already computed
         Returns:
             suffix_freq: dict, contains the frequency of each suffix
             most_frequent_word_per_suffix: dict, contains the most frequent word for each suffix. This is 
                 used to condition the new suffix on the stem of the word if the suffix is swapped
         '''
-        suffix_freq = defaultdict(lambda: 0)
-        most_frequent_word_per_suffix = defaultdict(lambda: ("", 0))
-        for word in self.vocab:
-            for i in range(1, round(len(word)/2) + 1): #only allow half the word to be a suffix
-                suffix_freq[word[-i:]] += self.vocab[word]
-                if self.vocab[word] > most_frequent_word_per_suffix[word[-i:]][1]:
-                    most_frequent_word_per_suffix[word[-i:]] = (word, self.vocab[word])
-
-        return suffix_freq, most_frequent_word_per_suffix
+        if corpus_stats is None:
+            max_tokens = TOKENS_PER_WORD * self.max_vocab_size if self.max_vocab_size is not None else None
+            corpus_stats = CorpusStats(self.text_file, max_tokens = max_tokens)
+        # Same vocabulary as self.vocab, so we can use the suffix counts of the corpus statistics
+        return corpus_stats.get_suffix_frequency(strip_chars = PUNCTUATION_AND_BAD_CHARS, min_freq = self.min_freq, \
+                                                      max_vocab_size = self.max_vocab_size)
 
     def filter_suffix_frequency(self):
         '''
@@ -259,7 +297,7 @@ class GlobalMorphologicalNoiser(Noise):
         '''
         self.suffix_freq = {suffix: freq for suffix, freq in self.suffix_freq.items() if freq > 20}
         self.suffix_freq = {suffix: freq for suffix, freq in self.suffix_freq.items() if len(suffix) > 1}
-        self.suffix_freq = defaultdict(lambda: 0, self.suffix_freq)
+        self.suffix_freq = defaultdict(int, self.suffix_freq)
 
     def filter_suffix_topk(self, k=200):
         '''
@@ -275,7 +313,7 @@ class GlobalMorphologicalNoiser(Noise):
         self.suffix_freq = {suffix: freq for suffix, freq in self.suffix_freq.items() if len(suffix) > 1}
         sorted_suffixes = sorted(self.suffix_freq, key=lambda x: self.suffix_freq[x], reverse=True)
         self.suffix_freq = {suffix: self.suffix_freq[suffix] for suffix in sorted_suffixes[:k]}
-        self.suffix_freq = defaultdict(lambda: 0, self.suffix_freq)
+        self.suffix_freq = defaultdict(int, self.suffix_freq)
 
 
     def construct_suffix_map_with_char_lm(self):
@@ -289,18 +327,20 @@ class GlobalMorphologicalNoiser(Noise):
             suffix: suffix for suffix in self.suffix_freq
         }
 
+        suffixes_to_switch = list()
+        prefixes = list()
         for suffix in tqdm(suffix_map):
             if random.random() > self.theta_morph_global:
                 continue
             most_freq_word = self.most_frequent_word_per_suffix[suffix][0]
             prefix = most_freq_word[:-len(suffix)]
-            new_suffix = self.generate_word(len(suffix), init_prefix = prefix)
-            suffix_map[suffix] = new_suffix
+            suffixes_to_switch.append(suffix)
+            prefixes.append(prefix)
 
-            # print(f"Suffix: {suffix}")
-            # print(f"Most frequent word: {most_freq_word}")
-            # print(f"Prefix: {prefix}")
-            # print(f"New Suffix: {new_suffix}")
+        # Generate all new suffixes at once
+        new_suffixes = self.generate_words([len(suffix) for suffix in suffixes_to_switch], prefixes)
+        for suffix, new_suffix in zip(suffixes_to_switch, new_suffixes):
+            suffix_map[suffix] = new_suffix
 
         return suffix_map
 
@@ -308,6 +348,8 @@ class GlobalMorphologicalNoiser(Noise):
         '''
         We'll toss a coin for each suffix based on theta_morph_global.
         Then we'll map each chosen suffix to a new suffix
+        The draws for a suffix are keyed by (seed, noiser, suffix), so they do not depend on the
+        other suffixes, or on their order (see utils/rng.py).
         Returns:
             suffix_map: dict, mapping of old suffix to new suffix        
         '''
@@ -315,10 +357,12 @@ class GlobalMorphologicalNoiser(Noise):
             suffix: suffix for suffix in self.suffix_freq
         }
 
-        for suffix in tqdm(suffix_map):
-            if random.random() > self.theta_morph_global:
+        suffixes = list(suffix_map)
+        swap_u = counter_uniforms(key_hashes((self.seed, self.class_name), suffixes), 0)
+        for suffix, u in zip(tqdm(suffixes), swap_u):
+            if u >= self.theta_morph_global:
                 continue
-            new_suffix = self.phon_noiser.apply_noise_for_sure(suffix)
+            new_suffix = self.phon_noiser.apply_noise_for_sure(suffix, KeyedRandom(self.seed, self.class_name, suffix))
             suffix_map[suffix] = new_suffix
 
             # print(f"Suffix: {suffix}")
@@ -371,16 +415,15 @@ class GlobalMorphologicalNoiser(Noise):
         # Now we'll map each suffix to a new suffix
         ## We would like to condition the new suffix on the stems of the words preceding the suffix.
         ## In practice, we only take the most common such stem and use that as a prefix.
-        for suffix in tqdm(set(sampled_suffixes)):
+        suffixes_to_switch = list(set(sampled_suffixes))
+        prefixes = list()
+        for suffix in suffixes_to_switch:
             most_freq_word = self.most_frequent_word_per_suffix[suffix][0]
-            prefix = most_freq_word[:-len(suffix)]
-            new_suffix = self.generate_word(len(suffix), init_prefix = prefix)
-            suffix_map[suffix] = new_suffix
+            prefixes.append(most_freq_word[:-len(suffix)])
 
-            # print(f"Suffix: {suffix}")
-            # print(f"Most frequent word: {most_freq_word}")
-            # print(f"Prefix: {prefix}")
-            # print(f"New Suffix: {new_suffix}")
+        new_suffixes = self.generate_words([len(suffix) for suffix in suffixes_to_switch], prefixes)
+        for suffix, new_suffix in zip(suffixes_to_switch, new_suffixes):
+            suffix_map[suffix] = new_suffix
 
         return suffix_map
     
@@ -393,40 +436,55 @@ class GlobalMorphologicalNoiser(Noise):
         '''
         vocab_map = dict()
         for word in self.vocab:
-
-            # We will not noise functional words: EXCEPT auxiliaries
-            # This is the compromise we make, because many languages have morphologically complex 
-            # auxiliaries.
-            if self.is_word_functional(word):
-                vocab_map[word] = word
-                continue
-
-            # Get all suffixes of the word
-            suffixes = [word[-i:] for i in range(1, len(word))]
-            # Get the suffixes that are present in suffix_freq
-            suffixes = [suffix for suffix in suffixes if suffix in self.suffix_freq]
-            if len(suffixes) == 0:
-                vocab_map[word] = word
-                continue
-            
-            ### We could sample a suffix based on frequency BUT this would mean we always
-            ### pick the shortest.
-            # # Get weights based on log frequency
-            # # weights = np.log(np.array([self.suffix_freq[suffix] for suffix in suffixes]) + 1)
-            # # Get weights based on log frequency
-            # weights = np.array([self.suffix_freq[suffix] for suffix in suffixes])
-            # weights = weights / sum(weights)
-            # # Sample a suffix
-            # sampled_suffix = rng.choice(suffixes, 1, p=weights)[0]
-            # Swap out the suffix
-
-            # Instead, let's just pick the longest suffix:
-            sampled_suffix = max(suffixes, key=lambda x: len(x))
-            new_word = word[:-len(sampled_suffix)] + self.suffix_map[sampled_suffix]
-            vocab_map[word] = new_word
+            vocab_map[word] = self.map_word(word)
         
         return vocab_map
 
+    def map_word(self, word):
+        '''Get the new word for a word of the vocabulary (see construct_new_vocab)
+        Args:
+            word: str, lowercased word, stripped of punctuation
+        Returns:
+            str, new word
+        '''
+        # We will not noise functional words: EXCEPT auxiliaries
+        # This is the compromise we make, because many languages have morphologically complex 
+        # auxiliaries.
+        if self.is_word_functional(word):
+            return word
+
+        # Get the longest suffix of the word (but not the whole word) that is present in suffix_freq
+        sampled_suffix = self.suffix_trie.longest_suffix(word, max_length = len(word) - 1)
+        if sampled_suffix is None:
+            return word
+        
+        ### We could sample a suffix based on frequency BUT this would mean we always
+        ### pick the shortest.
+        # # Get weights based on log frequency
+        # # weights = np.log(np.array([self.suffix_freq[suffix] for suffix in suffixes]) + 1)
+        # # Get weights based on log frequency
+        # weights = np.array([self.suffix_freq[suffix] for suffix in suffixes])
+        # weights = weights / sum(weights)
+        # # Sample a suffix
+        # sampled_suffix = rng.choice(suffixes, 1, p=weights)[0]
+        # Swap out the suffix
+
+        # Instead, let's just pick the longest suffix (see above)
+        return word[:-len(sampled_suffix)] + self.suffix_map[sampled_suffix]
+
+    def noise_unseen_word(self, word):
+        '''Online noising: map an unseen word in the same way as the words of the vocabulary, and
+        add it to the vocab map. The suffix map covers every suffix that a word can be matched to,
+        so this needs no random decisions, and does not depend on the order of words.
+        Args:
+            word: str, lowercased word, stripped of punctuation
+        '''
+        # Only words that could have been in the vocabulary
+        match = self.word_regex.fullmatch(word)
+        if word == "" or match is None or match.group(1) != word:
+            return
+        self.vocab_map[word] = self.map_word(word)
+
     def get_suffix_map_stats(self):
         '''
         Get stats of suffix map
@@ -448,8 +506,12 @@ class GlobalMorphologicalNoiser(Noise):
         stats["vocab_size"] = len(self.vocab)
         stats["content_words"] = len([word for word in self.vocab if not self.is_word_functional(word)])
         stats["func_words"] = len([word for word in self.vocab if self.is_word_functional(word)])
-        stats["content_words_noised_frac"] = round(len([word for word in self.vocab_map if not self.is_word_functional(word) \
+        # Words added by online noising are not part of the vocabulary
+        stats["content_words_noised_frac"] = round(len([word for word in self.vocab if not self.is_word_functional(word) \
                                                  and self.vocab_map[word] != word]) / stats["content_words"], 2)
+        if self.online:
+            stats["online_words"] = len(self.vocab_map) - len(self.vocab)
+        stats["memo"] = self.word_memo.get_stats()
         return stats
    
     def apply_noise(self, input):
@@ -459,40 +521,60 @@ class GlobalMorphologicalNoiser(Noise):
         Returns:
             str, noised text
         '''
-        # Apply noise
-        # For each word, map it to the corresponding word using the vocab map self.vocab_map
+        return " ".join(self.apply_noise_to_words(input.split()))
 
+    def apply_noise_to_words(self, words):
+        '''Apply noise to a pre-tokenized input
+        Args:
+            words: list, list of input words
+        Returns:
+            list, list of noised words
+        '''
+        # Every input word always maps to the same noised word, so we memoize them
         noised_input = list()
-        for input_word in input.split():
+        for input_word in words:
+            noised_word = self.word_memo.get(input_word)
+            if noised_word is None:
+                noised_word = self.noise_word(input_word)
+                self.word_memo.put(input_word, noised_word)
+            noised_input.append(noised_word)
+        return noised_input
+
+    def noise_word(self, input_word):
+        '''Map a word to the corresponding word using the vocab map self.vocab_map
+        Args:
+            input_word: str, input word, possibly capitalized and with punctuation
+        Returns:
+            str, noised word
+        '''
+        if input_word[0].isupper():
+            # We do not affect proper nouns
+            return input_word
+        word = input_word.strip(".,!?").lower()
+        if word not in self.vocab_map and self.online:
+            self.noise_unseen_word(word)
+        if word in self.vocab_map:
+            mapped_word = self.vocab_map[word]
+            # Capitalize first letter if original word was capitalized
             if input_word[0].isupper():
-                # We do not affect proper nouns
-                noised_input.append(input_word)
-                continue
-            word = input_word.strip(".,!?").lower()
-            if word in self.vocab_map:
-                mapped_word = self.vocab_map[word]
-                # Capitalize first letter if original word was capitalized
-                if input_word[0].isupper():
-                    mapped_word = mapped_word.capitalize()
-                # Add punctuation back
-                if input_word[-1] in ".,!?":
-                    mapped_word += input_word[-1]
-                noised_input.append(mapped_word)
-            else:
-                noised_input.append(input_word)
-        return " ".join(noised_input)
+                mapped_word = mapped_word.capitalize()
+            # Add punctuation back
+            if input_word[-1] in ".,!?":
+                mapped_word += input_word[-1]
+            return mapped_word
+        return input_word
 
     def record_noiser_artifacts(self):
         '''Record vocab map, number of words switched out'''
 
         if hasattr(self, "output_dir"):
             with open(f"{self.output_dir}/morph_suffix_map.json", "w") as f:
-                json.dump(self.suffix_map, f, indent=2, ensure_ascii=False)
+                json.dump(dict(self.suffix_map), f, indent=2, ensure_ascii=False)
             stats = self.get_suffix_map_stats()
             with open(f"{self.output_dir}/morph_suffix_stats.json", "w") as f:
                 json.dump(stats, f, indent=2, ensure_ascii=False)
             with open(f"{self.output_dir}/morph_vocab_map.json", "w") as f:
-                json.dump(self.vocab_map, f, indent=2, ensure_ascii=False) 
+                json.dump(dict(self.vocab_map), f, indent=2, ensure_ascii=False) 
             stats = self.get_vocab_map_stats()
             with open(f"{self.output_dir}/morph_vocab_stats.json", "w") as f:
                 json.dump(stats, f, indent=2, ensure_ascii=False)
@@ -511,6 +593,9 @@ class GlobalMorphologicalNoiser(Noise):
         Returns:
             MLE estimate of self.theta_global
         '''
+        # SciPy is only needed here, so noisers can be built and applied without it
+        from scipy.stats import chisquare
+
         vocab1 = self.get_vocab(text1)
         vocab2 = self.get_vocab(text2)
 
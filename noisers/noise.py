@@ -1,4 +1,21 @@
+import copy
+import importlib
+
+from utils.snapshot import Snapshot, write_snapshot
+
 class Noise:
+    # Whether apply_noise is a pure function of its input once the noiser is built,
+    # i.e. it does not draw random numbers at noising time
+    deterministic = False
+    # Names of the attributes that save_snapshot stores as maps ({str: str}, {str: int} or
+    # {str: list of str}). None if the noiser does not support snapshots.
+    snapshot_maps = None
+    # Names of the thetas that with_theta can lower without rebuilding the noiser
+    sweep_params = set()
+    # Whether __init__ accepts a corpus_stats argument, so that get_noisers in main.py can share
+    # one pass over text_file between the noisers built on it
+    uses_corpus_stats = False
+
     def __init__(self, noise_params):
         '''Initialize noise with noise parameters
         Args:
@@ -33,6 +50,133 @@ class Noise:
         '''
         raise NotImplementedError
 
+    def apply_noise_to_words(self, words):
+        '''Apply noise to a pre-tokenized input
+        Args:
+            words: list, list of input words
+        Returns:
+            list, list of noised words
+        '''
+        return self.apply_noise(" ".join(words)).split()
+
+    def save_snapshot(self, path):
+        '''Save the maps and scalar parameters of the noiser to a binary snapshot, which can be
+        loaded back with load_snapshot. See utils/snapshot.py for the format.
+        Args:
+            path: str, path to snapshot file
+        '''
+        if self.snapshot_maps is None:
+            raise NotImplementedError(f"{self.class_name} does not support snapshots")
+        params = {key: value for key, value in self.__dict__.items() \
+                  if isinstance(value, (str, int, float, bool)) or value is None}
+        maps = {name: getattr(self, name) for name in self.snapshot_maps}
+        # The module is stored with the class, so that load_snapshot can import it
+        write_snapshot(path, f"{type(self).__module__}:{type(self).__name__}", params, maps)
+        print(f"Saved {self.class_name} snapshot to {path}")
+
+    @classmethod
+    def load_snapshot(cls, path, lazy = True):
+        '''Load a noiser from a snapshot saved with save_snapshot. The noiser is not rebuilt from
+        its text file: its maps come from the snapshot, and init_from_snapshot restores the rest.
+        Args:
+            path: str, path to snapshot file
+            lazy: bool, keep maps as read-only views over the mmapped snapshot instead of loading
+                them into dicts
+        Returns:
+            Noise, noiser of the class it was saved from (cls or a subclass of cls)
+        '''
+        snapshot = Snapshot(path)
+        module_name, _, class_name = snapshot.class_name.rpartition(":")
+        if module_name:
+            # Noiser modules are imported lazily (see NOISE_REGISTRY in main.py)
+            importlib.import_module(module_name)
+        noiser_class = cls._find_subclass(class_name)
+        if noiser_class is None:
+            raise ValueError(f"Snapshot {path} is of class {class_name}, not {cls.__name__}")
+        noiser = noiser_class.__new__(noiser_class)
+        for key, value in snapshot.params.items():
+            setattr(noiser, key, value)
+        for name in noiser_class.snapshot_maps:
+            setattr(noiser, name, snapshot.get_map(name, lazy = lazy))
+        noiser.init_from_snapshot()
+        return noiser
+
+    @classmethod
+    def _find_subclass(cls, class_name):
+        '''Find the class called class_name among cls and its subclasses'''
+        if cls.__name__ == class_name:
+            return cls
+        for subclass in cls.__subclasses__():
+            found = subclass._find_subclass(class_name)
+            if found is not None:
+                return found
+        return None
+
+    def with_seed(self, seed):
+        '''Derive a noiser that only differs from this one in its seed. The state that does not
+        depend on the seed (vocabulary, chargram models, suffix tables, ...) is shared with this
+        noiser, and reseed only rebuilds the maps that do.
+        Args:
+            seed: int, seed of the new noiser
+        Returns:
+            Noise, noiser of the same class
+        '''
+        noiser = copy.copy(self)
+        noiser.seed = int(seed)
+        noiser.reseed()
+        return noiser
+
+    def reseed(self):
+        '''Rebuild the state that depends on self.seed, after with_seed. The other attributes
+        are shared with the noiser this one was derived from, so they must not be modified in place.
+        Noisers that only draw random numbers at noising time have nothing to rebuild.
+        '''
+        pass
+
+    def with_theta(self, theta_name, theta):
+        '''Derive a noiser that only differs from this one in a lower value of a theta, e.g. for a
+        sweep over theta (see sweep). Every item (word, suffix, trigram) is changed if its keyed
+        uniform draw is below theta, and its replacement does not depend on theta (see utils/rng.py).
+        So the items changed at theta are a subset of the ones changed at the current value, with
+        the same replacements, and rethreshold only has to undo the changes of the other items.
+        Args:
+            theta_name: str, name of the theta, one of sweep_params
+            theta: float, new value, at most the current value
+        Returns:
+            Noise, noiser of the same class
+        '''
+        if theta_name not in self.sweep_params:
+            raise ValueError(f"{self.class_name} cannot sweep over {theta_name}")
+        if theta > getattr(self, theta_name):
+            raise ValueError(f"Cannot raise {theta_name} of {self.class_name} from {getattr(self, theta_name)} to {theta}")
+        noiser = copy.copy(self)
+        setattr(noiser, theta_name, float(theta))
+        noiser.rethreshold(theta_name)
+        return noiser
+
+    def sweep(self, theta_name, thetas):
+        '''Derive noisers for several values of a theta from one construction
+        Args:
+            theta_name: str, name of the theta, one of sweep_params
+            thetas: list, values of the theta, each at most the current value
+        Returns:
+            list, one noiser per value
+        '''
+        return [self.with_theta(theta_name, theta) for theta in thetas]
+
+    def rethreshold(self, theta_name):
+        '''Undo the changes of the items whose draws are not below the new value of theta_name,
+        after with_theta. The other attributes are shared with the noiser this one was derived
+        from, so they must not be modified in place.
+        '''
+        raise NotImplementedError(f"{self.class_name} does not support sweeps")
+
+    def init_from_snapshot(self):
+        '''Restore the state of a noiser loaded from a snapshot that is not part of the snapshot,
+        e.g. tables derived from the maps. Scalar parameters and maps are already set.
+        '''
+        pass
+
     def record_noiser_artifacts(self):
         '''Save noiser artifacts to output file
         '''
@@ -3,39 +3,58 @@ import random
 import os
 from collections import defaultdict
 import json
-from utils.misc import normalize_lang_codes, get_character_set, identify_script, ipa_char_maps, get_equivalence_classes_ipa
+from utils.misc import normalize_lang_codes, get_character_set, get_character_set_regex, identify_script, ipa_char_maps, get_equivalence_classes_ipa
+from utils.corpus_stats import CorpusStats
+from utils.memo import WordMemo, DEFAULT_MEMO_SIZE
+from utils.rng import KeyedRandom, DEFAULT_SEED, key_hashes, counter_uniforms
 
-random.seed(42)
 
 class GlobalPhonologicalNoiser(Noise):
-    def __init__(self, noise_params):
+    deterministic = True
+    snapshot_maps = ["chargram_map", "target_chars", "vocab_map"]
+    uses_corpus_stats = True
+    sweep_params = {"theta_phon"}
+
+    def __init__(self, noise_params, corpus_stats = None):
         '''Initialize phonological noiser with noise parameters
         Args:
             noise_params: dict, noise parameters, like {theta_1: 0.5}
+            corpus_stats: CorpusStats, statistics of text_file, if already computed
             Should contain:
                 lang: str, language code
                 text_file: str, path to text file
                 theta_phon: float, probability of phonological noise
             Also accepts:
                 output_dir: str, path to output directory
+                memo_size: int, maximum number of words to memoize in apply_noise
+                seed: int, seed for the decisions that build the chargram map (default: 42)
 
         '''
         self.class_name = "GlobalPhonologicalNoiser"
         self.required_keys = {"lang", "text_file", "theta_phon"}
-        self.allowed_keys = {"output_dir"}
+        self.allowed_keys = {"output_dir", "memo_size", "seed"}
         self.check_noise_params(noise_params)
 
         for key in noise_params:
             setattr(self, key, noise_params[key])
 
         self.lang = normalize_lang_codes(self.lang)
+        if not hasattr(self, "memo_size"):
+            self.memo_size = DEFAULT_MEMO_SIZE
+        self.word_memo = WordMemo(int(self.memo_size))
+        self.seed = int(getattr(self, "seed", DEFAULT_SEED))
         script, self.character_set = get_character_set(self.lang)
+        self.character_set_regex = get_character_set_regex(self.character_set)
+
+        if corpus_stats is None:
+            corpus_stats = CorpusStats(self.text_file)
 
         # Creates a mapping from each character to a set of characters that are equivalent to it in the script
         self.target_chars = self.create_equivalence_set_for_script_chars()
         self.filter_target_chars()
 
-        self.chargram_map = self.construct_charmap_with_context()
+        self.chargram_map = self.construct_charmap_with_context(ngrams = list(self.get_ngrams_from_text(corpus_stats)))
+        self.rewrite_table = self.compile_rewrite_table()
 
         # For recording purposes
         self.vocab_map = dict()
@@ -43,6 +62,37 @@ class GlobalPhonologicalNoiser(Noise):
         if hasattr(self, "output_dir"):
             os.makedirs(self.output_dir, exist_ok=True)
 
+    def init_from_snapshot(self):
+        '''Restore the state that is derived from the noise parameters and the chargram map'''
+        self.word_memo = WordMemo(int(self.memo_size))
+        _, self.character_set = get_character_set(self.lang)
+        self.character_set_regex = get_character_set_regex(self.character_set)
+        # apply_noise_for_sure samples from sets of target characters, and noise_word records
+        # every input word in the vocab map, so these two are always loaded
+        self.target_chars = defaultdict(set, {char: set(target_set) for char, target_set in self.target_chars.items()})
+        self.vocab_map = dict(self.vocab_map)
+        self.rewrite_table = self.compile_rewrite_table()
+        if hasattr(self, "output_dir"):
+            os.makedirs(self.output_dir, exist_ok=True)
+
+    def reseed(self):
+        '''Rebuild the chargram map for a new seed (see Noise.with_seed). The map has the same
+        trigrams for any seed, so they are taken from the current map.'''
+        self.word_memo = WordMemo(int(self.memo_size))
+        self.vocab_map = dict()
+        self.chargram_map = self.construct_charmap_with_context(ngrams = list(self.chargram_map))
+        self.rewrite_table = self.compile_rewrite_table()
+
+    def rethreshold(self, theta_name):
+        '''Keep the changed chargrams whose draws are below the new theta_phon (see Noise.with_theta)'''
+        self.word_memo = WordMemo(int(self.memo_size))
+        self.vocab_map = dict()
+        ngrams = list(self.chargram_map)
+        swap_u = counter_uniforms(key_hashes((self.seed, self.class_name), ngrams), 0)
+        self.chargram_map = {ngram: self.chargram_map[ngram] if u < self.theta_phon else ngram \
+                             for ngram, u in zip(ngrams, swap_u)}
+        self.rewrite_table = self.compile_rewrite_table()
+
     def is_valid_word(self, word):
         '''Check if word is valid
         Args:
@@ -50,53 +100,48 @@ class GlobalPhonologicalNoiser(Noise):
         Returns:
             bool, whether word is valid
         '''
-        return all(char in self.character_set for char in word)
+        return self.character_set_regex.fullmatch(word) is not None
 
-    def get_ngrams_from_text(self):
-        '''Get words from text file
+    def get_ngrams_from_text(self, corpus_stats = None):
+        '''Get character trigrams of the distinct valid words of text_file, with < and > added
+        to denote start and end of word
+        Args:
+            corpus_stats: CorpusStats, statistics of text_file, if already computed
         Returns:
-            list, list of words
+            dict, {trigram: count}
         '''
-        words = set()
-        with open(self.text_file, "r") as f:
-            for line in f:
-                line_words = line.strip().split()
-                words.update({"<"+word+">" for word in line_words if self.is_valid_word(word)}) # Add < and > to denote start and end of word
-        
-        ngrams = defaultdict(lambda: 0)
-        n = 3
-        for word in words:
-            for i in range(len(word) - n + 1):
-                ngram = word[i:i+n]
-                ngrams[ngram] += 1
-        return ngrams
+        if corpus_stats is None:
+            corpus_stats = CorpusStats(self.text_file)
+        return corpus_stats.get_trigram_counts(self.character_set)
     
-    def sample_new_char_at_random(self, char):
+    def sample_new_char_at_random(self, char, rng = random):
         '''Sample a new character
         Args:
             char: str, character to sample new character for
+            rng: random.Random or the random module
         Returns:
             str, new character, maintain casing
         '''
-
-        new_char = random.choice(list(self.character_set - {char.lower()} - {char.upper()}))
+        # Sets are sorted, so that the same draw picks the same character in every process
+        new_char = rng.choice(sorted(self.character_set - {char.lower()} - {char.upper()}))
         if char.isupper():
             new_char = new_char.upper()
         if char.islower():
             new_char = new_char.lower()
         return new_char
     
-    def sample_new_char(self, char):
+    def sample_new_char(self, char, rng = random):
         '''Samples a new character. If the character is in the target set, samples from the target set. 
 
         Args:
             char: str, character to sample new character for
+            rng: random.Random or the random module
         Returns:
             str, new character, maintain casing
         '''
         if len(self.target_chars[char]) != 0:
 
-            new_char = random.choice(list(self.target_chars[char.lower()]))
+            new_char = rng.choice(sorted(self.target_chars[char.lower()]))
         
             if char.isupper():
                 new_char = new_char.upper()
@@ -121,7 +166,7 @@ class GlobalPhonologicalNoiser(Noise):
         _, _, equivalence_classes_ipa_per_char = get_equivalence_classes_ipa()
         self.equivalence_classes_ipa_per_char = equivalence_classes_ipa_per_char
         
-        target_chars = defaultdict(lambda: set())
+        target_chars = defaultdict(set)
         for char in self.character_set:
 
             if char in self.script_to_ipa_chars:
@@ -169,16 +214,22 @@ class GlobalPhonologicalNoiser(Noise):
             self.target_chars[char] = target_set - exclude_set
 
                 
-    def construct_charmap_with_context(self):
+    def construct_charmap_with_context(self, ngrams = None):
         '''
         Samples source characters given context to swap out globally, and creates a map.
+        The draws for a chargram are keyed by (seed, noiser, chargram), so they do not depend on
+        the other chargrams, or on their order (see utils/rng.py).
+        Args:
+            ngrams: list, trigrams to map (default: the trigrams of text_file)
         '''
         chargram_map = {}
-        ngrams = self.get_ngrams_from_text()
-        for ngram in ngrams:
-            if random.random() < self.theta_phon:
+        if ngrams is None:
+            ngrams = list(self.get_ngrams_from_text())
+        swap_u = counter_uniforms(key_hashes((self.seed, self.class_name), ngrams), 0)
+        for ngram, u in zip(ngrams, swap_u):
+            if u < self.theta_phon:
                 # We'll swap out the middle character
-                new_char = self.sample_new_char(ngram[1])
+                new_char = self.sample_new_char(ngram[1], KeyedRandom(self.seed, self.class_name, ngram))
                 if new_char == ngram[1]:
                     new_char = '0'
                 chargram_map[ngram] = ngram[0] + new_char + ngram[2]
@@ -189,6 +240,20 @@ class GlobalPhonologicalNoiser(Noise):
         return chargram_map
 
 
+    def compile_rewrite_table(self):
+        '''Compile self.chargram_map into a rewrite table for apply_noise. Only trigrams whose middle
+        character changes are kept, keyed by middle character and then by context.
+        Returns:
+            dict, {mid: {(left, right): new_mid}}, where new_mid is "" if the middle character is deleted
+        '''
+        rewrite_table = defaultdict(dict)
+        for ngram, new_ngram in self.chargram_map.items():
+            if new_ngram == ngram:
+                continue
+            new_mid = new_ngram[1] if new_ngram[1] != '0' else "" # '0' means delete
+            rewrite_table[ngram[1]][(ngram[0], ngram[2])] = new_mid
+        return dict(rewrite_table)
+
     def construct_charmap(self):
         '''
         Samples source characters to swap out globally, and creates a map.
@@ -215,41 +280,73 @@ class GlobalPhonologicalNoiser(Noise):
             words = input.split()
         else:
             words = input
+        return " ".join(self.apply_noise_to_words(words))
+
+    def apply_noise_to_words(self, words):
+        '''Apply phonological noise to a pre-tokenized input
+        Args:
+            words: list, list of input words
+        Returns:
+            list, list of noised words
+        '''
+        # Every input word always maps to the same noised word, so we memoize them
         noised_words = list()
         for word in words:
-            if word[0].isupper():
-                # We do not affect proper nouns
-                noised_words.append(word)
-                continue
-            noised_word = ""
-            if not self.is_valid_word(word):
-                noised_words.append(word)
-                continue
-            word = "<" + word + ">" # Add < and > to denote start and end of word
-            for i in range(len(word)):
-                if i == 0 or i == len(word) - 1:
-                    pass # Don't add EOS and BOS chars
-                else:
-                    ngram = word[i-1:i+2]
-                    if ngram in self.chargram_map:
-                        if self.chargram_map[ngram][1] != '0':
-                            noised_word += self.chargram_map[ngram][1]
-                        else:
-                            pass # Don't add the middle character - delete
-                    else:
-                        noised_word += word[i]
-
-            self.vocab_map[word[1:-1]] = noised_word # All input words go through this function
+            noised_word = self.word_memo.get(word)
+            if noised_word is None:
+                noised_word = self.noise_word(word)
+                self.word_memo.put(word, noised_word)
             noised_words.append(noised_word)
-        return " ".join(noised_words)
+        return noised_words
+
+    def noise_word(self, word):
+        '''Apply phonological noise to a word
+        Args:
+            word: str, input word
+        Returns:
+            str, noised word
+        '''
+        if word[0].isupper():
+            # We do not affect proper nouns
+            return word
+        if not self.is_valid_word(word):
+            return word
+        noised_word = self.rewrite_word(word)
+        self.vocab_map[word] = noised_word # All input words go through this function
+        return noised_word
+
+    def rewrite_word(self, word):
+        '''Rewrite every character of word whose trigram context (with < and > denoting start and
+        end of word) is changed in the chargram map
+        Args:
+            word: str, input word
+        Returns:
+            str, noised word
+        '''
+        rewrite_table = self.rewrite_table
+        # Most words have no character that is ever rewritten
+        if rewrite_table.keys().isdisjoint(word):
+            return word
+        padded = "<" + word + ">"
+        chars = list(word)
+        for i, mid in enumerate(word):
+            contexts = rewrite_table.get(mid)
+            if contexts is None:
+                continue
+            # The context of word[i] is padded[i] and padded[i+2]
+            new_mid = contexts.get((padded[i], padded[i+2]))
+            if new_mid is not None:
+                chars[i] = new_mid
+        return "".join(chars)
 
-    def apply_noise_for_sure(self, input):
+    def apply_noise_for_sure(self, input, rng = random):
         '''
         Change at least one character in the input for sure
         First, we apply noise as per usual. If nothing changes,
         we use the IPA maps directly to swap out at least one character
         Args:
             input: str, input text
+            rng: random.Random or the random module, for the characters we swap out
         Returns:
             str, noised text
         '''
@@ -262,7 +359,7 @@ class GlobalPhonologicalNoiser(Noise):
         if not self.is_valid_word(input):
             return input
         for idx, c in enumerate(input):
-            new_char = self.sample_new_char(c)
+            new_char = self.sample_new_char(c, rng)
             if c != new_char:
                 noised_word = input[:idx] + new_char + input[idx+1:]
 
@@ -270,8 +367,8 @@ class GlobalPhonologicalNoiser(Noise):
                 return noised_word
         
         # If we reach here, we haven't changed anything
-        idx = random.randint(0, len(input) - 1)
-        new_char = self.sample_new_char_at_random(input[idx])
+        idx = rng.randint(0, len(input) - 1)
+        new_char = self.sample_new_char_at_random(input[idx], rng)
         noised_word = input[:idx] + new_char + input[idx+1:]
         # print(f"Swapped: {noised_word}")
         assert noised_word != input
@@ -293,6 +390,7 @@ class GlobalPhonologicalNoiser(Noise):
         stats["num_chargrams_changed"] = len([cgram for cgram in self.chargram_map if self.chargram_map[cgram] != cgram])
         stats["total_chargrams"] = len(self.chargram_map)
         stats["frac_noised_chargrams"] = stats["num_chargrams_changed"] / stats["total_chargrams"]
+        stats["memo"] = self.word_memo.get_stats()
         
         return stats
 
@@ -308,7 +406,7 @@ class GlobalPhonologicalNoiser(Noise):
                 json.dump(source_to_target_set, f, indent=2, ensure_ascii=False)
 
             with open(f"{self.output_dir}/phon_chargram_map.json", "w") as f:
-                json.dump(self.chargram_map, f, indent=2, ensure_ascii=False)
+                json.dump(dict(self.chargram_map), f, indent=2, ensure_ascii=False)
             
             with open(f"{self.output_dir}/phon_vocab_map.json", "w") as f:
                 json.dump(self.vocab_map, f, indent=2, ensure_ascii=False)
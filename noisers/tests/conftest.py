@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import random
+
+import pytest
+
+# The noiser modules import each other as top-level modules (e.g. from noise import Noise), like
+# they do when run from noisers/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FUNCTIONAL_WORDS = {
+    "ADP": ["of", "in", "on", "to"],
+    "DET": ["the", "a", "this"],
+    "PRON": ["it", "we", "they"],
+    "CCONJ": ["and", "or"],
+    "AUX": ["is", "are", "was"],
+}
+STEMS = ["walk", "talk", "jump", "play", "work", "paint", "cook", "clean", "open", "call",
+         "help", "start", "climb", "kick", "pull", "push", "look", "wash", "fill", "mark"]
+SUFFIXES = ["", "s", "ed", "ing", "er", "ers"]
+NOUNS = ["river", "mountain", "garden", "window", "kitchen", "village", "forest", "market",
+         "teacher", "doctor", "bridge", "school", "café", "naïve", "résumé"]
+
+
+@pytest.fixture(scope="session")
+def functional_words(tmp_path_factory):
+    '''Point the English functional word list to a small fixture list, instead of the one
+    extracted from UD treebanks'''
+    import utils.get_functional_words as get_functional_words
+
+    path = tmp_path_factory.mktemp("functional_words") / "en.json"
+    path.write_text(json.dumps(FUNCTIONAL_WORDS))
+    get_functional_words.get_functional_word_index.cache_clear()
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setitem(get_functional_words.output_paths, "eng", str(path))
+        yield FUNCTIONAL_WORDS
+    get_functional_words.get_functional_word_index.cache_clear()
+
+
+@pytest.fixture(scope="session")
+def corpus_lines():
+    '''Sentences over a small English-like vocabulary, with shared stems for the suffixes'''
+    rng = random.Random(0)
+    words = [word for tag_words in FUNCTIONAL_WORDS.values() for word in tag_words] + NOUNS \
+            + [stem + suffix for stem in STEMS for suffix in SUFFIXES]
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(4, 12))).capitalize() + "." for _ in range(300)]
+
+
+@pytest.fixture(scope="session")
+def corpus_file(tmp_path_factory, functional_words, corpus_lines):
+    path = tmp_path_factory.mktemp("corpus") / "corpus.txt"
+    path.write_text("\n".join(corpus_lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture(scope="session")
+def noise_specs(corpus_file):
+    '''Noise parameter strings of the global noisers, as passed to main.py --all_noise_params_str'''
+    return {
+        "lexical": f"lexical-lang=en,theta_content_global=0.5,theta_func_global=0.8,text_file=<{corpus_file}>",
+        "morph": f"morph-lang=en,theta_morph_global=0.5,text_file=<{corpus_file}>",
+        "phonological": f"phonological-lang=en,theta_phon=0.3,text_file=<{corpus_file}>",
+    }
+
+
+@pytest.fixture(scope="session")
+def build_noiser(noise_specs):
+    '''Build the noiser of a noise type from its spec through main.get_noisers, with some of
+    its noise parameters overridden, e.g. build_noiser("lexical", seed = 7)'''
+    import main
+
+    def build(noise_type, **noise_params):
+        all_noise_params = main.parse_noise_params(noise_specs[noise_type])
+        all_noise_params[noise_type].update(noise_params)
+        return main.get_noisers(all_noise_params, cache_dir = "")[0]
+    return build
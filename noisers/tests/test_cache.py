@@ -0,0 +1,69 @@
+import random
+import sys
+
+import numpy as np
+
+import main
+
+SPEC = "character_level-lang=hi,swap_theta=0.3"
+LINES = ["यह एक छोटा वाक्य है।", "हम सब मिलकर काम करते हैं।", "नदी के किनारे एक गाँव था।"] * 5
+
+
+def noise_lines(cache_dir = "", seed = None):
+    '''Build the noisers of SPEC, and noise LINES right after, like main.py does'''
+    noise_classes = main.get_noisers(main.parse_noise_params(SPEC), seed = seed, cache_dir = cache_dir)
+    return [main.apply_noisers(line, noise_classes) for line in LINES]
+
+
+def scramble_rngs():
+    random.seed(12345)
+    np.random.seed(12345)
+
+
+def test_cache_hit_matches_miss(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    uncached = noise_lines()
+    scramble_rngs()
+    miss = noise_lines(cache_dir)
+    assert len(list((tmp_path / "cache").glob("*.pkl"))) == 1
+    hits = list()
+    for _ in range(2):
+        scramble_rngs()
+        hits.append(noise_lines(cache_dir))
+    assert miss == uncached
+    assert hits == [miss, miss]
+    # The noised lines are not all identical to their inputs, so the test draws random numbers
+    assert miss != LINES
+
+
+def test_cache_hit_per_seed(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    miss = [noise_lines(cache_dir, seed = seed) for seed in [1, 2]]
+    hits = [noise_lines(cache_dir, seed = seed) for seed in [1, 2]]
+    assert len(list((tmp_path / "cache").glob("*.pkl"))) == 2
+    assert hits == miss
+    assert miss[0] != miss[1]
+
+
+def test_seeding_on_import(monkeypatch, tmp_path):
+    # A plugin module that seeds the global RNGs when it is imported does not change the state
+    # that the other noisers start from
+    (tmp_path / "seeding_plugin.py").write_text(
+        "import random\n"
+        "import numpy as np\n"
+        "from noise import Noise\n"
+        "random.seed(0)\n"
+        "np.random.seed(0)\n"
+        "class SeedingNoiser(Noise):\n"
+        "    def __init__(self, noise_params):\n"
+        "        self.class_name = 'SeedingNoiser'\n"
+        "    def apply_noise(self, input):\n"
+        "        return input\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setitem(main.NOISE_REGISTRY, "seeding", "seeding_plugin:SeedingNoiser")
+    monkeypatch.delitem(main._noise_classes, "seeding", raising = False)
+    monkeypatch.delitem(sys.modules, "seeding_plugin", raising = False)
+
+    expected = noise_lines()
+    _, noiser = main.get_noisers(main.parse_noise_params(f"seeding-p=1;{SPEC}"), cache_dir = "")
+    assert [main.apply_noisers(line, [noiser]) for line in LINES] == expected
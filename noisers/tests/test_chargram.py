@@ -0,0 +1,117 @@
+from collections import defaultdict
+from functools import partial
+
+import numpy as np
+import pytest
+
+from utils.chargram import CompiledCharGramModel
+from utils.rng import key_hashes
+
+WORDS = ["banana", "bandana", "cabana", "ananas", "nab", "cab", "abba", "dab", "bad", "candy"]
+
+
+def train_chargram_models(words, chargram_length):
+    '''Dict models as trained by the lexical noiser: {n: {prefix: {char: count}}}'''
+    chargram_models = dict()
+    for n in range(1, chargram_length + 1):
+        chargram_model = defaultdict(partial(defaultdict, int))
+        for word in words:
+            word = "!" + word
+            for i in range(len(word) - n + 1):
+                ngram = word[i:i+n]
+                chargram_model[ngram[:-1]][ngram[-1]] += 1
+        chargram_models[n] = chargram_model
+    return chargram_models
+
+def dict_model_distribution(chargram_models, chargram_length, text):
+    '''Continuations of the longest suffix of text (up to chargram_length - 1 characters) that
+    has continuations in the dict models, with their probabilities'''
+    for k in range(min(chargram_length - 1, len(text)), -1, -1):
+        prefix = text[len(text) - k:]
+        counts = chargram_models[k + 1].get(prefix)
+        if counts:
+            continuations = sorted(counts)
+            p = np.array([counts[char] for char in continuations], dtype=float)
+            return continuations, p / p.sum()
+    raise AssertionError("no unigram distribution")
+
+def dict_model_sample(chargram_models, chargram_length, text, u):
+    continuations, p = dict_model_distribution(chargram_models, chargram_length, text)
+    cdf = p.cumsum()
+    cdf /= cdf[-1]
+    return continuations[cdf.searchsorted(u, side="right")]
+
+
+@pytest.mark.parametrize("chargram_length", [1, 2, 3])
+def test_cdf_matches_counts(chargram_length):
+    chargram_models = train_chargram_models(WORDS, chargram_length)
+    model = CompiledCharGramModel(chargram_models, chargram_length)
+    for n in range(1, chargram_length + 1):
+        for prefix, counts in chargram_models[n].items():
+            dist = model.resolved[model.encode(prefix)]
+            start, end = model.offsets[dist], model.offsets[dist + 1]
+            continuations, p = dict_model_distribution(chargram_models, chargram_length, prefix)
+            assert [model.chars[idx] for idx in model.char_idxs[start:end]] == continuations
+            np.testing.assert_allclose(model.cdf[start:end], p.cumsum() / p.sum())
+            assert model.cdf[end - 1] == 1.0
+
+@pytest.mark.parametrize("chargram_length", [2, 3])
+def test_backoff_matches_dict_model(chargram_length):
+    chargram_models = train_chargram_models(WORDS, chargram_length)
+    model = CompiledCharGramModel(chargram_models, chargram_length)
+    rng = np.random.RandomState(0)
+    # "z" and "é" are not known to the model, so contexts with them back off past them
+    alphabet = list("!abcdnyz") + ["é"]
+    for _ in range(500):
+        text = "".join(rng.choice(alphabet, size=rng.randint(0, 5)))
+        u = rng.random_sample()
+        expected = dict_model_sample(chargram_models, chargram_length, text, u)
+        assert model.chars[model.sample_next(model.encode(text), u)] == expected
+
+def test_generate_matches_dict_model():
+    chargram_length = 3
+    chargram_models = train_chargram_models(WORDS, chargram_length)
+    model = CompiledCharGramModel(chargram_models, chargram_length)
+    for seed in range(20):
+        generated = model.generate(8, prefix = "!", rng = np.random.RandomState(seed))
+        rng = np.random.RandomState(seed)
+        text = "!"
+        for _ in range(8):
+            text += dict_model_sample(chargram_models, chargram_length, text, rng.random_sample())
+        assert generated == text[1:]
+
+def test_generate_batch_rejects_vocab():
+    chargram_length = 3
+    model = CompiledCharGramModel(train_chargram_models(WORDS, chargram_length), chargram_length)
+    generated = model.generate_batch([6] * 20, reject = set(WORDS), rng = np.random.RandomState(0))
+    assert all(len(word) == 6 and word not in WORDS for word in generated)
+    # Without keys, strings of a batch are distinct
+    assert len(set(generated)) == len(generated)
+
+def test_generate_batch_keyed_does_not_depend_on_order():
+    chargram_length = 3
+    model = CompiledCharGramModel(train_chargram_models(WORDS, chargram_length), chargram_length)
+    names = [f"word{i}" for i in range(30)]
+    keys = key_hashes((42, "test"), names)
+    lengths = np.arange(30) % 5 + 2
+    generated = model.generate_batch(lengths, reject = set(WORDS), keys = keys)
+    order = np.random.RandomState(0).permutation(30)
+    shuffled = model.generate_batch(lengths[order], reject = set(WORDS), keys = keys[order])
+    assert [generated[i] for i in order] == shuffled
+    assert all(word not in WORDS for word in generated)
+
+def test_generate_batch_keyed_collisions():
+    chargram_length = 3
+    model = CompiledCharGramModel(train_chargram_models(WORDS, chargram_length), chargram_length)
+    # Many more strings of length 2 than the model generates with any probability, so that
+    # collisions are resolved by resampling, and then by longer strings
+    keys = key_hashes((42, "test"), [f"word{i}" for i in range(60)])
+    lengths = np.full(60, 2)
+    generated = model.generate_batch(lengths, reject = set(WORDS), keys = keys, max_rounds = 10)
+    assert len(set(generated)) == len(generated)
+    assert all(word not in WORDS for word in generated)
+    assert max(len(word) for word in generated) > 2
+    assert list(lengths) == [2] * 60
+    # The smallest key keeps its first string, whichever other keys are in the batch
+    first = int(np.argmin(keys))
+    assert generated[first] == model.generate_batch(lengths[[first]], reject = set(WORDS), keys = keys[[first]])[0]
@@ -0,0 +1,60 @@
+import pytest
+
+# Noise type, and the theta that with_theta changes
+THETAS = {
+    "lexical": "theta_content_global",
+    "morph": "theta_morph_global",
+    "phonological": "theta_phon",
+}
+
+
+def get_maps(noiser):
+    '''Maps of a noiser, in their order'''
+    return {name: list(getattr(noiser, name).items()) for name in noiser.snapshot_maps}
+
+
+def assert_same_noiser(noiser, other, corpus_lines):
+    # Maps first, since apply_noise records the words it sees in the vocab map
+    assert get_maps(noiser) == get_maps(other)
+    assert [noiser.apply_noise(line) for line in corpus_lines] == [other.apply_noise(line) for line in corpus_lines]
+
+
+@pytest.mark.parametrize("noise_type", list(THETAS))
+def test_build_twice(build_noiser, corpus_lines, noise_type):
+    assert_same_noiser(build_noiser(noise_type), build_noiser(noise_type), corpus_lines)
+
+
+@pytest.mark.parametrize("seed", [7, 12345])
+@pytest.mark.parametrize("noise_type", list(THETAS))
+def test_with_seed(build_noiser, corpus_lines, noise_type, seed):
+    noiser = build_noiser(noise_type)
+    maps = get_maps(noiser)
+    derived = noiser.with_seed(seed)
+    assert_same_noiser(derived, build_noiser(noise_type, seed = seed), corpus_lines)
+    assert get_maps(derived) != maps
+    # The noiser it was derived from is unchanged
+    assert get_maps(noiser) == maps
+
+
+@pytest.mark.parametrize("theta", [0.0, 0.1, 0.5, 0.9, 1.0])
+@pytest.mark.parametrize("noise_type", list(THETAS))
+def test_with_theta(build_noiser, corpus_lines, noise_type, theta):
+    theta_name = THETAS[noise_type]
+    noiser = build_noiser(noise_type, **{theta_name: 1.0})
+    maps = get_maps(noiser)
+    derived = noiser.with_theta(theta_name, theta)
+    assert_same_noiser(derived, build_noiser(noise_type, **{theta_name: theta}), corpus_lines)
+    assert get_maps(noiser) == maps
+
+
+@pytest.mark.parametrize("noise_type", list(THETAS))
+def test_with_theta_cannot_raise(build_noiser, noise_type):
+    # Items whose draws are above the current theta were never changed, so there is nothing to keep
+    noiser = build_noiser(noise_type, **{THETAS[noise_type]: 0.3})
+    with pytest.raises(ValueError):
+        noiser.with_theta(THETAS[noise_type], 0.5)
+
+
+def test_with_theta_function_words(build_noiser, corpus_lines):
+    derived = build_noiser("lexical", theta_func_global = 1.0).with_theta("theta_func_global", 0.2)
+    assert_same_noiser(derived, build_noiser("lexical", theta_func_global = 0.2), corpus_lines)
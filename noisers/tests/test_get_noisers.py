@@ -0,0 +1,40 @@
+import main
+from noise import Noise
+from utils.corpus_stats import TOKENS_PER_WORD
+
+
+class PlainNoiser(Noise):
+    '''Noiser with the plain constructor of plugin noisers, which also reads a text file'''
+
+    def __init__(self, noise_params):
+        self.class_name = "PlainNoiser"
+        self.required_keys = {"text_file"}
+        self.allowed_keys = {"max_vocab_size"}
+        self.check_noise_params(noise_params)
+        self.text_file = noise_params["text_file"]
+
+    def apply_noise(self, input):
+        return input.upper()
+
+
+def test_plain_noiser_with_text_file(monkeypatch, corpus_file, noise_specs, corpus_lines):
+    monkeypatch.setitem(main.NOISE_REGISTRY, "plain", PlainNoiser)
+    monkeypatch.delitem(main._noise_classes, "plain", raising = False)
+    all_noise_params = main.parse_noise_params(f"{noise_specs['lexical']};plain-text_file=<{corpus_file}>")
+    lexical, plain = main.get_noisers(all_noise_params, cache_dir = "")
+    assert isinstance(plain, PlainNoiser)
+    assert plain.text_file == corpus_file
+    assert plain.apply_noise(corpus_lines[0]) == corpus_lines[0].upper()
+    assert len(lexical.vocab_map) > 0
+
+
+def test_max_tokens_ignores_plain_noisers(monkeypatch, corpus_file):
+    monkeypatch.setitem(main.NOISE_REGISTRY, "plain", PlainNoiser)
+    monkeypatch.delitem(main._noise_classes, "plain", raising = False)
+    all_noise_params = {
+        "lexical": {"lang": "en", "text_file": corpus_file, "max_vocab_size": 100.0},
+        "plain": {"text_file": corpus_file},
+    }
+    assert main.get_max_tokens(all_noise_params, corpus_file) == TOKENS_PER_WORD * 100
+    all_noise_params["morph"] = {"lang": "en", "text_file": corpus_file}
+    assert main.get_max_tokens(all_noise_params, corpus_file) is None
@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.mark.parametrize("theta_content_global", [0.5, 1.0])
+def test_switched_content_words_are_distinct(build_noiser, theta_content_global):
+    noiser = build_noiser("lexical", theta_content_global = theta_content_global)
+    new_words = [new_word for word, new_word in noiser.vocab_map.items() \
+                 if new_word != word and not noiser.is_word_functional(word)]
+    assert len(new_words) > 0
+    # Distinct content words are not merged in the noised language
+    assert len(set(new_words)) == len(new_words)
+    assert not any(new_word in noiser.vocab for new_word in new_words)
@@ -0,0 +1,34 @@
+from utils.memo import WordMemo
+
+
+def test_capacity_cap():
+    memo = WordMemo(max_size = 3)
+    for idx in range(10):
+        memo.put(f"word{idx}", f"noised{idx}")
+    # Once full, new words are not added, and the words already in the memo are kept
+    assert memo.get_stats()["size"] == 3
+    assert [memo.get(f"word{idx}") for idx in range(5)] == ["noised0", "noised1", "noised2", None, None]
+
+
+def test_disabled():
+    memo = WordMemo(max_size = 0)
+    memo.put("word", "noised")
+    assert memo.get("word") is None
+    assert memo.get_stats()["size"] == 0
+
+
+def test_stats_and_clear():
+    memo = WordMemo(max_size = 2)
+    assert memo.get_stats()["hit_rate"] == 0.0
+    memo.put("a", "b")
+    memo.get("a")
+    memo.get("a")
+    memo.get("c")
+    assert memo.get_stats() == {"hits": 2, "misses": 1, "hit_rate": 0.6667, "size": 1, "max_size": 2}
+
+    memo.clear()
+    assert memo.get("a") is None
+    # Clearing frees capacity for new words
+    memo.put("x", "y")
+    memo.put("z", "w")
+    assert memo.get_stats()["size"] == 2
@@ -0,0 +1,81 @@
+import pickle
+
+import pytest
+
+from noise import Noise
+from utils.snapshot import Snapshot, SnapshotMap, write_snapshot
+
+MAPS = {
+    "words": {"walked": "wolked", "नमस्ते": "नमस्कार", "café": "kafé", "": "empty"},
+    "counts": {"ä": 3, "b": -1, "big": 2**40, "ß": 0},
+    "lists": {"walk": ["ed", "ing"], "ü": [], "set": {"z", "é", "a"}},
+    "empty": {},
+}
+
+
+def expected_map(mapping):
+    # Sets are stored sorted, and loaded as lists
+    return {key: sorted(value) if isinstance(value, set) else value for key, value in mapping.items()}
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    path = str(tmp_path / "maps.snap")
+    write_snapshot(path, "noise:Noise", {"lang": "hi", "theta": 0.5}, MAPS)
+    return path
+
+
+def test_header(snapshot_path):
+    snapshot = Snapshot(snapshot_path)
+    assert snapshot.class_name == "noise:Noise"
+    assert snapshot.params == {"lang": "hi", "theta": 0.5}
+    assert snapshot.map_kinds == {"words": "str", "counts": "int", "lists": "strlist", "empty": "str"}
+
+
+@pytest.mark.parametrize("name", list(MAPS))
+def test_get_map_eager(snapshot_path, name):
+    loaded = Snapshot(snapshot_path).get_map(name, lazy = False)
+    assert isinstance(loaded, dict)
+    assert loaded == expected_map(MAPS[name])
+    assert list(loaded) == list(MAPS[name])
+
+
+@pytest.mark.parametrize("name", list(MAPS))
+def test_get_map_lazy(snapshot_path, name):
+    loaded = Snapshot(snapshot_path).get_map(name)
+    assert isinstance(loaded, SnapshotMap)
+    expected = expected_map(MAPS[name])
+    # Iteration follows the order of the original map, lookups binary search the sorted keys
+    assert list(loaded) == list(expected)
+    assert len(loaded) == len(expected)
+    for key, value in expected.items():
+        assert key in loaded
+        assert loaded[key] == value
+    for missing in ["walke", "zzz", "नमस", 1, None]:
+        assert missing not in loaded
+        assert loaded.get(missing) is None
+    assert dict(pickle.loads(pickle.dumps(loaded))) == expected
+
+
+def test_errors(snapshot_path, tmp_path):
+    with pytest.raises(KeyError):
+        Snapshot(snapshot_path).get_map("missing")
+    path = tmp_path / "noisers.pkl"
+    path.write_bytes(b"not a snapshot")
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+@pytest.mark.parametrize("noise_type", ["lexical", "morph", "phonological"])
+def test_noiser_round_trip(build_noiser, corpus_lines, tmp_path, noise_type, lazy):
+    noiser = build_noiser(noise_type)
+    path = str(tmp_path / f"{noise_type}.snap")
+    noiser.save_snapshot(path)
+
+    loaded = Noise.load_snapshot(path, lazy = lazy)
+    assert type(loaded) is type(noiser)
+    for name in noiser.snapshot_maps:
+        # Noisers may turn loaded lists back into sets (see init_from_snapshot)
+        assert expected_map(getattr(loaded, name)) == expected_map(getattr(noiser, name)), name
+    assert [loaded.apply_noise(line) for line in corpus_lines] == [noiser.apply_noise(line) for line in corpus_lines]
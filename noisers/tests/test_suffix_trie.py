@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from utils.suffix_trie import SuffixTrie
+
+
+def brute_force_suffixes(suffixes, word, max_length = None):
+    '''Slice out every suffix of word and look it up, shortest first'''
+    if max_length is None:
+        max_length = len(word)
+    return [word[-i:] for i in range(1, min(max_length, len(word)) + 1) if word[-i:] in suffixes]
+
+
+def random_words(alphabet, n, max_length, rng):
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, max_length))) for _ in range(n)]
+
+
+@pytest.mark.parametrize("alphabet", ["abc", "अआइकखग्ा", "aäöüß"])
+def test_matches_brute_force(alphabet):
+    rng = random.Random(0)
+    suffixes = set(random_words(alphabet, 50, 4, rng))
+    trie = SuffixTrie(suffixes)
+    assert len(trie) == len(suffixes)
+
+    words = random_words(alphabet, 500, 8, rng) + [""]
+    for word in words:
+        for max_length in [None, 0, 1, 2, round(len(word)/2), len(word) + 3]:
+            expected = brute_force_suffixes(suffixes, word, max_length)
+            assert trie.matching_suffixes(word, max_length = max_length) == expected
+            assert trie.longest_suffix(word, max_length = max_length) == (expected[-1] if expected else None)
+
+
+def test_contains():
+    trie = SuffixTrie(["ing", "ed", "s", "ing"])
+    assert len(trie) == 3
+    assert "ing" in trie and "s" in trie
+    # Prefixes of the reversed path are not suffixes unless they were added
+    assert "ng" not in trie and "g" not in trie and "xing" not in trie
+    trie.add("ng")
+    assert "ng" in trie
+    assert trie.matching_suffixes("singing") == ["ng", "ing"]
+    assert trie.longest_suffix("walked") == "ed"
+    assert trie.longest_suffix("walk") is None
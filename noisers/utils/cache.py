@@ -0,0 +1,109 @@
+'''
+On-disk cache of built noisers.
+
+Jobs that use the same noise parameters on the same text files (e.g. the tasks of a SLURM array)
+would otherwise each rebuild the same vocabularies, chargram models and maps from scratch.
+We key each built list of noisers by the parsed noise parameters, the seed, a hash of the
+contents of every text_file, the noiser classes and CACHE_VERSION, and store it as a pickle,
+together with the state of the global RNGs after the build. Some noisers (e.g. character-level
+noise) draw from the global RNGs at noising time, so a cache hit restores that state, and noises
+exactly like the job that built the noisers.
+'''
+import hashlib
+import json
+import os
+import pickle
+import random
+import tempfile
+
+import numpy as np
+
+# Version of the pickled state of the noisers. Bump it whenever the attributes of a noiser change,
+# so that noisers pickled by older code are rebuilt instead of failing at noising time.
+CACHE_VERSION = 3
+
+# Parameters that do not affect the noiser that gets built
+UNCACHED_PARAMS = {"output_dir"}
+
+_file_hashes = dict()
+
+def hash_file(path, chunk_size=1 << 20):
+    '''Hash the contents of a file
+    Args:
+        path: str, path to file
+    Returns:
+        str, sha256 hex digest of the file contents
+    '''
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if memo_key not in _file_hashes:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha.update(chunk)
+        _file_hashes[memo_key] = sha.hexdigest()
+    return _file_hashes[memo_key]
+
+def get_cache_key(all_noise_params, seed, noise_class_types):
+    '''Get the cache key for a noise specification
+    Args:
+        all_noise_params: dict, noise parameters, like {phonological: {theta_1: 0.5}}
+        seed: int, seed used to build the noisers
+        noise_class_types: list, noiser class of each noise type
+    Returns:
+        str, cache key
+    '''
+    spec = list()
+    for (noise_type, noise_params), noise_class in zip(all_noise_params.items(), noise_class_types):
+        params = {key: value for key, value in noise_params.items() if key not in UNCACHED_PARAMS}
+        if "text_file" in params:
+            params["text_file"] = hash_file(params["text_file"])
+        spec.append([noise_type, f"{noise_class.__module__}:{noise_class.__qualname__}", params])
+    spec_str = json.dumps({"version": CACHE_VERSION, "noisers": spec, "seed": seed}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(spec_str.encode("utf-8")).hexdigest()
+
+def load_noisers(cache_dir, cache_key):
+    '''Load built noisers from the cache, and restore the state of the global RNGs after they
+    were built
+    Args:
+        cache_dir: str, cache directory
+        cache_key: str, cache key from get_cache_key
+    Returns:
+        list, list of noisers, or None if they are not in the cache
+    '''
+    cache_file = os.path.join(cache_dir, f"{cache_key}.pkl")
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with open(cache_file, "rb") as f:
+            entry = pickle.load(f)
+        noise_classes = entry["noise_classes"]
+        random_state, np_random_state = entry["rng_state"]
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, KeyError, TypeError, ValueError) as e:
+        print(f"WARNING: Could not load cached noisers from {cache_file}: {e}")
+        return None
+    random.setstate(random_state)
+    np.random.set_state(np_random_state)
+    print(f"Loaded noisers from cache: {cache_file}")
+    return noise_classes
+
+def save_noisers(cache_dir, cache_key, noise_classes):
+    '''Save built noisers to the cache, with the current state of the global RNGs. The file is
+    written atomically, since several jobs may build the same noisers at the same time.
+    Args:
+        cache_dir: str, cache directory
+        cache_key: str, cache key from get_cache_key
+        noise_classes: list, list of noisers
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_file = os.path.join(cache_dir, f"{cache_key}.pkl")
+    fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            entry = {"noise_classes": noise_classes, "rng_state": (random.getstate(), np.random.get_state())}
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+    print(f"Saved noisers to cache: {cache_file}")
@@ -0,0 +1,242 @@
+'''
+Compiled character n-gram model, for sampling non-words quickly.
+
+The noisers train chargram models as nested dicts of counts, {n: {prefix: {char: count}}}.
+Sampling a character from these means listing the continuations of a prefix and renormalizing
+them, for every character of every non-word. Here we compile the models once into arrays:
+    - Every character gets an integer index. A context (the last chargram_length - 1 characters
+      of the word so far, or fewer at the start of the word) is encoded as an integer in base
+      (#chars + 2), where digit 0 means "no character" and the last digit is any character the
+      model has not seen.
+    - Every prefix with continuations gets a distribution: a slice of a flat array of characters
+      and cumulative probabilities.
+    - Every context code is resolved ahead of time to the distribution of its longest suffix that
+      has continuations. This is the same backoff that generate_word did at sampling time.
+Note that the resolution table has (#chars + 2) ** (chargram_length - 1) entries.
+'''
+import numpy as np
+
+from utils.rng import counter_uniforms
+
+# Draws reserved per attempt at generating a keyed string, see generate_batch
+COUNTER_STRIDE = 1 << 16
+
+
+class CompiledCharGramModel:
+
+    def __init__(self, chargram_models, chargram_length):
+        '''Compile chargram models
+        Args:
+            chargram_models: dict, {n: model} for all n <= chargram_length,
+                model is of type {prefix: {char: count}}
+            chargram_length: int, char n-gram length
+        '''
+        self.chargram_length = chargram_length
+        self.context_length = chargram_length - 1
+
+        # Index characters
+        self.chars = list()
+        self.char2idx = dict()
+        for n in range(1, chargram_length + 1):
+            for prefix, counts in chargram_models[n].items():
+                for char in list(prefix) + list(counts):
+                    if char not in self.char2idx:
+                        self.char2idx[char] = len(self.chars)
+                        self.chars.append(char)
+        # Digit 0 is "no character", the last digit is an unseen character
+        self.base = len(self.chars) + 2
+        self.num_contexts = self.base ** self.context_length
+
+        # Flatten distributions of all prefixes with continuations
+        dist_codes = list()
+        offsets = [0]
+        char_idxs = list()
+        cdfs = list()
+        argmax_char_idxs = list()
+        for n in range(1, chargram_length + 1):
+            for prefix, counts in chargram_models[n].items():
+                if len(counts) == 0:
+                    continue
+                dist_codes.append(self.encode(prefix))
+                # Continuations are sorted, so that a uniform draw picks the same character
+                # whatever the order in which the model was trained (e.g. on a shuffled corpus)
+                continuations = sorted(counts)
+                # Same normalization as np.random.choice, so that sampling with the same
+                # uniform draw picks the same character
+                values = [counts[char] for char in continuations]
+                p = np.array(values) / sum(values)
+                cdf = p.cumsum()
+                cdf /= cdf[-1]
+                cdfs.append(cdf)
+                char_idxs.extend(self.char2idx[char] for char in continuations)
+                argmax_char_idxs.append(self.char2idx[max(continuations, key=counts.get)])
+                offsets.append(offsets[-1] + len(counts))
+
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.char_idxs = np.array(char_idxs, dtype=np.int64)
+        self.cdf = np.concatenate(cdfs)
+        self.argmax_char_idxs = np.array(argmax_char_idxs, dtype=np.int64)
+        # CDFs shifted by their distribution index, so that one searchsorted over the flat array
+        # samples from a different distribution for every row of a batch
+        self.shifted_cdf = self.cdf + np.repeat(np.arange(len(cdfs)), np.diff(self.offsets))
+        self.char_array = np.array(self.chars, dtype="<U1")
+
+        # Resolve every context code to the distribution of its longest suffix with continuations
+        exact = np.full(self.num_contexts, -1, dtype=np.int64)
+        exact[np.array(dist_codes, dtype=np.int64)] = np.arange(len(dist_codes))
+        if exact[0] < 0:
+            raise ValueError("Chargram model has no unigram distribution")
+        self.resolved = exact.copy()
+        for k in range(1, self.context_length + 1):
+            lo, hi = self.base ** (k - 1), self.base ** k
+            codes = np.arange(lo, hi)
+            # Dropping the first character of a context of length k is a mod by base ** (k - 1)
+            self.resolved[lo:hi] = np.where(exact[lo:hi] >= 0, exact[lo:hi], self.resolved[codes % lo])
+
+    def encode(self, text):
+        '''Encode the context at the end of text
+        Args:
+            text: str, text to encode. Characters not known to the model are never part of a
+                context with continuations, so we back off past them.
+        Returns:
+            int, context code
+        '''
+        if self.context_length == 0:
+            return 0
+        code = 0
+        for char in text[-self.context_length:]:
+            code = code * self.base + self.char2idx.get(char, len(self.chars)) + 1
+        return code
+
+    def update(self, code, char_idx):
+        '''Get the context code after appending a character to a context'''
+        return (code * self.base + char_idx + 1) % self.num_contexts
+
+    def sample_next(self, code, u):
+        '''Sample the next character index given a context code and a uniform draw in [0, 1)'''
+        dist = self.resolved[code]
+        start, end = self.offsets[dist], self.offsets[dist + 1]
+        return self.char_idxs[start + self.cdf[start:end].searchsorted(u, side="right")]
+
+    def generate(self, length, prefix = "!", rng = None):
+        '''Generate a string by sampling from the model
+        Args:
+            length: int, number of characters to generate
+            prefix: str, text to condition on (default: the start token)
+            rng: np.random.RandomState or the np.random module (default: np.random)
+        Returns:
+            str, generated characters, without the prefix
+        '''
+        if rng is None:
+            rng = np.random
+        code = self.encode(prefix)
+        generated = list()
+        for _ in range(length):
+            char_idx = self.sample_next(code, rng.random_sample())
+            generated.append(self.chars[char_idx])
+            code = self.update(code, char_idx)
+        return "".join(generated)
+
+    def generate_argmax(self, length, prefix = "!"):
+        '''Generate a string by always picking the most frequent next character
+        Args:
+            length: int, number of characters to generate
+            prefix: str, text to condition on (default: the start token)
+        Returns:
+            str, generated characters, without the prefix
+        '''
+        code = self.encode(prefix)
+        generated = list()
+        for _ in range(length):
+            char_idx = self.argmax_char_idxs[self.resolved[code]]
+            generated.append(self.chars[char_idx])
+            code = self.update(code, char_idx)
+        return "".join(generated)
+
+    def generate_batch(self, lengths, prefixes = "!", reject = None, rng = None, argmax = False, max_rounds = 100, \
+                       keys = None, counter_offset = 0):
+        '''Generate many strings at once. We sample one character position at a time across the
+        whole batch. Strings that collide (case-insensitively) with reject, or with strings generated
+        earlier in the batch, are resampled; only the rejected rows are sampled again.
+        With keys, every string is instead sampled from its own counter-based draws (see
+        utils/rng.py). Strings of the same round that collide are resolved by key order: the
+        smallest key keeps the string, and the others move to their next attempt. The strings then
+        depend on the keys and lengths in the batch, but not on their order.
+        Args:
+            lengths: list or np.array, number of characters to generate per string
+            prefixes: str, or list of str (one per string), text to condition on
+            reject: container of lowercased strings that must not be generated, e.g. a vocabulary
+            rng: np.random.RandomState or the np.random module (default: np.random)
+            argmax: bool, always pick the most frequent next character instead of sampling
+                (no resampling is done in this case)
+            max_rounds: int, after this many rounds of resampling, we only reject strings in reject
+                and allow duplicates within the batch. With keys, strings are always kept distinct:
+                strings that are still rejected after max_rounds get one more character per round,
+                since there may be no unused strings of their length.
+            keys: np.array of np.uint64, key hash of every string. Attempt a at the string uses
+                draws counter_offset + a * COUNTER_STRIDE + t, for characters t = 0, 1, ...
+            counter_offset: int, first draw of every key to use
+        Returns:
+            list, generated strings, without the prefixes
+        '''
+        if rng is None:
+            rng = np.random
+        lengths = np.array(lengths, dtype=np.int64)
+        if keys is not None:
+            keys = np.asarray(keys, dtype=np.uint64)
+        if isinstance(prefixes, str):
+            init_codes = np.full(len(lengths), self.encode(prefixes), dtype=np.int64)
+        else:
+            init_codes = np.array([self.encode(prefix) for prefix in prefixes], dtype=np.int64)
+
+        generated = [None] * len(lengths)
+        generated_set = set()
+        attempts = np.zeros(len(lengths), dtype=np.int64)
+        pending = np.arange(len(lengths))
+        rounds = 0
+        while len(pending) > 0:
+            pending_lengths = lengths[pending]
+            max_length = int(pending_lengths.max()) if len(pending) else 0
+            codes = init_codes[pending]
+            char_matrix = np.empty((len(pending), max(max_length, 1)), dtype=np.int64)
+            for t in range(max_length):
+                dists = self.resolved[codes]
+                if argmax:
+                    char_idxs = self.argmax_char_idxs[dists]
+                else:
+                    if keys is not None:
+                        u = counter_uniforms(keys[pending], counter_offset + attempts[pending] * COUNTER_STRIDE + t)
+                    else:
+                        u = rng.random_sample(len(pending))
+                    char_idxs = self.char_idxs[self.shifted_cdf.searchsorted(dists + u, side="right")]
+                char_matrix[:, t] = char_idxs
+                codes = (codes * self.base + char_idxs + 1) % self.num_contexts
+
+            # Each row of characters is viewed as one fixed-width string, and cut to its length
+            rows = self.char_array[char_matrix].view(f"<U{char_matrix.shape[1]}").ravel()
+
+            rounds += 1
+            rejected = list()
+            candidates = list()
+            for i, row, length in zip(pending, rows, pending_lengths):
+                word = str(row[:length])
+                if not argmax and reject is not None and word.lower() in reject:
+                    rejected.append(i)
+                else:
+                    candidates.append(i)
+                    generated[i] = word
+            if keys is not None:
+                candidates.sort(key=lambda i: (keys[i], i))
+            for i in candidates:
+                word = generated[i]
+                if not argmax and (keys is not None or rounds <= max_rounds) and word.lower() in generated_set:
+                    generated[i] = None
+                    rejected.append(i)
+                else:
+                    generated_set.add(word.lower())
+            pending = np.array(rejected, dtype=np.int64)
+            attempts[pending] += 1
+            if keys is not None and rounds >= max_rounds:
+                lengths[pending] += 1
+
+        return generated
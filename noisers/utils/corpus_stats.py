@@ -0,0 +1,168 @@
+'''
+Corpus statistics shared by all noisers built on the same text file.
+
+The lexical, morphological and phonological noisers (and the phonological noisers that the
+lexical and morphological noisers build internally) all need statistics of text_file: word
+frequencies, character trigram counts, suffix counts. We read the file once, counting raw
+whitespace tokens, and derive every statistic from the distinct tokens. Derived statistics are
+memoized, since several noisers ask for the same ones.
+
+On huge corpora (e.g. CC-100), the number of distinct tokens does not fit in memory. With
+max_tokens, we count tokens approximately with the Misra-Gries algorithm, which keeps a bounded
+number of counters: whenever there are more than 2 * max_tokens of them, we subtract the
+(max_tokens + 1)-th largest count from all of them, and drop the ones that reach 0. Every kept
+count is then an underestimate by at most count_error <= #tokens / (max_tokens + 1), and every
+token with a true count above that is kept. Rare tokens are the ones dropped, which are the
+ones that a frequency floor would drop anyway.
+'''
+from collections import Counter, defaultdict
+from functools import lru_cache
+import re
+import sys
+
+import numpy as np
+
+from utils.misc import get_character_set_regex
+
+# Distinct raw tokens to count per vocabulary word when counting approximately: a word shows up
+# as several tokens, with different casing and punctuation
+TOKENS_PER_WORD = 4
+
+
+@lru_cache(maxsize=None)
+def get_word_regex(strip_chars, character_set = None):
+    '''Compile a regex that turns a token into a vocabulary word: it strips strip_chars from both
+    ends of the token, and only matches if what is left has no numeric characters (and, if given,
+    only characters in character_set). Same as token.strip(strip_chars), followed by checks on
+    every character, in one fullmatch.
+    Args:
+        strip_chars: str, characters to strip from both ends of each token
+        character_set: frozenset, characters allowed in words
+    Returns:
+        re.Pattern, group 1 of a fullmatch is the word
+    '''
+    strip_class = "[" + re.escape(strip_chars) + "]*" if strip_chars else ""
+    if character_set is None:
+        # str.isdigit is true for more characters than \d, e.g. superscripts
+        digits = "".join(chr(code_point) for code_point in range(sys.maxunicode + 1) if chr(code_point).isdigit())
+        word_class = "[^" + re.escape(digits) + "]"
+    else:
+        word_chars = sorted(char for char in character_set if not char.isdigit())
+        word_class = "[" + "".join(re.escape(char) for char in word_chars) + "]" if word_chars else r"[^\s\S]"
+    # The word is lazy, so that the trailing strip_chars are not part of it
+    return re.compile(f"{strip_class}({word_class}*?){strip_class}", re.DOTALL)
+
+
+class CorpusStats:
+
+    def __init__(self, text_file, max_tokens = None):
+        '''Count the tokens of a text file in one pass
+        Args:
+            text_file: str, path to text file
+            max_tokens: int, if given, count tokens approximately, keeping at most 2 * max_tokens
+                distinct tokens in memory (see above)
+        '''
+        self.text_file = text_file
+        self.max_tokens = int(max_tokens) if max_tokens is not None else None
+        self.count_error = 0
+        self.num_tokens = 0
+        print(f"Reading corpus statistics from {text_file}...")
+        # Raw whitespace tokens, in order of first occurrence
+        self.token_counts = Counter()
+        with open(text_file, "r") as f:
+            for line in f:
+                tokens = line.split()
+                self.num_tokens += len(tokens)
+                self.token_counts.update(tokens)
+                if self.max_tokens is not None and len(self.token_counts) > 2 * self.max_tokens:
+                    self.prune_token_counts()
+        print(f"Finished reading corpus statistics from {text_file}! Distinct tokens: {len(self.token_counts)}")
+        if self.count_error:
+            print(f"Token counts are approximate, and underestimated by at most {self.count_error}")
+        self._memo = dict()
+
+    def prune_token_counts(self):
+        '''Misra-Gries step: subtract the (max_tokens + 1)-th largest count from all token counts,
+        and drop tokens whose count reaches 0'''
+        counts = np.fromiter(self.token_counts.values(), dtype=np.int64, count=len(self.token_counts))
+        threshold = int(np.partition(counts, -(self.max_tokens + 1))[-(self.max_tokens + 1)])
+        self.count_error += threshold
+        self.token_counts = Counter({token: count - threshold for token, count in self.token_counts.items() \
+                                     if count > threshold})
+
+    def get_vocab(self, strip_chars = "", character_set = None, min_freq = 1, max_vocab_size = None):
+        '''Get the word frequencies of the corpus. Words are stripped of strip_chars and lowercased.
+        Words with numeric characters are skipped.
+        Args:
+            strip_chars: str, characters to strip from both ends of each token
+            character_set: set, if given, skip words with characters outside of it
+            min_freq: int, skip words that occur less than min_freq times
+            max_vocab_size: int, if given, only keep the max_vocab_size most frequent words
+        Returns:
+            vocab: defaultdict, {word: count}, in order of first occurrence
+        '''
+        character_set = frozenset(character_set) if character_set is not None else None
+        key = ("vocab", strip_chars, character_set, min_freq, max_vocab_size)
+        if key not in self._memo:
+            vocab = defaultdict(int)
+            word_regex = get_word_regex(strip_chars, character_set)
+            for token, count in self.token_counts.items():
+                match = word_regex.fullmatch(token)
+                if match is None:
+                    continue
+                vocab[match.group(1).lower()] += count
+            if min_freq > 1:
+                vocab = defaultdict(int, {word: count for word, count in vocab.items() if count >= min_freq})
+            if max_vocab_size is not None and len(vocab) > max_vocab_size:
+                # Keep the order of first occurrence
+                kept = set(sorted(vocab, key=vocab.get, reverse=True)[:int(max_vocab_size)])
+                vocab = defaultdict(int, {word: count for word, count in vocab.items() if word in kept})
+            self._memo[key] = vocab
+        # Noisers own their vocabularies, so we hand out copies
+        return defaultdict(int, self._memo[key])
+
+    def get_trigram_counts(self, character_set):
+        '''Get character trigram counts over the distinct words of the corpus, with < and > added
+        to denote the start and end of each word
+        Args:
+            character_set: set, only count words with all characters in it
+        Returns:
+            ngrams: dict, {trigram: number of distinct words containing it}, in order of first occurrence
+        '''
+        key = ("trigrams", frozenset(character_set))
+        if key not in self._memo:
+            n = 3
+            ngrams = defaultdict(int)
+            valid_word = get_character_set_regex(character_set)
+            for token in self.token_counts:
+                if valid_word.fullmatch(token) is None:
+                    continue
+                word = "<" + token + ">"
+                for i in range(len(word) - n + 1):
+                    ngrams[word[i:i+n]] += 1
+            self._memo[key] = ngrams
+        return defaultdict(int, self._memo[key])
+
+    def get_suffix_frequency(self, strip_chars = "", character_set = None, min_freq = 1, max_vocab_size = None):
+        '''Get suffix frequencies of the vocabulary (see get_vocab). Only the second half of a
+        word is allowed to be a suffix.
+        Args:
+            strip_chars, character_set, min_freq, max_vocab_size: see get_vocab
+        Returns:
+            suffix_freq: defaultdict, {suffix: frequency}
+            most_frequent_word_per_suffix: dict, {suffix: (word, count)} of the most frequent word with the suffix
+        '''
+        character_set = frozenset(character_set) if character_set is not None else None
+        key = ("suffixes", strip_chars, character_set, min_freq, max_vocab_size)
+        if key not in self._memo:
+            vocab = self.get_vocab(strip_chars, character_set, min_freq, max_vocab_size)
+            suffix_freq = defaultdict(int)
+            most_frequent_word_per_suffix = dict()
+            for word, count in vocab.items():
+                for i in range(1, round(len(word)/2) + 1):
+                    suffix_freq[word[-i:]] += count
+                    if count > most_frequent_word_per_suffix.get(word[-i:], ("", 0))[1]:
+                        most_frequent_word_per_suffix[word[-i:]] = (word, count)
+            self._memo[key] = (suffix_freq, most_frequent_word_per_suffix)
+        suffix_freq, most_frequent_word_per_suffix = self._memo[key]
+        return defaultdict(int, suffix_freq), dict(most_frequent_word_per_suffix)
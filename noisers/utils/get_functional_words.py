@@ -7,6 +7,7 @@ import conllu
 import sys
 from collections import defaultdict
 import json
+from functools import lru_cache
 
 files = {
     "deu":"/export/b08/nbafna1/data/ud-treebanks-v2.13/UD_German-HDT/de_hdt-ud-train.conllu",
@@ -36,6 +37,28 @@ output_paths ={
 closed_class_tags = ['ADP', 'AUX', 'CCONJ', 'DET', 'PART', 'PRON', 'SCONJ']
 
 
+@lru_cache(maxsize=None)
+def get_functional_word_index(lang, exclude_tags=()):
+    '''Get an index of the functional words of a language, built once per language from the
+    wordlist JSON and shared by all noisers and posterior estimators.
+    Args:
+        lang: str, language code
+        exclude_tags: tuple, tags whose words are not counted as functional
+    Returns:
+        functional_words: frozenset, functional words
+        word2tag: dict, {word: tag} for all functional words
+    '''
+    with open(output_paths[lang]) as f:
+        tag2wordlist = json.load(f)
+    word2tag = dict()
+    for tag, wordlist in tag2wordlist.items():
+        if tag in exclude_tags:
+            continue
+        for word in wordlist:
+            word2tag.setdefault(word, tag)
+    return frozenset(word2tag), word2tag
+
+
 def read_conllu(filename):
     conllu_file = open(filename, "r", encoding="utf-8")
     conllu_data = conllu_file.read()
@@ -0,0 +1,55 @@
+'''
+Word-level memo for the global noisers.
+
+Once their maps are built, the global noisers map every input token to the same noised token,
+so we remember the output per raw token (with its casing and punctuation). Text is Zipfian,
+so most tokens are repeats. The memo is capped in size: once it is full, we stop adding words,
+but keep serving the ones it has. Frequent words are seen early, so they are the ones kept.
+'''
+
+DEFAULT_MEMO_SIZE = 1_000_000
+
+
+class WordMemo:
+
+    def __init__(self, max_size = DEFAULT_MEMO_SIZE):
+        '''
+        Args:
+            max_size: int, maximum number of words to remember (0 disables the memo)
+        '''
+        self.max_size = max_size
+        self.memo = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, word):
+        '''Get the noised word for word
+        Returns:
+            str, noised word, or None if word is not in the memo
+        '''
+        noised_word = self.memo.get(word)
+        if noised_word is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return noised_word
+
+    def put(self, word, noised_word):
+        '''Remember the noised word for word, if the memo is not full'''
+        if len(self.memo) < self.max_size:
+            self.memo[word] = noised_word
+
+    def clear(self):
+        '''Forget all words, e.g. after the maps of the noiser change'''
+        self.memo.clear()
+
+    def get_stats(self):
+        '''Recording purposes'''
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self.memo),
+            "max_size": self.max_size,
+        }
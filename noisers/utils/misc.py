@@ -1,4 +1,7 @@
 from collections import defaultdict
+from functools import lru_cache
+import re
+import numpy as np
 
 def normalize_lang_codes(lang):
     '''Make everything ISO 639-3'''
@@ -110,63 +113,136 @@ def related_to_lang(lang):
         if lang in related_lrls[hrl]:
             return hrl
 
+# Unicode ranges [start, end) of the characters of each script
+SCRIPT_RANGES = {
+    # Include all accents for latin
+    "latin": ((65, 91), (97, 123), (192, 256)),
+    "devanagari": ((2304, 2432),),
+    "arabic": ((1536, 1792),),
+    "cyrillic": ((1024, 1280),),
+}
+
+# Character sets are built once and frozen, since every noiser (and every phonological noiser
+# inside another noiser) asks for them
+SCRIPT_CHARACTER_SETS = {
+    script: frozenset(chr(i) for start, end in ranges for i in range(start, end))
+    for script, ranges in SCRIPT_RANGES.items()
+}
+
+LANG_TO_SCRIPT = {
+    "eng": "latin",
+    "deu": "latin",
+    "hin": "devanagari",
+    "arb": "arabic",
+    "rus": "cyrillic",
+    "spa": "latin",
+    "ind": "latin",
+    "fra": "latin",
+}
+
 def get_character_set(lang):
     '''Get character set for script
     Args:
         lang: str, language code
     Returns:
         script, str, script
-        char_set, character set of that script
+        char_set, frozenset, character set of that script
     '''
-    # Get character set for script using Unicode ranges
     lang = normalize_lang_codes(lang)
-    lang_to_script = {
-        "eng": "latin",
-        "deu": "latin",
-        "hin": "devanagari",
-        "arb": "arabic",
-        "rus": "cyrillic",
-        "spa": "latin",
-        "ind": "latin",
-        "fra": "latin",
-    }
-    
-    script = lang_to_script[lang]
-
-    char_set = {
-        # Include all accents for latin
-        "latin": set(chr(i) for i in range(65, 91)) | set(chr(i) for i in range(97, 123)) | \
-                    set(chr(i) for i in range(192, 256)),
-
-        "devanagari": set(chr(i) for i in range(2304, 2432)),
-        "arabic": set(chr(i) for i in range(1536, 1792)),
-        "cyrillic": set(chr(i) for i in range(1024, 1280)),
-    }
-    return script, char_set[script]
+    script = LANG_TO_SCRIPT[lang]
+    return script, SCRIPT_CHARACTER_SETS[script]
+
+@lru_cache(maxsize=None)
+def _compile_character_set_regex(character_set):
+    code_points = sorted(ord(char) for char in character_set)
+    # Collapse consecutive code points into ranges
+    ranges = list()
+    for code_point in code_points:
+        if ranges and ranges[-1][1] == code_point - 1:
+            ranges[-1][1] = code_point
+        else:
+            ranges.append([code_point, code_point])
+    if not ranges:
+        return re.compile("")
+    char_class = "".join(re.escape(chr(start)) if start == end else f"{re.escape(chr(start))}-{re.escape(chr(end))}" \
+                         for start, end in ranges)
+    return re.compile(f"[{char_class}]*")
+
+def get_character_set_regex(character_set):
+    '''Get a compiled regex that fully matches strings made only of characters in character_set,
+    so that a whole word can be checked with regex.fullmatch(word) instead of per-character
+    set membership. Compiled once per character set.
+    Args:
+        character_set: set or frozenset, set of single characters
+    Returns:
+        re.Pattern
+    '''
+    return _compile_character_set_regex(frozenset(character_set))
 
 
-def identify_script(text):
+# Scripts that identify_script tells apart, in order of preference on ties.
+# Unlike SCRIPT_RANGES, latin only has the ASCII letters here.
+IDENTIFY_SCRIPT_RANGES = {
+    "latin": ((65, 91), (97, 123)),
+    "devanagari": ((2304, 2432),),
+    "arabic": ((1536, 1792),),
+    "cyrillic": ((1024, 1280),),
+}
+IDENTIFY_SCRIPTS = list(IDENTIFY_SCRIPT_RANGES)
+
+# Code point -> index in IDENTIFY_SCRIPTS, or -1 for characters of no script
+_SCRIPT_LOOKUP = np.full(max(end for ranges in IDENTIFY_SCRIPT_RANGES.values() for _, end in ranges), -1, dtype=np.int8)
+for _script_idx, _ranges in enumerate(IDENTIFY_SCRIPT_RANGES.values()):
+    for _start, _end in _ranges:
+        _SCRIPT_LOOKUP[_start:_end] = _script_idx
+
+def _get_script_ids(text):
+    '''Get the index in IDENTIFY_SCRIPTS of every character of text (-1 for no script)'''
+    codes = np.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    script_ids = np.full(len(codes), -1, dtype=np.int8)
+    in_table = codes < len(_SCRIPT_LOOKUP)
+    script_ids[in_table] = _SCRIPT_LOOKUP[codes[in_table]]
+    return script_ids
+
+def identify_script(text, chunk_size = 1024):
     '''Identify script of text
     Args:
         text: str, input text
+        chunk_size: int, number of characters counted at a time. We stop as soon as the
+            remaining characters cannot change the majority script.
     Returns:
         str, script of text
     '''
-    # Identify script of text
-    char_set = {
-        "latin": set(chr(i) for i in range(65, 91)) | set(chr(i) for i in range(97, 123)),
-        "devanagari": set(chr(i) for i in range(2304, 2432)),
-        "arabic": set(chr(i) for i in range(1536, 1792)),
-        "cyrillic": set(chr(i) for i in range(1024, 1280)),
-    }
     # We'll find a majority script
-    script_counts = {script: 0 for script in char_set.keys()}
-    for char in text:
-        for script, char_set in char_set.items():
-            if char in char_set:
-                script_counts[script] += 1
-
-    return max(script_counts, key=script_counts.get)
+    script_counts = np.zeros(len(IDENTIFY_SCRIPTS), dtype=np.int64)
+    for start in range(0, len(text), chunk_size):
+        script_ids = _get_script_ids(text[start:start+chunk_size])
+        script_counts += np.bincount(script_ids[script_ids >= 0], minlength=len(IDENTIFY_SCRIPTS))
+        remaining = len(text) - start - chunk_size
+        if remaining > 0:
+            second, first = np.sort(script_counts)[-2:]
+            if first - second > remaining:
+                break
+
+    # Ties go to the first script in IDENTIFY_SCRIPTS
+    return IDENTIFY_SCRIPTS[int(np.argmax(script_counts))]
+
+def identify_script_batch(texts):
+    '''Identify the script of many texts at once
+    Args:
+        texts: list, list of str
+    Returns:
+        list, script of every text
+    '''
+    if len(texts) == 0:
+        return list()
+    script_ids = _get_script_ids("".join(texts))
+    text_ids = np.repeat(np.arange(len(texts)), [len(text) for text in texts])
+    has_script = script_ids >= 0
+    num_scripts = len(IDENTIFY_SCRIPTS)
+    script_counts = np.bincount(text_ids[has_script] * num_scripts + script_ids[has_script], \
+                                minlength=len(texts) * num_scripts).reshape(len(texts), num_scripts)
+    return [IDENTIFY_SCRIPTS[script_idx] for script_idx in script_counts.argmax(axis=1)]
 
 def ipa_char_maps():
     '''
@@ -495,7 +571,7 @@ def ipa_char_maps():
         'fra': latin_to_ipa_set_french,
     }
 
-    ipa_to_script_chars = defaultdict(lambda: defaultdict(lambda: set()))
+    ipa_to_script_chars = defaultdict(lambda: defaultdict(set))
     for lang, ipa_set in script_to_ipa_chars.items():
         for script_char, ipas in ipa_set.items():
             for ipa in ipas:
@@ -699,7 +775,7 @@ def get_equivalence_classes_ipa():
 
     # Equivalence class per character
     ## Every character can go to another other character that it appears in an eqv set with
-    ipa_equivalence_classes_per_char = defaultdict(lambda: set())
+    ipa_equivalence_classes_per_char = defaultdict(set)
     for chars in ipa_equivalence_classes:
         for char in chars:
             ipa_equivalence_classes_per_char[char].update(chars)
@@ -0,0 +1,125 @@
+'''
+Random numbers keyed by what they are drawn for.
+
+With a global RNG stream, the decision for a word depends on how many draws came before it, i.e.
+on the order of the vocabulary and on what else was sampled. For the decisions that build the
+noiser maps, and for words only seen at noising time, we instead seed an RNG from a hash of a key,
+like (seed, noiser, word): the same key always gives the same draws, in any process and in any
+order.
+
+Keys are hashed with blake2b, which (unlike the built-in hash) does not change between processes.
+
+When many keys need draws at once (e.g. one per word of the vocabulary), we hash every key once,
+and get the i-th draw for a key with a counter-based generator: the splitmix64 finalizer of
+(key hash + i * golden ratio), computed for all keys at once with numpy. A key then gets the same
+draws however the keys are ordered or split into shards.
+'''
+import hashlib
+import math
+import random
+
+import numpy as np
+
+DEFAULT_SEED = 42
+
+# Separates the parts of a key, so that ("ab", "c") and ("a", "bc") are different keys
+KEY_SEPARATOR = "\x1f"
+
+
+def key_hash(*key):
+    '''Hash a key to a 64-bit integer
+    Args:
+        key: parts of the key, e.g. seed, noiser name, word
+    Returns:
+        int, hash in [0, 2 ** 64)
+    '''
+    key_str = KEY_SEPARATOR.join(str(part) for part in key)
+    return int.from_bytes(hashlib.blake2b(key_str.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+
+def key_hashes(prefix, keys):
+    '''Hash many keys that share their first parts
+    Args:
+        prefix: tuple, first parts of every key, e.g. (seed, noiser name)
+        keys: iterable, last part of each key, e.g. words
+    Returns:
+        np.array of np.uint64, key_hash(*prefix, key) for every key
+    '''
+    prefix_str = "".join(str(part) + KEY_SEPARATOR for part in prefix)
+    hashes = [int.from_bytes(hashlib.blake2b((prefix_str + str(key)).encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little") \
+              for key in keys]
+    return np.array(hashes, dtype=np.uint64)
+
+def hashed_uniform(*key):
+    '''Get a uniform draw in [0, 1) for a key
+    Args:
+        key: parts of the key
+    Returns:
+        float, uniform draw with 53 random bits
+    '''
+    return (key_hash(*key) >> 11) * 2.0 ** -53
+
+
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+def splitmix64(x):
+    '''splitmix64 finalizer, applied elementwise to an array of np.uint64'''
+    with np.errstate(over="ignore"):
+        z = np.asarray(x, dtype=np.uint64) + GOLDEN_GAMMA
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+def counter_uniforms(hashes, counters):
+    '''Get the counters-th uniform draws in [0, 1) of keys
+    Args:
+        hashes: np.array of np.uint64, key hashes (see key_hashes)
+        counters: int or np.array, index of the draw for each key (broadcast against hashes)
+    Returns:
+        np.array, uniform draws with 53 random bits
+    '''
+    with np.errstate(over="ignore"):
+        x = np.asarray(hashes, dtype=np.uint64) + np.asarray(counters, dtype=np.uint64) * GOLDEN_GAMMA
+    return (splitmix64(x) >> np.uint64(11)) * 2.0 ** -53
+
+def poisson_from_uniforms(lams, u, max_k = 1000):
+    '''Sample from Poisson distributions by inverting their CDFs at uniform draws
+    Args:
+        lams: np.array, Poisson means
+        u: np.array, uniform draws in [0, 1), one per mean
+        max_k: int, largest value returned
+    Returns:
+        np.array of int, one sample per mean
+    '''
+    lams = np.asarray(lams, dtype=float)
+    u = np.asarray(u, dtype=float)
+    k = np.zeros(lams.shape, dtype=np.int64)
+    p = np.exp(-lams)
+    cdf = p.copy()
+    active = u >= cdf
+    while active.any():
+        k[active] += 1
+        p[active] *= lams[active] / k[active]
+        cdf[active] += p[active]
+        active &= (u >= cdf) & (k < max_k)
+    return k
+
+
+class KeyedRandom(random.Random):
+    '''random.Random seeded from a key. It also has the random_sample and poisson methods of
+    np.random, so that it can be passed wherever the noisers take an rng.'''
+
+    def __init__(self, *key):
+        super().__init__(key_hash(*key))
+
+    def random_sample(self):
+        return self.random()
+
+    def poisson(self, lam):
+        '''Sample from a Poisson distribution (Knuth's method, fine for small lam like word lengths)'''
+        threshold = math.exp(-lam)
+        k = 0
+        p = self.random()
+        while p > threshold:
+            k += 1
+            p *= self.random()
+        return k
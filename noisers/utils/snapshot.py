@@ -0,0 +1,227 @@
+'''
+Binary snapshots of built noisers.
+
+record_noiser_artifacts writes the maps of a noiser as indented JSON, which is meant for reading,
+and cannot be loaded back into a noiser. A snapshot holds the same maps in a compact form that
+can be loaded back:
+    - Every distinct string of all maps (words, suffixes, chargrams) is stored once, in a string
+      table: one array of UTF-8 bytes and one array of offsets.
+    - Every map is stored as integer arrays: the string index of each key (in the order of the
+      map), the order of the keys sorted by string (for lookups), and the values, which are
+      string indices ("str"), integers ("int"), or a list of string indices ("strlist").
+    - The scalar parameters of the noiser (lang, thetas, etc.) are stored in a JSON header.
+
+The file is a JSON header followed by the arrays, each aligned to 8 bytes. We load it with a single
+mmap, so worker processes that load the same snapshot share its pages. Maps can be loaded lazily,
+as read-only Mappings that look up keys by binary search over the mmapped arrays; pickling them
+(e.g. to send a noiser to a worker process) only sends the path of the snapshot.
+
+Layout:
+    MAGIC (8 bytes) | header length (8 bytes, little endian) | header JSON | arrays
+'''
+import json
+import os
+import tempfile
+from collections.abc import Mapping
+
+import numpy as np
+
+MAGIC = b"NOISNAP1"
+ALIGNMENT = 8
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def get_value_kind(values):
+    '''Get the kind of the values of a map: "str", "int" or "strlist"'''
+    for value in values:
+        if isinstance(value, str):
+            return "str"
+        if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+            return "int"
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return "strlist"
+        raise TypeError(f"Cannot snapshot map values of type {type(value).__name__}")
+    return "str"
+
+def write_snapshot(path, class_name, params, maps):
+    '''Write a snapshot file. The file is written atomically.
+    Args:
+        path: str, path to snapshot file
+        class_name: str, class of the noiser, as "module:Class" or "Class"
+        params: dict, scalar parameters of the noiser (JSON serializable)
+        maps: dict, {name: map}, every map is {str: str}, {str: int} or {str: list of str}
+    '''
+    string2idx = dict()
+    def intern(string):
+        idx = string2idx.get(string)
+        if idx is None:
+            idx = string2idx[string] = len(string2idx)
+        return idx
+
+    arrays = dict()
+    map_kinds = dict()
+    for name, mapping in maps.items():
+        keys = list(mapping)
+        kind = get_value_kind(mapping.values())
+        map_kinds[name] = kind
+        key_idxs = np.array([intern(key) for key in keys], dtype=np.int64)
+        arrays[f"{name}.keys"] = key_idxs
+        arrays[f"{name}.order"] = np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+        if kind == "str":
+            arrays[f"{name}.values"] = np.array([intern(mapping[key]) for key in keys], dtype=np.int64)
+        elif kind == "int":
+            arrays[f"{name}.values"] = np.array([mapping[key] for key in keys], dtype=np.int64)
+        else:
+            # Sets are stored sorted, so that the same map always gives the same snapshot
+            value_lists = [sorted(mapping[key]) if isinstance(mapping[key], (set, frozenset)) else list(mapping[key]) \
+                           for key in keys]
+            arrays[f"{name}.value_offsets"] = np.cumsum([0] + [len(values) for values in value_lists], dtype=np.int64)
+            arrays[f"{name}.values"] = np.array([intern(value) for values in value_lists for value in values], dtype=np.int64)
+
+    encoded = [string.encode("utf-8", "surrogatepass") for string in string2idx]
+    arrays["strings"] = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    arrays["string_offsets"] = np.cumsum([0] + [len(string) for string in encoded], dtype=np.int64)
+
+    # Array offsets are relative to the end of the header, which is aligned as well
+    array_specs = dict()
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        array_specs[name] = {"offset": offset, "dtype": array.dtype.str, "length": len(array)}
+        offset += array.nbytes
+    header = json.dumps({"class_name": class_name, "params": params, "maps": map_kinds, "arrays": array_specs}, \
+                        ensure_ascii=False).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header))
+
+    dirname = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for name, array in arrays.items():
+                f.write(b"\0" * (data_start + array_specs[name]["offset"] - f.tell()))
+                f.write(array.tobytes())
+        os.replace(tmp_file, path)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+
+
+class Snapshot:
+
+    def __init__(self, path):
+        '''Open a snapshot file
+        Args:
+            path: str, path to snapshot file
+        '''
+        self.path = os.path.abspath(path)
+        with open(self.path, "rb") as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError(f"Not a noiser snapshot: {path}")
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length).decode("utf-8"))
+        self.class_name = header["class_name"]
+        self.params = header["params"]
+        self.map_kinds = header["maps"]
+
+        data_start = _align(len(MAGIC) + 8 + header_length)
+        buffer = np.memmap(self.path, dtype=np.uint8, mode="r")
+        self.arrays = dict()
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            start = data_start + spec["offset"]
+            self.arrays[name] = buffer[start:start + spec["length"] * dtype.itemsize].view(dtype)
+        self.strings = self.arrays["strings"]
+        self.string_offsets = self.arrays["string_offsets"]
+
+    def get_string(self, idx):
+        '''Get a string of the string table'''
+        return self.strings[self.string_offsets[idx]:self.string_offsets[idx + 1]].tobytes().decode("utf-8", "surrogatepass")
+
+    def get_map(self, name, lazy = True):
+        '''Get a map of the snapshot
+        Args:
+            name: str, name of the map
+            lazy: bool, return a read-only SnapshotMap over the mmapped arrays instead of a dict
+        Returns:
+            SnapshotMap or dict
+        '''
+        if name not in self.map_kinds:
+            raise KeyError(f"No map {name} in snapshot {self.path}")
+        snapshot_map = SnapshotMap(self, name)
+        if lazy:
+            return snapshot_map
+        return snapshot_map.to_dict()
+
+
+class SnapshotMap(Mapping):
+    '''Read-only map over the arrays of a snapshot. Keys are looked up by binary search, and
+    iterated over in the order of the original map.'''
+
+    def __init__(self, snapshot, name):
+        self.snapshot = snapshot
+        self.name = name
+        self.kind = snapshot.map_kinds[name]
+        self.keys_array = snapshot.arrays[f"{name}.keys"]
+        self.order = snapshot.arrays[f"{name}.order"]
+        self.values_array = snapshot.arrays[f"{name}.values"]
+        if self.kind == "strlist":
+            self.value_offsets = snapshot.arrays[f"{name}.value_offsets"]
+
+    def __reduce__(self):
+        # Worker processes open the snapshot themselves, and share its pages
+        return (_open_snapshot_map, (self.snapshot.path, self.name))
+
+    def _find(self, key):
+        '''Get the position of key in the map, or -1'''
+        if not isinstance(key, str):
+            return -1
+        get_string = self.snapshot.get_string
+        lo, hi = 0, len(self.order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if get_string(self.keys_array[self.order[mid]]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.order) and get_string(self.keys_array[self.order[lo]]) == key:
+            return int(self.order[lo])
+        return -1
+
+    def _get_value(self, i):
+        if self.kind == "str":
+            return self.snapshot.get_string(self.values_array[i])
+        if self.kind == "int":
+            return int(self.values_array[i])
+        start, end = self.value_offsets[i], self.value_offsets[i + 1]
+        return [self.snapshot.get_string(idx) for idx in self.values_array[start:end]]
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self._get_value(i)
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        for idx in self.keys_array:
+            yield self.snapshot.get_string(idx)
+
+    def __len__(self):
+        return len(self.keys_array)
+
+    def to_dict(self):
+        '''Load the whole map into a dict'''
+        return {self.snapshot.get_string(idx): self._get_value(i) for i, idx in enumerate(self.keys_array)}
+
+
+def _open_snapshot_map(path, name):
+    return Snapshot(path).get_map(name)
@@ -0,0 +1,85 @@
+'''
+Trie of reversed suffixes, for matching the suffixes of a word against a suffix table.
+
+Finding the suffixes of a word that are in a table by slicing out every suffix word[-i:] and
+looking it up copies O(L^2) characters per word. Here, suffixes are stored reversed in a trie of
+nested dicts, so all suffixes of a word that are in the table are found in a single walk from
+the end of the word, one character at a time, stopping as soon as no suffix of the table
+continues the walk.
+'''
+
+# Key under which a node stores the suffix that ends there. Keys of children are single
+# characters, so this cannot clash with them.
+END = ""
+
+
+class SuffixTrie:
+
+    def __init__(self, suffixes = ()):
+        '''
+        Args:
+            suffixes: iterable of str, suffixes to add, e.g. the keys of a suffix frequency table
+        '''
+        self.root = dict()
+        self.size = 0
+        for suffix in suffixes:
+            self.add(suffix)
+
+    def add(self, suffix):
+        '''Add a suffix to the trie'''
+        node = self.root
+        for char in reversed(suffix):
+            node = node.setdefault(char, dict())
+        if END not in node:
+            self.size += 1
+        node[END] = suffix
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, suffix):
+        node = self.root
+        for char in reversed(suffix):
+            node = node.get(char)
+            if node is None:
+                return False
+        return END in node
+
+    def matching_suffixes(self, word, max_length = None):
+        '''Get the suffixes of word that are in the trie
+        Args:
+            word: str, input word
+            max_length: int, only consider suffixes of up to max_length characters (default: len(word))
+        Returns:
+            list, matching suffixes, from shortest to longest
+        '''
+        if max_length is None or max_length > len(word):
+            max_length = len(word)
+        suffixes = list()
+        node = self.root
+        for i in range(1, max_length + 1):
+            node = node.get(word[-i])
+            if node is None:
+                break
+            if END in node:
+                suffixes.append(node[END])
+        return suffixes
+
+    def longest_suffix(self, word, max_length = None):
+        '''Get the longest suffix of word that is in the trie
+        Args:
+            word: str, input word
+            max_length: int, see matching_suffixes
+        Returns:
+            str, longest matching suffix, or None if no suffix matches
+        '''
+        if max_length is None or max_length > len(word):
+            max_length = len(word)
+        longest = None
+        node = self.root
+        for i in range(1, max_length + 1):
+            node = node.get(word[-i])
+            if node is None:
+                break
+            longest = node.get(END, longest)
+        return longest
@@ -0,0 +1,244 @@
+'''
+Edit distance and alignment between lexicon pairs, for posterior estimation.
+
+Most lexicon pairs only need their normalized edit distance (NED), to be compared against a
+threshold. We compute it with the bit-parallel algorithm of Myers (1999), in the global
+(Levenshtein) form given by Hyyrö (2001): the DP column for each character of tgt is encoded
+as bit vectors of +1/-1 vertical differences, so a whole column is updated with a handful of
+integer operations. Python integers are arbitrary precision, so there is no limit on the
+word length.
+
+For whole lexicons (ned_batch), we run the same algorithm on many pairs in lockstep with NumPy:
+every pair whose source word has at most 64 characters gets its bit vectors in one uint64, and
+each step of the loop processes one character of the target word of every pair. Other pairs
+are handled one at a time.
+
+The list of edit operations needs the full DP table, and is only computed on demand, for the
+pairs that pass the threshold. Both results are cached per (src, tgt) pair, since the
+different posteriors align the same lexicon.
+'''
+import numpy as np
+
+# Bits of the bit vectors of the batched algorithm
+WORD_BITS = 64
+# Pairs aligned together by the batched algorithm
+BATCH_SIZE = 4096
+
+
+class AlignmentEngine:
+
+    def __init__(self):
+        self.distance_cache = dict()
+        self.ops_cache = dict()
+
+    @staticmethod
+    def _edit_distance(src, tgt):
+        '''Levenshtein distance between src and tgt, with bit-parallel DP columns'''
+        m = len(src)
+        if m == 0:
+            return len(tgt)
+        if len(tgt) == 0:
+            return m
+
+        # peq[c] has bit i set iff src[i] == c
+        peq = dict()
+        for i, char in enumerate(src):
+            peq[char] = peq.get(char, 0) | (1 << i)
+
+        all_ones = (1 << m) - 1
+        last_bit = 1 << (m - 1)
+        pv = all_ones # vertical +1 differences
+        mv = 0 # vertical -1 differences
+        score = m
+        for char in tgt:
+            eq = peq.get(char, 0)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            if ph & last_bit:
+                score += 1
+            elif mh & last_bit:
+                score -= 1
+            # The first row of the DP table is 0, 1, 2, ..., so every horizontal difference there is +1
+            ph = (ph << 1) | 1
+            mh = mh << 1
+            pv = (mh | ~(xv | ph)) & all_ones
+            mv = ph & xv & all_ones
+        return score
+
+    @staticmethod
+    def _edit_distance_batch(pairs):
+        '''Levenshtein distances of many pairs, with the algorithm of _edit_distance run on all
+        pairs at once. Source words must have 1 to WORD_BITS characters, target words at least 1.
+        Args:
+            pairs: list, list of (src, tgt) pairs
+        Returns:
+            np.array, edit distance of every pair
+        '''
+        def encode(words, pad):
+            # Code points of fixed-width strings, one row per word
+            width = max(len(word) for word in words)
+            codes = np.array(words, dtype=f"<U{width}").view(np.uint32).reshape(len(words), width).astype(np.int64)
+            lengths = np.array([len(word) for word in words], dtype=np.int64)
+            codes[np.arange(width) >= lengths[:, None]] = pad
+            return codes, lengths
+        # Padding of source and target words never matches
+        src_codes, src_lengths = encode([src for src, _ in pairs], -1)
+        tgt_codes, tgt_lengths = encode([tgt for _, tgt in pairs], -2)
+        src_lengths = src_lengths.astype(np.uint64)
+
+        one = np.uint64(1)
+        bits = one << np.arange(src_codes.shape[1], dtype=np.uint64)
+        # Shifting by 64 is undefined, so all ones is built from the last bit
+        last_bit = one << (src_lengths - one)
+        all_ones = last_bit | (last_bit - one)
+        pv = all_ones.copy()
+        mv = np.zeros(len(pairs), dtype=np.uint64)
+        score = src_lengths.astype(np.int64)
+        for t in range(tgt_codes.shape[1]):
+            active = t < tgt_lengths
+            # eq has bit i set iff src[i] == tgt[t]; the bits are distinct, so the sum is their union
+            eq = ((src_codes == tgt_codes[:, t:t+1]) * bits).sum(axis=1, dtype=np.uint64)
+            xv = eq | mv
+            xh = (((eq & pv) + pv) ^ pv) | eq
+            ph = mv | ~(xh | pv)
+            mh = pv & xh
+            plus = (ph & last_bit) != 0
+            minus = ~plus & ((mh & last_bit) != 0)
+            score += np.where(active, plus.astype(np.int64) - minus, 0)
+            ph = (ph << one) | one
+            mh = mh << one
+            pv = np.where(active, (mh | ~(xv | ph)) & all_ones, pv)
+            mv = np.where(active, ph & xv & all_ones, mv)
+        return score
+
+    def edit_distance(self, src, tgt):
+        '''Get the edit distance between src and tgt
+        Args:
+            src: str, source word
+            tgt: str, target word
+        Returns:
+            int, edit distance
+        '''
+        key = (src, tgt)
+        if key not in self.distance_cache:
+            self.distance_cache[key] = self._edit_distance(src, tgt)
+        return self.distance_cache[key]
+
+    def ned(self, src, tgt):
+        '''Get the normalized edit distance between src and tgt
+        Args:
+            src: str, source word
+            tgt: str, target word
+        Returns:
+            float, edit distance divided by the length of the longer word
+        '''
+        return self.edit_distance(src, tgt)/max(len(src), len(tgt))
+
+    @staticmethod
+    def _min_ops(src, tgt):
+        '''Fill the DP table and backtrace the operations from the end of both words'''
+        n = len(src)
+        m = len(tgt)
+        dp = [list(range(m + 1))]
+        for i in range(1, n + 1):
+            prev = dp[-1]
+            row = [i] * (m + 1)
+            src_char = src[i-1]
+            for j in range(1, m + 1):
+                if src_char == tgt[j-1]:
+                    row[j] = prev[j-1]
+                else:
+                    row[j] = 1 + min(prev[j], row[j-1], prev[j-1])
+            dp.append(row)
+
+        i, j = n, m
+        ops = []
+        while i > 0 and j > 0:
+            if src[i-1] == tgt[j-1]:
+                i -= 1
+                j -= 1
+            else:
+                if dp[i][j] == 1 + dp[i-1][j-1]:
+                    ops.append((i-1, j-1, "replace"))
+                    i -= 1
+                    j -= 1
+                elif dp[i][j] == 1 + dp[i-1][j]:
+                    ops.append((i-1, j, "delete"))
+                    i -= 1
+                else:
+                    ops.append((i, j-1, "insert"))
+                    j -= 1
+        while i > 0:
+            ops.append((i-1, j, "delete"))
+            i -= 1
+        while j > 0:
+            ops.append((i, j-1, "insert"))
+            j -= 1
+        return dp[n][m], ops
+
+    def ops(self, src, tgt):
+        '''Get a minimum list of operations to convert src to tgt
+        Args:
+            src: str, source word
+            tgt: str, target word
+        Returns:
+            ops (list): [(src_pos, tgt_pos, operation)], from the end of the words to the start.
+                For replacements, src[src_pos] --> tgt[tgt_pos]
+        '''
+        key = (src, tgt)
+        if key not in self.ops_cache:
+            distance, self.ops_cache[key] = self._min_ops(src, tgt)
+            self.distance_cache[key] = distance
+        return self.ops_cache[key]
+
+    def align(self, src, tgt):
+        '''Get both the NED and the operations to convert src to tgt
+        Returns:
+            ned (float): normalized edit distance
+            ops (list): list of operations, see ops
+        '''
+        ops = self.ops(src, tgt)
+        return self.ned(src, tgt), ops
+
+    def ned_batch(self, pairs):
+        '''Get the normalized edit distances of many pairs. Distances that are not cached are
+        computed together (see _edit_distance_batch).
+        Args:
+            pairs: list, list of (src, tgt) pairs
+        Returns:
+            np.array, NED of every pair
+        '''
+        pairs = [tuple(pair) for pair in pairs]
+        uncached = list(dict.fromkeys(pair for pair in pairs if pair not in self.distance_cache))
+        batchable = [(src, tgt) for src, tgt in uncached if 0 < len(src) <= WORD_BITS and len(tgt) > 0]
+        for start in range(0, len(batchable), BATCH_SIZE):
+            batch = batchable[start:start + BATCH_SIZE]
+            for pair, distance in zip(batch, self._edit_distance_batch(batch)):
+                self.distance_cache[pair] = int(distance)
+        distances = np.array([self.edit_distance(src, tgt) for src, tgt in pairs], dtype=float)
+        return distances / np.array([max(len(src), len(tgt)) for src, tgt in pairs], dtype=float)
+
+    def align_batch(self, pairs, threshold = None):
+        '''Align many pairs. Operations are only computed for pairs with NED <= threshold.
+        Args:
+            pairs: list, list of (src, tgt) pairs
+            threshold: float, NED threshold (default: align all pairs)
+        Returns:
+            neds: np.array, NED of every pair
+            ops: list, operations of every pair, or None for pairs above the threshold
+        '''
+        neds = self.ned_batch(pairs)
+        ops = list()
+        for (src, tgt), ned in zip(pairs, neds):
+            if threshold is not None and ned > threshold:
+                ops.append(None)
+            else:
+                ops.append(self.ops(src, tgt))
+        return neds, ops
+
+    def clear_cache(self):
+        '''Forget all cached alignments'''
+        self.distance_cache.clear()
+        self.ops_cache.clear()
@@ -0,0 +1,159 @@
+'''
+Bootstrap confidence intervals for the noiser posteriors.
+
+The posteriors are point estimates over the pairs of a bilingual lexicon. To see how much they
+depend on which pairs made it into the lexicon, we resample the pairs with replacement, and
+recompute the posteriors on every replicate. Realigning the lexicon per replicate would take
+hours, but every posterior is a function of per-pair counts:
+    - theta_func: pairs with a functional source word, and which of them changed
+    - theta_content: pairs with a content source word, and which of them are new words (different,
+      not in the source vocabulary, not the same stem, NED above the threshold)
+    - theta_morph: per pair and suffix of the source word, whether the suffix was seen with the
+      same stem, and whether it changed
+    - theta_phon: per pair and character trigram of the source word, occurrences and changes
+      (see Posterior.get_phonological_counts)
+So we compute these once (PairStats), and a replicate is just a vector of weights, i.e. how
+often each pair was drawn. The counts of B replicates are then (B, #pairs) x (#pairs, ...)
+products, and every theta is a reduction over them.
+
+Replicates are computed in chunks, each with its own seed spawned from the seed of the run, so
+the intervals are the same for any number of worker processes.
+'''
+import multiprocessing
+
+import numpy as np
+from scipy import sparse
+
+THETA_NAMES = ["theta_func", "theta_content", "theta_morph", "theta_phon"]
+
+# Pair statistics, set in the parent process before the worker processes are forked
+_WORKER_PAIR_STATS = None
+
+
+def mean_observed_ratio(total, changed):
+    '''Average the proportion of changes over the items (trigrams, suffixes) that occur
+    Args:
+        total: np.array, (..., #items), occurrences of each item
+        changed: np.array, (..., #items), changes of each item
+    Returns:
+        np.array, one average per row (nan for rows where no item occurs)
+    '''
+    total = np.asarray(total, dtype=float)
+    observed = total > 0
+    ratios = np.divide(changed, total, out=np.zeros(total.shape), where=observed)
+    num_observed = observed.sum(axis=-1)
+    return np.divide(ratios.sum(axis=-1), num_observed, out=np.full(np.shape(num_observed), np.nan), \
+                     where=num_observed > 0)
+
+
+class PairStats:
+
+    def __init__(self, post):
+        '''Compute the statistics of every lexicon pair that the posteriors depend on
+        Args:
+            post: Posterior, with the lexicon, source tables and aligner
+        '''
+        lexicon = post.bil_lexicon
+        threshold = post.lang_specific_ned_thresholds[post.lang]
+        self.num_pairs = len(lexicon)
+
+        self.functional = np.array([post.is_word_functional(src) for src, _ in lexicon], dtype=bool)
+        self.changed = np.array([src != tgt for src, tgt in lexicon], dtype=bool)
+        self.same_stem = np.array([bool(post.same_stem(src, tgt)) for src, tgt in lexicon], dtype=bool)
+        self.ned = np.asarray(post.aligner.ned_batch(lexicon), dtype=float)
+        in_src_vocab = np.array([tgt in post.src_vocab for _, tgt in lexicon], dtype=bool)
+        # See Posterior.post_lexical_noiser
+        self.new_content = ~self.functional & self.changed & ~in_src_vocab & ~self.same_stem & (self.ned > threshold)
+
+        # See Posterior.post_morphological_noiser
+        suffix2id = {suffix: idx for idx, suffix in enumerate(post.src_suffix_freq)}
+        rows, cols, changes = list(), list(), list()
+        for idx, (src, tgt) in enumerate(lexicon):
+            if not self.same_stem[idx]:
+                continue
+            for src_suffix in post.src_suffix_trie.matching_suffixes(src, max_length = round(len(src)/2)):
+                rows.append(idx)
+                cols.append(suffix2id[src_suffix])
+                changes.append(not tgt.endswith(src_suffix))
+        shape = (self.num_pairs, len(suffix2id))
+        self.suffix_counts = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=shape)
+        self.suffix_changes = sparse.csr_matrix((np.array(changes, dtype=float), (rows, cols)), shape=shape)
+
+        self.trigram_counts, self.trigram_changes, _ = post.get_phonological_counts()
+
+    def get_thetas(self, weights):
+        '''Compute all posteriors for a batch of pair weights
+        Args:
+            weights: np.array, (B, #pairs), how often each pair is counted in each replicate
+        Returns:
+            np.array, (B, 4), theta_func, theta_content, theta_morph, theta_phon per replicate
+                (nan where a theta is undefined, e.g. no functional words were drawn)
+        '''
+        weights = np.atleast_2d(np.asarray(weights, dtype=float))
+
+        def ratio(numerator, denominator):
+            return np.divide(numerator, denominator, out=np.full(denominator.shape, np.nan), where=denominator > 0)
+
+        theta_func = ratio(weights @ (self.functional & self.changed), weights @ self.functional)
+        theta_content = ratio(weights @ self.new_content, weights @ ~self.functional)
+        # (B, #pairs) x (#pairs, #items) as (#items, #pairs) x (#pairs, B), since the left operand is sparse
+        theta_morph = mean_observed_ratio((self.suffix_counts.T @ weights.T).T, (self.suffix_changes.T @ weights.T).T)
+        theta_phon = mean_observed_ratio((self.trigram_counts.T @ weights.T).T, (self.trigram_changes.T @ weights.T).T)
+        return np.stack([theta_func, theta_content, theta_morph, theta_phon], axis=1)
+
+
+def draw_replicate_weights(num_pairs, num_replicates, rng):
+    '''Draw bootstrap replicates as index arrays, and count how often each pair was drawn
+    Args:
+        num_pairs: int, number of lexicon pairs
+        num_replicates: int, number of replicates
+        rng: np.random.Generator
+    Returns:
+        np.array, (num_replicates, num_pairs), weights of the pairs in each replicate
+    '''
+    idxs = rng.integers(0, num_pairs, size=(num_replicates, num_pairs))
+    # Offset the indices of each replicate, so that one bincount counts all replicates
+    idxs += np.arange(num_replicates)[:, None] * num_pairs
+    return np.bincount(idxs.ravel(), minlength=num_replicates * num_pairs).reshape(num_replicates, num_pairs)
+
+def _bootstrap_chunk(pair_stats, num_replicates, seed_seq):
+    rng = np.random.default_rng(seed_seq)
+    return pair_stats.get_thetas(draw_replicate_weights(pair_stats.num_pairs, num_replicates, rng))
+
+def _bootstrap_chunk_worker(chunk):
+    num_replicates, seed_seq = chunk
+    return _bootstrap_chunk(_WORKER_PAIR_STATS, num_replicates, seed_seq)
+
+def bootstrap_posteriors(pair_stats, num_replicates = 1000, alpha = 0.05, seed = 42, chunk_size = 100, num_workers = 1):
+    '''Estimate the posteriors with percentile bootstrap confidence intervals
+    Args:
+        pair_stats: PairStats of the lexicon
+        num_replicates: int, number of bootstrap replicates
+        alpha: float, the intervals cover 1 - alpha
+        seed: int, seed for resampling
+        chunk_size: int, number of replicates per chunk
+        num_workers: int, number of processes
+    Returns:
+        intervals: dict, {theta_name: (theta, low, high)}
+    '''
+    global _WORKER_PAIR_STATS
+    chunk_sizes = [min(chunk_size, num_replicates - start) for start in range(0, num_replicates, chunk_size)]
+    chunks = list(zip(chunk_sizes, np.random.SeedSequence(seed).spawn(len(chunk_sizes))))
+
+    num_workers = max(1, min(num_workers, len(chunks)))
+    if num_workers == 1:
+        thetas = [_bootstrap_chunk(pair_stats, *chunk) for chunk in chunks]
+    else:
+        # Forked workers inherit the pair statistics instead of pickling them per chunk
+        _WORKER_PAIR_STATS = pair_stats
+        try:
+            with multiprocessing.get_context("fork").Pool(num_workers) as pool:
+                thetas = pool.map(_bootstrap_chunk_worker, chunks)
+        finally:
+            _WORKER_PAIR_STATS = None
+    thetas = np.concatenate(thetas)
+
+    point = pair_stats.get_thetas(np.ones((1, pair_stats.num_pairs)))[0]
+    lows, highs = np.nanpercentile(thetas, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+    return {theta_name: (float(point[idx]), float(lows[idx]), float(highs[idx])) \
+            for idx, theta_name in enumerate(THETA_NAMES)}
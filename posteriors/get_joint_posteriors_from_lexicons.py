@@ -25,35 +25,55 @@ from typing import List
 from collections import defaultdict
 
 import os, sys
+import argparse
+import multiprocessing
+import numpy as np
+from scipy import sparse
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append("../")
 from noisers.utils.get_functional_words import OUTDIR, closed_class_tags
 from noisers.utils.get_functional_words import output_paths as ud_wordlists_paths
+from noisers.utils.get_functional_words import get_functional_word_index
+from noisers.utils.suffix_trie import SuffixTrie
 
 from get_lexicons import json_to_list_of_pairs
+from alignment import AlignmentEngine
+from bootstrap import THETA_NAMES, PairStats, bootstrap_posteriors, mean_observed_ratio
 
 class Posterior:
 
     def __init__(self, lang, bil_lexicon_json_file, src_text_file, \
-                 noise_types: List = list()):
+                 noise_types: List = list(), src_vocab = None, src_suffix_freq = None):
         '''
         Args: 
             lang (str): language code of hrl
             noise_types (list): list of noise types for which we want posterior
             bil_lexicon (list): list of pairs (hrl, lrl) - may have multiple listings for the same src word
-            src_vocab (dict): frequency map of hrl vocabulary
+            src_vocab (dict): frequency map of hrl vocabulary. If None, read from src_text_file
+            src_suffix_freq (dict): top k suffixes of the hrl vocabulary (see get_src_tables). 
+                If None, computed from src_vocab
             tgt_vocab (dict): frequency map of lrl vocabulary
         '''
         self.lang = lang
         self.bil_lexicon = json_to_list_of_pairs(bil_lexicon_json_file)
 
-        self.src_vocab = self.get_vocab(src_text_file)
+        # The hrl tables are the same for all lrls of an hrl, so the driver can pass them in
+        if src_vocab is None:
+            src_vocab = self.get_vocab(src_text_file)
+        self.src_vocab = src_vocab
+        if src_suffix_freq is None:
+            src_suffix_freq = self.filter_suffix_topk(self.get_suffix_frequency(self.src_vocab))
+        self.src_suffix_freq = src_suffix_freq
+        self.src_suffix_trie = SuffixTrie(self.src_suffix_freq)
         tgt_vocab = defaultdict(lambda: 0)
         for (_, tgt) in self.bil_lexicon:
             tgt_vocab[tgt] += 1
         self.tgt_vocab = tgt_vocab
 
-        self.tag2wordlist = self.get_tag2wordlist()
+        self.functional_words, self.word2tag = get_functional_word_index(self.lang)
+
+        # Edit distances and alignments of lexicon pairs, shared by all posteriors
+        self.aligner = AlignmentEngine()
 
         # The following thresholds are trying to set a threshold for each language
         # for NED, for two words to be considered as only having a phonological change
@@ -64,7 +84,8 @@ class Posterior:
         }
         self.lang_specific_ned_thresholds = defaultdict(lambda: 0.4, self.lang_specific_ned_thresholds)
 
-    def get_vocab(self, text_file):
+    @staticmethod
+    def get_vocab(text_file):
         '''Initialize vocabulary from vocab file'''
         print(f"Initializing vocabulary from {text_file}...")
         vocab = defaultdict(lambda: 0)
@@ -88,18 +109,9 @@ class Posterior:
 
         return vocab
 
-    def get_tag2wordlist(self):
-        '''Get tag2wordlist from the JSON file'''
-        with open(ud_wordlists_paths[self.lang]) as f:
-            tag2wordlist = json.load(f)
-        return tag2wordlist
-
     def is_word_functional(self, word):
         '''Check if word is functional'''
-        for tag in self.tag2wordlist:
-            if word in self.tag2wordlist[tag]:
-                return True
-        return False
+        return word in self.functional_words
 
     def post_lexical_noiser(self):
         '''
@@ -126,7 +138,7 @@ class Posterior:
                     if not self.same_stem(src, tgt):
                         # We also want to check that the words don't have a high NED, because that would
                         # be a phonological change
-                        ned, _ = self.min_ops(src, tgt)
+                        ned = self.aligner.ned(src, tgt)
                         if ned > self.lang_specific_ned_thresholds[self.lang]:
                             count_content += 1
                             if debug:
@@ -149,77 +161,44 @@ class Posterior:
             ned (float): normalized edit distance
             ops (list): list of operations
         '''
-        n = len(src)
-        m = len(tgt)
-        dp = [[0 for _ in range(m+1)] for _ in range(n+1)]
-        for i in range(n+1):
-            dp[i][0] = i
-        for j in range(m+1):
-            dp[0][j] = j
-        for i in range(1, n+1):
-            for j in range(1, m+1):
-                if src[i-1] == tgt[j-1]:
-                    dp[i][j] = dp[i-1][j-1]
-                else:
-                    dp[i][j] = 1 + min(dp[i-1][j], dp[i][j-1], dp[i-1][j-1])
-        i, j = n, m
-        ops = []
-        while i > 0 and j > 0:
-            if src[i-1] == tgt[j-1]:
-                i -= 1
-                j -= 1
-            else:
-                if dp[i][j] == 1 + dp[i-1][j-1]:
-                    ops.append((i-1, j-1, "replace"))
-                    i -= 1
-                    j -= 1
-                elif dp[i][j] == 1 + dp[i-1][j]:
-                    ops.append((i-1, j, "delete"))
-                    i -= 1
-                else:
-                    ops.append((i, j-1, "insert"))
-                    j -= 1
-        while i > 0:
-            ops.append((i-1, j, "delete"))
-            i -= 1
-        while j > 0:
-            ops.append((i, j-1, "insert"))
-            j -= 1
-
-        ned = dp[n][m]/max(n, m)
-        return ned, ops
+        return self.aligner.align(src, tgt)
 
-    def post_phonological_noiser(self):
+    def get_phonological_counts(self):
         '''
-        Find theta_phon i.e. the proportion of character ngrams with a new middle character.
-        We do this in the following way:
-        Collect all character grams of length 3 in the source lexicon
-        1. For every src-tgt pair, see whether they have "high-enough" NED
-        2. If so, count insertions, deletions, and replacements in between identical characters
-
-        There are a number of issues with the above, but there are also the same problems with the original
-        noiser, so it's okay. Or at least, it's consistently bad.
+        Count, for every lexicon pair, the character trigrams of the source word, and the trigrams
+        whose middle character changed (see post_phonological_noiser). Trigrams are interned into
+        integer IDs, so that the counts of all pairs are one sparse matrix, and theta_phon for any
+        reweighting of the pairs (e.g. a bootstrap replicate) is a matrix product.
+        The counts are computed once, from one batch of alignments.
+        Returns:
+            total_counts: sparse.csr_matrix, (#pairs, #trigrams), occurrences of each trigram in each
+                pair. Pairs that are identical or above the NED threshold have no trigrams.
+            changed_counts: sparse.csr_matrix, (#pairs, #trigrams), changes of each trigram in each pair
+            ngrams: list, trigram of each ID
         '''
+        if hasattr(self, "phonological_counts"):
+            return self.phonological_counts
+
         threshold = self.lang_specific_ned_thresholds[self.lang]
-        total_ngrams = defaultdict(lambda: 0)
-        changed_ngrams = defaultdict(lambda: 0)
-        for (src, tgt) in self.bil_lexicon:
-            if src == tgt:
-                continue
+        pair_idxs = [idx for idx, (src, tgt) in enumerate(self.bil_lexicon) if src != tgt]
+        pairs = [("<" + self.bil_lexicon[idx][0] + ">", "<" + self.bil_lexicon[idx][1] + ">") for idx in pair_idxs]
+        # Only pairs under the threshold need the operations
+        neds, all_ops = self.aligner.align_batch(pairs, threshold = threshold)
+
+        ngram2id = dict()
+        total_rows, total_cols = list(), list()
+        changed_rows, changed_cols = list(), list()
+        for idx, (src, tgt), ned, ops in zip(pair_idxs, pairs, neds, all_ops):
             if debug_phon:
                 print(f"Source: {src}, Target: {tgt}")
-            src = "<" + src + ">"
-            tgt = "<" + tgt + ">"
-            ned, ops = self.min_ops(src, tgt)
-            if debug_phon:
                 print(f"NED: {ned}")
-                print(f"Ops: {ops}")
-            if ned > threshold:
+            if ops is None:
                 if debug_phon:
                     print(f"Too high NED")
                 continue
-            for i in range(len(ops)):
-                src_pos, tgt_pos, op = ops[i]
+            if debug_phon:
+                print(f"Ops: {ops}")
+            for src_pos, tgt_pos, op in ops:
                 if op == "replace":
                     if src[src_pos] == tgt[tgt_pos]:
                         continue
@@ -228,19 +207,51 @@ class Posterior:
                     if src[src_pos - 1] == tgt[tgt_pos - 1] and src[src_pos + 1] == tgt[tgt_pos + 1]:
                         if debug_phon:
                             print(f"Changed ngram: {src[src_pos-1:src_pos+2]}-->{tgt[tgt_pos-1:tgt_pos+2]}")
-                        changed_ngrams[src[src_pos-1:src_pos+2]] += 1
+                        changed_rows.append(idx)
+                        changed_cols.append(ngram2id.setdefault(src[src_pos-1:src_pos+2], len(ngram2id)))
             for i in range(1, len(src) - 1):
-                total_ngrams[src[i-1:i+2]] += 1
-        
-        theta_per_ngram = {ngram: changed_ngrams[ngram]/total_ngrams[ngram] for ngram in total_ngrams}
-        theta_phon = sum(theta_per_ngram.values())/len(theta_per_ngram)
+                total_rows.append(idx)
+                total_cols.append(ngram2id.setdefault(src[i-1:i+2], len(ngram2id)))
+
+        shape = (len(self.bil_lexicon), len(ngram2id))
+        # Duplicate entries are summed
+        total_counts = sparse.csr_matrix((np.ones(len(total_rows)), (total_rows, total_cols)), shape=shape)
+        changed_counts = sparse.csr_matrix((np.ones(len(changed_rows)), (changed_rows, changed_cols)), shape=shape)
+        self.phonological_counts = (total_counts, changed_counts, list(ngram2id))
+        return self.phonological_counts
+
+    @staticmethod
+    def theta_phon_from_counts(total, changed):
+        '''Average the proportion of changes over the trigrams that occur
+        Args:
+            total: np.array, (..., #trigrams), occurrences of each trigram
+            changed: np.array, (..., #trigrams), changes of each trigram
+        Returns:
+            theta_phon, one per row
+        '''
+        return mean_observed_ratio(total, changed)
+
+    def post_phonological_noiser(self):
+        '''
+        Find theta_phon i.e. the proportion of character ngrams with a new middle character.
+        We do this in the following way:
+        Collect all character grams of length 3 in the source lexicon
+        1. For every src-tgt pair, see whether they have "high-enough" NED
+        2. If so, count insertions, deletions, and replacements in between identical characters
+
+        There are a number of issues with the above, but there are also the same problems with the original
+        noiser, so it's okay. Or at least, it's consistently bad.
+        '''
+        total_counts, changed_counts, _ = self.get_phonological_counts()
+        theta_phon = self.theta_phon_from_counts(np.asarray(total_counts.sum(axis=0)).ravel(), \
+                                                 np.asarray(changed_counts.sum(axis=0)).ravel())
 
         if debug_phon:
             print(f"theta_phon: {theta_phon}")
-        return theta_phon
+        return float(theta_phon)
 
-
-    def get_suffix_frequency(self, vocab):
+    @staticmethod
+    def get_suffix_frequency(vocab):
         '''Get suffix frequency map from vocab
         Args:
             vocab: dict, vocabulary of type {word: count}
@@ -256,7 +267,8 @@ class Posterior:
 
         return suffix_freq
 
-    def filter_suffix_topk(self, suffix_freq, k = 200):
+    @staticmethod
+    def filter_suffix_topk(suffix_freq, k = 200):
         '''
         Filter top k suffixes from suffix_freq
         '''
@@ -308,11 +320,8 @@ class Posterior:
             to get theta_morph.
         '''
 
-        # Collect all suffixes
-        src_suffix_freq = self.get_suffix_frequency(self.src_vocab)
-
-        # Filter top k suffixes
-        src_suffix_freq = self.filter_suffix_topk(src_suffix_freq)
+        # Top k suffixes of the source vocabulary
+        src_suffix_freq = self.src_suffix_freq
         if debug:
             print(f"Resulting suffix freq: ")
             print(*src_suffix_freq.items(), sep="\n")
@@ -321,24 +330,22 @@ class Posterior:
         suffix_changes = defaultdict(lambda: 0)
         suffix_counts = defaultdict(lambda: 0)
         for (src, tgt) in self.bil_lexicon:
-            for i in range(1, round(len(src)/2) + 1): # When we do this, we are basically saying that the word
-                # exhibits *all* suffixes that it has. 
-                # This is probably unlikely, but it's okay because we're checking whether the suffix belongs
-                # in our collected list, which hopefully only has linguistic suffixes
-                src_suffix = src[-i:]
-                if src_suffix in src_suffix_freq:
+            # When we do this, we are basically saying that the word exhibits *all* suffixes that it has.
+            # This is probably unlikely, but it's okay because we're checking whether the suffix belongs
+            # in our collected list, which hopefully only has linguistic suffixes
+            for src_suffix in self.src_suffix_trie.matching_suffixes(src, max_length = round(len(src)/2)):
+                if debug:
+                    print(f"Source: {src}, Target: {tgt}, Suffix: {src_suffix}")
+                # Now we'll check whether source and target have the same stem
+                if not self.same_stem(src, tgt):
                     if debug:
-                        print(f"Source: {src}, Target: {tgt}, Suffix: {src_suffix}")
-                    # Now we'll check whether source and target have the same stem
-                    if not self.same_stem(src, tgt):
-                        if debug:
-                            print(f"Source and target don't have the same stem")
-                        continue
-                    suffix_counts[src_suffix] += 1
-                    if tgt[-i:] != src[-i:]:
-                        if debug:
-                            print(f"Suffix changed")
-                        suffix_changes[src_suffix] += 1
+                        print(f"Source and target don't have the same stem")
+                    continue
+                suffix_counts[src_suffix] += 1
+                if not tgt.endswith(src_suffix):
+                    if debug:
+                        print(f"Suffix changed")
+                    suffix_changes[src_suffix] += 1
 
 
         # Find the proportion of times the suffix was changed
@@ -381,11 +388,8 @@ class Posterior:
             to get theta_morph.
         '''
 
-        # Collect all suffixes
-        src_suffix_freq = self.get_suffix_frequency(self.src_vocab)
-
-        # Filter top k suffixes
-        src_suffix_freq = self.filter_suffix_topk(src_suffix_freq)
+        # Top k suffixes of the source vocabulary
+        src_suffix_freq = self.src_suffix_freq
         if debug:
             print(f"Resulting suffix freq: ")
             print(*src_suffix_freq.items(), sep="\n")
@@ -474,56 +478,156 @@ iso3_to_iso2 = {
     "arb": "ar",
 }
 
-posteriors = defaultdict(lambda: dict())
-
-for src_lang in related_lrls:
-    for tgt_lang in sorted(list(related_lrls[src_lang])):
-        if src_lang not in {"hin"} or tgt_lang not in {"mai", "hne"}:
+LEXICONS_DIR = "/export/b08/nbafna1/projects/llm-robustness-to-xlingual-noise/posteriors/flores_lexicons"
+# LEXICONS_DIR = "/export/b08/nbafna1/projects/llm-robustness-to-xlingual-noise/posteriors/google_translate_lexicons"
+DATASETS_DIR = "/export/b08/nbafna1/projects/llm-robustness-to-xlingual-noise/datasets"
+
+# Tables of each hrl, set in the parent process before the worker processes are forked
+_WORKER_SRC_TABLES = None
+
+def get_lexicon_file(src_lang, tgt_lang):
+    return f"{LEXICONS_DIR}/{src_lang}_{tgt_lang}.json"
+
+def get_src_text_file(src_lang):
+    return f"{DATASETS_DIR}/{iso3_to_iso2[src_lang]}/mmlu_{iso3_to_iso2[src_lang]}.txt"
+
+def get_src_tables(src_lang):
+    '''Read the hrl vocabulary and its top k suffixes, once per hrl
+    Args:
+        src_lang: str, hrl code
+    Returns:
+        src_vocab: dict, frequency map of hrl vocabulary
+        src_suffix_freq: dict, top k suffixes of the hrl vocabulary
+    '''
+    src_vocab = Posterior.get_vocab(get_src_text_file(src_lang))
+    src_suffix_freq = Posterior.filter_suffix_topk(Posterior.get_suffix_frequency(src_vocab))
+    return src_vocab, src_suffix_freq
+
+def estimate_posteriors(src_lang, tgt_lang, src_tables = None, num_bootstrap = 0, alpha = 0.05, bootstrap_workers = 1):
+    '''Estimate the posteriors of all noisers for one hrl-lrl pair
+    Args:
+        src_lang: str, hrl code
+        tgt_lang: str, lrl code
+        src_tables: tuple, (src_vocab, src_suffix_freq) from get_src_tables
+        num_bootstrap: int, if > 0, number of bootstrap replicates for confidence intervals
+        alpha: float, the confidence intervals cover 1 - alpha
+        bootstrap_workers: int, number of processes for the bootstrap
+    Returns:
+        (theta_func, theta_content, theta_morph, theta_phon), rounded to 2 decimals,
+        followed by (low, high) of each theta if num_bootstrap > 0
+    '''
+    if src_tables is None:
+        src_tables = get_src_tables(src_lang)
+    src_vocab, src_suffix_freq = src_tables
+    print(f"Source language: {src_lang}, Target language: {tgt_lang}")
+    post = Posterior(src_lang, get_lexicon_file(src_lang, tgt_lang), get_src_text_file(src_lang), \
+                     src_vocab = src_vocab, src_suffix_freq = src_suffix_freq)
+    theta_f, theta_c = post.post_lexical_noiser()
+    theta_morph = post.post_morphological_noiser()
+    theta_phon = post.post_phonological_noiser()
+    print(f"{src_lang} -> {tgt_lang}")
+    print(f"Theta content: {round(theta_c, 2)}")
+    print(f"Theta func: {round(theta_f, 2)}")
+    print(f"Theta morph: {round(theta_morph, 2)}")
+    print(f"Theta phon: {round(theta_phon, 2)}")
+    thetas = (round(theta_f, 2), round(theta_c, 2), round(theta_morph, 2), round(theta_phon, 2))
+    if num_bootstrap > 0:
+        intervals = bootstrap_posteriors(PairStats(post), num_replicates = num_bootstrap, alpha = alpha, \
+                                         num_workers = bootstrap_workers)
+        bounds = list()
+        for theta_name in THETA_NAMES:
+            _, low, high = intervals[theta_name]
+            print(f"{theta_name} {round(100 * (1 - alpha))}% CI: ({round(low, 2)}, {round(high, 2)})")
+            bounds.extend([round(low, 2), round(high, 2)])
+        thetas += tuple(bounds)
+    return thetas
+
+def _estimate_posteriors_worker(args):
+    src_lang, tgt_lang, num_bootstrap, alpha, bootstrap_workers = args
+    return src_lang, tgt_lang, estimate_posteriors(src_lang, tgt_lang, _WORKER_SRC_TABLES[src_lang], \
+                                                   num_bootstrap, alpha, bootstrap_workers)
+
+def estimate_all_posteriors(pairs, num_workers = None, num_bootstrap = 0, alpha = 0.05):
+    '''Estimate posteriors for many hrl-lrl pairs. The hrl tables are read once per hrl, and
+    the pairs are spread over a process pool.
+    Args:
+        pairs: list, list of (src_lang, tgt_lang)
+        num_workers: int, number of processes (default: one per CPU, at most one per pair)
+        num_bootstrap: int, if > 0, number of bootstrap replicates for confidence intervals
+        alpha: float, the confidence intervals cover 1 - alpha
+    Returns:
+        posteriors: dict, {src_lang: {tgt_lang: (theta_func, theta_content, theta_morph, theta_phon)}},
+            followed by the confidence intervals if num_bootstrap > 0 (see estimate_posteriors)
+    '''
+    global _WORKER_SRC_TABLES
+    _WORKER_SRC_TABLES = {src_lang: get_src_tables(src_lang) for src_lang in sorted({src_lang for src_lang, _ in pairs})}
+
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    # With a single pair, the processes are used by the bootstrap instead
+    bootstrap_workers = num_workers if len(pairs) == 1 else 1
+    num_workers = max(1, min(num_workers, len(pairs)))
+    worker_args = [(src_lang, tgt_lang, num_bootstrap, alpha, bootstrap_workers) for src_lang, tgt_lang in pairs]
+
+    posteriors = defaultdict(dict)
+    if num_workers == 1:
+        results = map(_estimate_posteriors_worker, worker_args)
+        for src_lang, tgt_lang, thetas in results:
+            posteriors[src_lang][tgt_lang] = thetas
+    else:
+        # Forked workers inherit the hrl tables instead of pickling them per pair
+        with multiprocessing.get_context("fork").Pool(num_workers) as pool:
+            for src_lang, tgt_lang, thetas in pool.imap_unordered(_estimate_posteriors_worker, worker_args):
+                posteriors[src_lang][tgt_lang] = thetas
+    return posteriors
+
+def write_posteriors(posteriors, output_file):
+    '''Write posteriors of all pairs to one TSV file
+    Args:
+        posteriors: dict, output of estimate_all_posteriors
+        output_file: str, path to output TSV file
+    '''
+    columns = list(THETA_NAMES)
+    if any(len(thetas) > len(THETA_NAMES) for tgt_posteriors in posteriors.values() for thetas in tgt_posteriors.values()):
+        columns += [f"{theta_name}_{bound}" for theta_name in THETA_NAMES for bound in ["low", "high"]]
+    with open(output_file, "w") as f:
+        f.write("\t".join(["src_lang", "tgt_lang"] + columns) + "\n")
+        for src_lang in sorted(posteriors):
+            for tgt_lang in sorted(posteriors[src_lang]):
+                thetas = "\t".join(str(theta) for theta in posteriors[src_lang][tgt_lang])
+                f.write(f"{src_lang}\t{tgt_lang}\t{thetas}\n")
+    print(f"Wrote posteriors to {output_file}")
+
+def print_posteriors(posteriors):
+    '''Print posteriors per hrl, one theta at a time'''
+    for src_lang in posteriors:
+        print(f"Source language: {src_lang}")
+        for idx, theta_name in enumerate(["theta_f", "theta_c", "theta_morph", "theta_phon"]):
+            print(theta_name)
+            for tgt_lang in sorted(posteriors[src_lang]):
+                print(posteriors[src_lang][tgt_lang][idx])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate noiser posteriors for hrl-lrl pairs from bilingual lexicons")
+    parser.add_argument("--src_langs", type=str, nargs="+", default=None, help="hrls to run (default: all)")
+    parser.add_argument("--tgt_langs", type=str, nargs="+", default=None, help="lrls to run (default: all related lrls)")
+    parser.add_argument("--num_workers", type=int, default=None, help="Number of processes (default: one per CPU)")
+    parser.add_argument("--num_bootstrap", type=int, default=0, help="Number of bootstrap replicates for confidence intervals (default: none)")
+    parser.add_argument("--alpha", type=float, default=0.05, help="Confidence intervals cover 1 - alpha")
+    parser.add_argument("--output_file", type=str, default=None, help="TSV file for the posteriors of all pairs")
+    args = parser.parse_args()
+
+    pairs = list()
+    for src_lang in related_lrls:
+        if args.src_langs is not None and src_lang not in args.src_langs:
             continue
-        print(f"Source language: {src_lang}, Target language: {tgt_lang}")
-        bil_lexicon_json_file = f"/export/b08/nbafna1/projects/llm-robustness-to-xlingual-noise/posteriors/flores_lexicons/{src_lang}_{tgt_lang}.json"
-        # bil_lexicon_json_file = f"/export/b08/nbafna1/projects/llm-robustness-to-xlingual-noise/posteriors/google_translate_lexicons/{src_lang}_{tgt_lang}.json"
-        src_text_file = f"/export/b08/nbafna1/projects/llm-robustness-to-xlingual-noise/datasets/{iso3_to_iso2[src_lang]}/mmlu_{iso3_to_iso2[src_lang]}.txt"
-        
-        post = Posterior(src_lang, bil_lexicon_json_file, src_text_file)
-        # print(f"LANGUAGES: {src_lang} -> {tgt_lang}")
-        print("Lexical noiser: (functional, content)")
-        theta_f, theta_c =  post.post_lexical_noiser()
-        print(round(theta_c, 2))
-        print(round(theta_f, 2))
-        print("Morphological noiser:")
-        theta_morph = post.post_morphological_noiser()
-        print("Phonological noiser:")
-        theta_phon = post.post_phonological_noiser()
-        print(f"Theta content: {round(theta_c, 2)}")
-        print(f"Theta func: {round(theta_f, 2)}")
-        print(f"Theta morph: {round(theta_morph, 2)}")
-        print(f"Theta phon: {round(theta_phon, 2)}")
-        print("\n\n\n")
-        # print(tgt_lang)
-        posteriors[src_lang][tgt_lang] = (round(theta_f, 2), round(theta_c, 2), \
-                                          round(theta_morph, 2), round(theta_phon, 2)) 
-
-
-# Print all 
-for src_lang in posteriors:
-    print(f"Source language: {src_lang}")
-    print(f"theta_f")
-    for tgt_lang in sorted(posteriors[src_lang]):
-        # print(f"Source language: {src_lang}, Target language: {tgt_lang}")
-        print(posteriors[src_lang][tgt_lang][0])
-
-    print(f"theta_c")
-    for tgt_lang in sorted(posteriors[src_lang]):
-        # print(f"Source language: {src_lang}, Target language: {tgt_lang}")
-        print(posteriors[src_lang][tgt_lang][1])
-
-    print(f"theta_morph")
-    for tgt_lang in sorted(posteriors[src_lang]):
-        # print(f"Source language: {src_lang}, Target language: {tgt_lang}")
-        print(posteriors[src_lang][tgt_lang][2])
-    
-    print(f"theta_phon")
-    for tgt_lang in sorted(posteriors[src_lang]):
-        # print(f"Source language: {src_lang}, Target language: {tgt_lang}")
-        print(posteriors[src_lang][tgt_lang][3])
\ No newline at end of file
+        for tgt_lang in sorted(related_lrls[src_lang]):
+            if args.tgt_langs is not None and tgt_lang not in args.tgt_langs:
+                continue
+            pairs.append((src_lang, tgt_lang))
+
+    posteriors = estimate_all_posteriors(pairs, num_workers = args.num_workers, num_bootstrap = args.num_bootstrap, alpha = args.alpha)
+    print_posteriors(posteriors)
+    if args.output_file is not None:
+        write_posteriors(posteriors, args.output_file)
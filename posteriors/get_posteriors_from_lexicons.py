@@ -19,6 +19,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.append("../")
 from noisers.utils.get_functional_words import OUTDIR, closed_class_tags
 from noisers.utils.get_functional_words import output_paths as ud_wordlists_paths
+from noisers.utils.get_functional_words import get_functional_word_index
 
 from get_lexicons import json_to_list_of_pairs
 
@@ -38,20 +39,11 @@ class Posterior:
         self.bil_lexicon = bil_lexicon
         self.src_vocab = src_vocab
         self.tgt_vocab = tgt_vocab
-        self.tag2wordlist = self.get_tag2wordlist()
-
-    def get_tag2wordlist(self):
-        '''Get tag2wordlist from the JSON file'''
-        with open(ud_wordlists_paths[self.lang]) as f:
-            tag2wordlist = json.load(f)
-        return tag2wordlist
+        self.functional_words, self.word2tag = get_functional_word_index(self.lang)
 
     def is_word_functional(self, word):
         '''Check if word is functional'''
-        for tag in self.tag2wordlist:
-            if word in self.tag2wordlist[tag]:
-                return True
-        return False
+        return word in self.functional_words
 
     def post_lexical_noiser(self):
         '''
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The posterior modules import each other as top-level modules (e.g. from alignment import
+# AlignmentEngine), like they do when run from posteriors/
+POSTERIORS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, POSTERIORS_DIR)
+sys.path.insert(0, os.path.dirname(POSTERIORS_DIR))
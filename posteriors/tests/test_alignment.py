@@ -0,0 +1,76 @@
+import random
+
+import pytest
+
+from alignment import AlignmentEngine, WORD_BITS
+
+
+def reference_edit_distance(src, tgt):
+    '''Textbook Levenshtein DP'''
+    prev = list(range(len(tgt) + 1))
+    for i in range(1, len(src) + 1):
+        row = [i] + [0] * len(tgt)
+        for j in range(1, len(tgt) + 1):
+            row[j] = min(prev[j] + 1, row[j-1] + 1, prev[j-1] + (src[i-1] != tgt[j-1]))
+        prev = row
+    return prev[-1]
+
+def random_pairs(alphabet, num_pairs, max_length, seed = 0):
+    rng = random.Random(seed)
+    def word():
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+    pairs = [(word(), word()) for _ in range(num_pairs)]
+    # Related pairs, like the pairs of a lexicon
+    for src, _ in pairs[:num_pairs // 2]:
+        tgt = list(src)
+        for i in range(len(tgt)):
+            if rng.random() < 0.2:
+                tgt[i] = rng.choice(alphabet)
+        pairs.append((src, "".join(tgt)))
+    return pairs
+
+EDGE_CASES = [("", ""), ("", "abc"), ("abc", ""), ("a", "a"), ("a", "b"), ("ab", "ba"), \
+              ("kitten", "sitting"), ("नमस्ते", "नमस्कार"), ("straße", "strasse"), ("مرحبا", "مرحب"), \
+              ("a" * WORD_BITS, "a" * (WORD_BITS - 1) + "b"), ("ab" * WORD_BITS, "ba" * WORD_BITS), \
+              ("x" * (WORD_BITS + 1), "y"), ("y", "x" * (WORD_BITS + 1))]
+
+ASCII_PAIRS = random_pairs("abcde", 300, 12)
+UNICODE_PAIRS = random_pairs("aäeéनमस्तेкот", 300, 12, seed = 1)
+LONG_PAIRS = random_pairs("ab", 50, 2 * WORD_BITS, seed = 2)
+
+
+@pytest.mark.parametrize("pairs", [EDGE_CASES, ASCII_PAIRS, UNICODE_PAIRS, LONG_PAIRS])
+def test_edit_distance_matches_reference(pairs):
+    aligner = AlignmentEngine()
+    for src, tgt in pairs:
+        expected = reference_edit_distance(src, tgt)
+        assert AlignmentEngine._edit_distance(src, tgt) == expected
+        assert aligner.edit_distance(src, tgt) == expected
+        if src or tgt:
+            assert aligner.ned(src, tgt) == expected / max(len(src), len(tgt))
+
+@pytest.mark.parametrize("pairs", [EDGE_CASES, ASCII_PAIRS, UNICODE_PAIRS, LONG_PAIRS])
+def test_ned_batch_matches_reference(pairs):
+    # The empty pair has no NED
+    pairs = [(src, tgt) for src, tgt in pairs if src or tgt]
+    neds = AlignmentEngine().ned_batch(pairs)
+    expected = [reference_edit_distance(src, tgt) / max(len(src), len(tgt)) for src, tgt in pairs]
+    assert list(neds) == expected
+
+def test_ops_cost_matches_distance():
+    aligner = AlignmentEngine()
+    for src, tgt in ASCII_PAIRS + UNICODE_PAIRS:
+        ops = aligner.ops(src, tgt)
+        assert len(ops) == reference_edit_distance(src, tgt)
+        for src_pos, tgt_pos, op in ops:
+            if op == "replace":
+                assert src[src_pos] != tgt[tgt_pos]
+
+def test_align_batch_threshold():
+    pairs = [(src, tgt) for src, tgt in UNICODE_PAIRS if src or tgt]
+    neds, all_ops = AlignmentEngine().align_batch(pairs, threshold = 0.4)
+    for (src, tgt), ned, ops in zip(pairs, neds, all_ops):
+        if ned > 0.4:
+            assert ops is None
+        else:
+            assert ops == AlignmentEngine().ops(src, tgt)